@@ -76,6 +76,29 @@ DATABASES = {
     }
 }
 
+# --------------------------------------------------
+# Cache
+# --------------------------------------------------
+# Cache fichier par défaut : partagé entre les workers gunicorn d'une même
+# machine, pour que l'invalidation des indicateurs du tableau de bord soit
+# vue par tous les processus.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / 'tmp' / 'cache')),
+    }
+}
+
+# Durée de vie max (secondes) d'un instantané des indicateurs du dashboard
+DASHBOARD_METRICS_CACHE_TIMEOUT = int(os.environ.get('DASHBOARD_METRICS_CACHE_TIMEOUT', 300))
+
+# Factures PDF : cache disque et pool de processus de rendu (core/pdf.py)
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', str(BASE_DIR / 'tmp' / 'pdf'))
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', 2))
+PDF_WAIT_SECONDS = int(os.environ.get('PDF_WAIT_SECONDS', 15))
+# Polices TrueType embarquées dans les PDF, ex. {'DejaVuSans': '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'}
+PDF_FONTS = {}
+
 # --------------------------------------------------
 # Authentication
 # --------------------------------------------------
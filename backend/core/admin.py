@@ -4,7 +4,7 @@ from .models import (
     Employee, OuvrierDetails, ChefChantierDetails,
     Affectation, Presence, Chantier, RapportChantier
 )
-from .models import Personnel, PersonnelPayment, FactureActionLog
+from .models import Personnel, PersonnelPayment, PayrollRun, MonthlyPayroll, ChantierCostMonth, MonthlyFinanceSummary, StockMovement, FactureActionLog, FactureSequence
 
 
 class FactureLineInline(admin.TabularInline):
@@ -82,8 +82,43 @@ class PersonnelPaymentAdmin(admin.ModelAdmin):
     date_hierarchy = 'date'
 
 
+@admin.register(PayrollRun)
+class PayrollRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'periode', 'chantier', 'nb_paiements', 'montant_total', 'statut', 'created_by', 'created_at')
+    list_filter = ('statut', 'periode')
+
+
+@admin.register(MonthlyPayroll)
+class MonthlyPayrollAdmin(admin.ModelAdmin):
+    list_display = ('personnel', 'periode', 'jours_travailles', 'salaire_base', 'prime', 'montant_du', 'updated_at')
+    list_filter = ('periode',)
+
+
+@admin.register(ChantierCostMonth)
+class ChantierCostMonthAdmin(admin.ModelAdmin):
+    list_display = ('chantier', 'periode', 'main_oeuvre', 'jours_homme', 'materiaux', 'facture', 'updated_at')
+    list_filter = ('periode',)
+
+
+@admin.register(MonthlyFinanceSummary)
+class MonthlyFinanceSummaryAdmin(admin.ModelAdmin):
+    list_display = ('periode', 'client', 'chantier', 'facture', 'encaisse', 'paie', 'reste_du', 'updated_at')
+    list_filter = ('periode',)
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('materiau', 'type', 'quantite', 'chantier', 'commande', 'date', 'created_by')
+    list_filter = ('type', 'date')
+
+
 @admin.register(FactureActionLog)
 class FactureActionLogAdmin(admin.ModelAdmin):
     list_display = ('id', 'facture', 'action', 'user', 'created_at')
     list_filter = ('action', 'created_at')
     search_fields = ('facture__numero', 'user__username')
+
+
+@admin.register(FactureSequence)
+class FactureSequenceAdmin(admin.ModelAdmin):
+    list_display = ('year', 'last_number')
@@ -0,0 +1,574 @@
+"""Couche commune des endpoints JSON `api_*`.
+
+Chaque endpoint décrit sa ressource (`ApiResource`) : champs sérialisables,
+filtres autorisés et tris possibles. `api_list_response` applique ensuite
+les mêmes règles partout :
+
+- pagination par curseur (keyset) : `?limit=` et `?cursor=` (valeur `next`
+  de la page précédente) ;
+- sous-ensemble de champs : `?fields=id,nom,statut` ;
+- filtres côté serveur : `?statut=`, `?date_from=` / `?date_to=`,
+  `?chantier=`, `?auteur=`… selon la ressource ;
+- recherche par préfixe : `?q=` sur les champs `search` de la ressource ;
+- tri : `?ordering=-created_at`.
+
+La réponse garde la forme historique `{"<ressource>": [...]}` et ajoute
+`next` (curseur de la page suivante, ou null).
+
+Les réponses sont encodées avec `orjson` lorsqu'il est installé (sinon le
+`json` standard via `JsonResponse`).
+
+`conditional(*models)` ajoute le GET conditionnel (ETag) : le validateur
+vient de `max(updated_at)` et du nombre de lignes des tables concernées, si
+bien qu'une collection inchangée répond 304 sans rien sérialiser.
+`require_role(*roles)`, placé avant lui, refuse l'accès (403) avant tout
+calcul de validateur.
+"""
+import base64
+import hashlib
+import json
+from collections import defaultdict
+from decimal import Decimal
+from functools import wraps
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, DateTimeField, Max, Q
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils import dateparse
+from django.views.decorators.http import condition
+
+from .models import Facture, FactureLine
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 1000
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def iso(value):
+    return value.isoformat() if value else None
+
+
+def number(value):
+    return float(value) if value is not None else None
+
+
+# Conversion des paramètres (GET ou corps JSON) : toute valeur invalide, quel
+# que soit son type, lève ApiError (réponse 400)
+
+def parse_int(value):
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ApiError(f'Valeur entière attendue : {value!r}')
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(f'Valeur entière attendue : {value!r}')
+
+
+def parse_date(value):
+    parsed = None
+    if isinstance(value, str):
+        try:
+            parsed = dateparse.parse_date(value)
+        except ValueError:
+            parsed = None
+    if parsed is None:
+        raise ApiError(f'Date invalide (AAAA-MM-JJ attendu) : {value!r}')
+    return parsed
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if not isinstance(value, str):
+        raise ApiError(f'Booléen attendu : {value!r}')
+    return value.lower() in ('1', 'true', 'yes', 'oui')
+
+
+class ApiResource:
+    """Description déclarative d'une liste exposée en JSON.
+
+    `fields` associe chaque clé JSON à une fonction `obj -> valeur`.
+    `filters` associe un paramètre GET à un lookup ORM (et optionnellement
+    une fonction de conversion). `date_field` est le champ utilisé par
+    `date_from` / `date_to`. `orderings` liste les champs triables : ils
+    doivent être non nuls pour que la pagination par curseur reste exacte.
+    `prefetch` associe un champ aux relations à précharger lorsqu'il est
+    demandé. `search` liste les champs interrogés par préfixe avec `?q=`.
+    """
+
+    def __init__(self, key, fields, filters=None, date_field='created_at', orderings=('created_at', 'id'), default_ordering='-created_at', prefetch=None, search=(), default_limit=DEFAULT_LIMIT):
+        self.key = key
+        self.fields = fields
+        self.filters = filters or {}
+        self.search = search
+        self.default_limit = default_limit
+        self.prefetch = prefetch or {}
+        self.date_field = date_field
+        self.orderings = orderings
+        self.default_ordering = default_ordering
+
+    # -- paramètres ---------------------------------------------------------
+
+    def selected_fields(self, request):
+        raw = request.GET.get('fields')
+        if not raw:
+            return list(self.fields)
+        names = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f"Champs inconnus : {', '.join(unknown)}")
+        return names
+
+    def ordering(self, request):
+        ordering = request.GET.get('ordering') or self.default_ordering
+        if ordering.lstrip('-') not in self.orderings:
+            raise ApiError(f"Tri non supporté : {ordering!r}")
+        return ordering
+
+    def limit(self, request):
+        raw = request.GET.get('limit')
+        if not raw:
+            return self.default_limit
+        return max(1, min(parse_int(raw), MAX_LIMIT))
+
+    def apply_filters(self, request, queryset):
+        for param, spec in self.filters.items():
+            value = request.GET.get(param)
+            if value in (None, ''):
+                continue
+            lookup, convert = spec if isinstance(spec, tuple) else (spec, None)
+            queryset = queryset.filter(**{lookup: convert(value) if convert else value})
+        term = (request.GET.get('q') or '').strip()
+        if term and self.search:
+            match = Q()
+            for name in self.search:
+                match |= Q(**{f'{name}__istartswith': term})
+            queryset = queryset.filter(match)
+        date_from = request.GET.get('date_from')
+        if date_from:
+            queryset = queryset.filter(**{f'{self.date_field}__gte': parse_date(date_from)})
+        date_to = request.GET.get('date_to')
+        if date_to:
+            queryset = queryset.filter(**{f'{self.date_field}__lte': parse_date(date_to)})
+        return queryset
+
+    # -- pagination par curseur ---------------------------------------------
+
+    def cursor_values(self, obj, name):
+        return getattr(obj, name), obj.pk
+
+    def encode_cursor(self, ordering, obj):
+        value, pk = self.cursor_values(obj, ordering.lstrip('-'))
+        # isoformat complet : DjangoJSONEncoder tronque les datetimes à la
+        # milliseconde, et la comparaison du curseur ne serait plus exacte
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        payload = json.dumps([ordering, value, pk])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, queryset, ordering, cursor):
+        try:
+            cursor_ordering, value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except Exception:
+            raise ApiError('Curseur invalide')
+        if cursor_ordering != ordering:
+            raise ApiError('Curseur obtenu avec un autre tri')
+        field = queryset.model._meta.get_field(ordering.lstrip('-'))
+        try:
+            if isinstance(field, DateTimeField):
+                value = dateparse.parse_datetime(value)
+                if value is None:
+                    raise ValidationError('datetime')
+            else:
+                value = field.to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            raise ApiError('Curseur invalide')
+        return value, pk
+
+    def rows(self, queryset, names, ordering):
+        return queryset
+
+    def paginate(self, request, queryset, names):
+        ordering = self.ordering(request)
+        name = ordering.lstrip('-')
+        descending = ordering.startswith('-')
+        op = 'lt' if descending else 'gt'
+        tiebreak = '-pk' if descending else 'pk'
+        queryset = queryset.order_by(ordering) if name in ('id', 'pk') else queryset.order_by(ordering, tiebreak)
+
+        cursor = request.GET.get('cursor')
+        if cursor:
+            value, pk = self.decode_cursor(queryset, ordering, cursor)
+            if name in ('id', 'pk'):
+                queryset = queryset.filter(**{f'pk__{op}': value})
+            else:
+                queryset = queryset.filter(Q(**{f'{name}__{op}': value}) | Q(**{name: value, f'pk__{op}': pk}))
+
+        limit = self.limit(request)
+        rows = list(self.rows(queryset, names, ordering)[:limit + 1])
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self.encode_cursor(ordering, rows[-1])
+        return rows, next_cursor
+
+    # -- sérialisation ------------------------------------------------------
+
+    def serialize(self, obj, names):
+        return {name: self.fields[name](obj) for name in names}
+
+    def serialize_page(self, rows, names):
+        return [self.serialize(obj, names) for obj in rows]
+
+
+class ValuesApiResource(ApiResource):
+    """Variante sans instanciation de modèles, bâtie sur `.values()`.
+
+    `fields` associe chaque clé JSON à `(colonnes, fonction(row) -> valeur)` :
+    seules les colonnes des champs demandés sont lues. `batches` associe un
+    champ à un chargeur `ids -> {id: valeur}` appelé une fois par page (par
+    exemple les lignes d'une facture, groupées en une seule requête).
+    """
+
+    def __init__(self, key, fields, batches=None, **kwargs):
+        super().__init__(key, fields, **kwargs)
+        self.batches = batches or {}
+
+    def rows(self, queryset, names, ordering):
+        columns = {'pk', ordering.lstrip('-')}
+        for name in names:
+            if name not in self.batches:
+                columns.update(self.fields[name][0])
+        return queryset.values(*columns)
+
+    def cursor_values(self, row, name):
+        return row[name], row['pk']
+
+    def serialize_page(self, rows, names):
+        ids = [row['pk'] for row in rows]
+        loaded = {name: self.batches[name](ids) for name in names if name in self.batches}
+        data = []
+        for row in rows:
+            item = {}
+            for name in names:
+                if name in loaded:
+                    item[name] = loaded[name].get(row['pk'], [])
+                else:
+                    item[name] = self.fields[name][1](row)
+            data.append(item)
+        return data
+
+
+def _orjson_default(value):
+    if isinstance(value, Decimal):
+        # même rendu que DjangoJSONEncoder
+        return str(value)
+    raise TypeError
+
+
+def json_response(data, status=200):
+    if orjson is not None:
+        return HttpResponse(orjson.dumps(data, default=_orjson_default), status=status, content_type='application/json')
+    return JsonResponse(data, status=status)
+
+
+def api_list_response(request, resource, queryset):
+    """Réponse JSON paginée/filtrée pour `resource` à partir de `queryset`."""
+    try:
+        names = resource.selected_fields(request)
+        queryset = resource.apply_filters(request, queryset)
+        lookups = [resource.prefetch[name] for name in names if name in resource.prefetch]
+        if lookups:
+            queryset = queryset.prefetch_related(*lookups)
+        rows, next_cursor = resource.paginate(request, queryset, names)
+    except ApiError as e:
+        return JsonResponse({'error': e.message}, status=e.status)
+    return json_response({
+        resource.key: resource.serialize_page(rows, names),
+        'next': next_cursor,
+    })
+
+
+# ---------------------------------------------------------------------------
+# GET conditionnel
+# ---------------------------------------------------------------------------
+
+def _change_marker(model):
+    field_names = {field.name for field in model._meta.get_fields()}
+    return 'updated_at' if 'updated_at' in field_names else 'created_at'
+
+
+def table_states(request, models):
+    """(modèle, nombre de lignes, dernière modification) pour chaque table.
+
+    Calculé une seule fois par requête (mis en cache sur `request`).
+    """
+    cache = request.__dict__.setdefault('_api_table_states', {})
+    key = tuple(model._meta.label for model in models)
+    if key not in cache:
+        states = []
+        for model in models:
+            agg = model.objects.aggregate(n=Count('pk'), last=Max(_change_marker(model)))
+            states.append((model._meta.label, agg['n'], agg['last']))
+        cache[key] = states
+    return cache[key]
+
+
+def require_role(*roles):
+    """Décorateur : 403 JSON si le rôle de l'utilisateur n'est pas dans `roles`.
+
+    À placer au-dessus de `conditional` : un utilisateur refusé ne reçoit ni
+    ETag ni 304.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            profile = getattr(request.user, 'userprofile', None)
+            if not profile or profile.role not in roles:
+                return JsonResponse({'error': 'forbidden'}, status=403)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def conditional(*models):
+    """Décorateur : ETag dérivé de l'état des tables `models`.
+
+    L'ETag couvre aussi la requête complète (filtres, champs, curseur), le
+    rôle de l'utilisateur (certaines listes en dépendent) et le jour courant
+    (les indicateurs "du mois" en dépendent). Pas de Last-Modified : une
+    suppression ne fait pas avancer `max(updated_at)` et un client qui
+    n'enverrait que If-Modified-Since recevrait un 304 périmé ; seul l'ETag
+    tient compte du nombre de lignes.
+    """
+    def etag(request, *args, **kwargs):
+        role = getattr(getattr(request.user, 'userprofile', None), 'role', None)
+        parts = [request.get_full_path(), str(role), timezone.localdate().isoformat()]
+        for label, count, last in table_states(request, models):
+            parts.append(f"{label}:{count}:{last.isoformat() if last else ''}")
+        return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+    return condition(etag_func=etag)
+
+
+# ---------------------------------------------------------------------------
+# Ressources
+# ---------------------------------------------------------------------------
+
+CHANTIERS = ApiResource(
+    'chantiers',
+    fields={
+        'id': lambda c: c.id,
+        'nom': lambda c: c.nom,
+        'client': lambda c: {'id': c.client.id, 'nom': c.client.nom},
+        'description': lambda c: c.description,
+        'date_debut': lambda c: iso(c.date_debut),
+        'date_fin_prevue': lambda c: iso(c.date_fin_prevue),
+        'date_fin_reelle': lambda c: iso(c.date_fin_reelle),
+        'budget': lambda c: number(c.budget),
+        'statut': lambda c: c.statut,
+        'statut_display': lambda c: c.get_statut_display(),
+        'avancement': lambda c: c.avancement,
+        'chef_chantier': lambda c: {
+            'id': c.chef_chantier.id,
+            'nom': c.chef_chantier.get_full_name(),
+        } if c.chef_chantier else None,
+        'created_at': lambda c: iso(c.created_at),
+    },
+    filters={
+        'statut': 'statut',
+        'client': ('client_id', parse_int),
+        'chef': ('chef_chantier_id', parse_int),
+    },
+    date_field='date_debut',
+    orderings=('created_at', 'id', 'nom', 'date_debut', 'date_fin_prevue', 'budget', 'avancement', 'updated_at'),
+)
+
+PERSONNEL = ApiResource(
+    'personnel',
+    fields={
+        'id': lambda p: p.id,
+        'user': lambda p: {
+            'id': p.user.id,
+            'username': p.user.username,
+            'full_name': p.user.get_full_name(),
+            'email': p.user.email,
+        },
+        'role': lambda p: p.role,
+        'role_display': lambda p: p.get_role_display(),
+        'taux_horaire': lambda p: number(p.taux_journalier),
+        'telephone': lambda p: p.telephone,
+        'adresse': lambda p: p.adresse,
+        'date_embauche': lambda p: iso(p.date_embauche),
+        'chantier_actuel': lambda p: {
+            'id': p.chantier_actuel.id,
+            'nom': p.chantier_actuel.nom,
+        } if p.chantier_actuel else None,
+        'est_actif': lambda p: p.est_actif,
+        'created_at': lambda p: iso(p.created_at),
+    },
+    filters={
+        'role': 'role',
+        'chantier': ('chantier_actuel_id', parse_int),
+        'est_actif': ('est_actif', parse_bool),
+    },
+    date_field='date_embauche',
+    orderings=('created_at', 'id', 'date_embauche'),
+)
+
+MATERIAUX = ApiResource(
+    'materiaux',
+    fields={
+        'id': lambda m: m.id,
+        'nom': lambda m: m.nom,
+        'categorie': lambda m: m.categorie,
+        'categorie_display': lambda m: m.get_categorie_display(),
+        'description': lambda m: m.description,
+        'unite': lambda m: m.unite,
+        'quantite_stock': lambda m: m.quantite_stock,
+        'seuil_minimum': lambda m: m.seuil_minimum,
+        'prix_unitaire': lambda m: number(m.prix_unitaire),
+        'fournisseur': lambda m: {
+            'id': m.fournisseur.id,
+            'nom': m.fournisseur.nom,
+        } if m.fournisseur else None,
+        'est_en_rupture': lambda m: m.est_en_rupture,
+        'created_at': lambda m: iso(m.created_at),
+        'updated_at': lambda m: iso(m.updated_at),
+    },
+    filters={
+        'categorie': 'categorie',
+        'fournisseur': ('fournisseur_id', parse_int),
+    },
+    orderings=('created_at', 'id', 'nom', 'quantite_stock', 'updated_at'),
+)
+
+FOURNISSEURS = ApiResource(
+    'fournisseurs',
+    fields={
+        'id': lambda f: f.id,
+        'nom': lambda f: f.nom,
+        'contact': lambda f: f.contact,
+        'telephone': lambda f: f.telephone,
+        'email': lambda f: f.email,
+        'adresse': lambda f: f.adresse,
+        'specialite': lambda f: f.specialite,
+        'created_at': lambda f: iso(f.created_at),
+    },
+    orderings=('created_at', 'id', 'nom'),
+)
+
+CLIENTS = ApiResource(
+    'clients',
+    fields={
+        'id': lambda c: c.id,
+        'nom': lambda c: c.nom,
+        'contact': lambda c: c.contact,
+        'telephone': lambda c: c.telephone,
+        'email': lambda c: c.email,
+        'adresse': lambda c: c.adresse,
+        'created_at': lambda c: iso(c.created_at),
+    },
+    orderings=('created_at', 'id', 'nom'),
+)
+
+FACTURE_STATUTS = dict(Facture._meta.get_field('statut').choices)
+
+
+def lignes_by_facture(ids):
+    """Lignes des factures `ids`, groupées par facture en une requête."""
+    grouped = defaultdict(list)
+    values = FactureLine.objects.filter(facture_id__in=ids).order_by('pk').values_list(
+        'facture_id', 'id', 'description', 'quantite', 'prix_unitaire', 'montant',
+    )
+    for facture_id, pk, description, quantite, prix_unitaire, montant in values:
+        grouped[facture_id].append({
+            'id': pk,
+            'description': description,
+            'quantite': quantite,
+            'prix_unitaire': number(prix_unitaire),
+            'montant': number(montant),
+        })
+    return grouped
+
+
+FACTURES = ValuesApiResource(
+    'factures',
+    fields={
+        'id': (('id',), lambda r: r['id']),
+        'numero': (('numero',), lambda r: r['numero']),
+        'client': (('client_id', 'client__nom'), lambda r: {'id': r['client_id'], 'nom': r['client__nom']}),
+        'date': (('date',), lambda r: iso(r['date'])),
+        'date_echeance': (('date_echeance',), lambda r: iso(r['date_echeance'])),
+        'total': (('total',), lambda r: number(r['total'])),
+        'statut': (('statut',), lambda r: r['statut']),
+        'statut_display': (('statut',), lambda r: FACTURE_STATUTS.get(r['statut'], r['statut'])),
+        'notes': (('notes',), lambda r: r['notes']),
+        'lignes': ((), None),
+        'created_at': (('created_at',), lambda r: iso(r['created_at'])),
+    },
+    batches={'lignes': lignes_by_facture},
+    filters={
+        'statut': 'statut',
+        'client': ('client_id', parse_int),
+        'chantier': ('chantier_id', parse_int),
+    },
+    search=('numero', 'client__nom'),
+    date_field='date',
+    orderings=('created_at', 'id', 'date', 'total'),
+)
+
+# Page HTML des factures (FactureListView) : mêmes filtres, tri et curseur
+# que l'API, sur des instances
+FACTURE_LIST = ApiResource(
+    'factures',
+    fields={},
+    filters=FACTURES.filters,
+    search=FACTURES.search,
+    date_field=FACTURES.date_field,
+    orderings=FACTURES.orderings,
+    default_limit=50,
+)
+
+RAPPORTS = ApiResource(
+    'rapports',
+    fields={
+        'id': lambda r: r.id,
+        'titre': lambda r: r.titre,
+        'type_rapport': lambda r: r.type_rapport,
+        'type_display': lambda r: r.get_type_rapport_display(),
+        'chantier': lambda r: {
+            'id': r.chantier.id,
+            'nom': r.chantier.nom,
+        } if r.chantier else None,
+        'auteur': lambda r: {
+            'id': r.auteur.id,
+            'full_name': r.auteur.get_full_name(),
+        },
+        'date': lambda r: iso(r.date),
+        'contenu': lambda r: r.contenu,
+        'created_at': lambda r: iso(r.created_at),
+    },
+    filters={
+        'type': 'type_rapport',
+        'chantier': ('chantier_id', parse_int),
+        'auteur': ('auteur_id', parse_int),
+    },
+    date_field='date',
+    orderings=('created_at', 'id', 'date'),
+)
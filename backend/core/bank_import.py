@@ -0,0 +1,325 @@
+"""Import des relevés bancaires (CSV / OFX) et rapprochement avec les factures.
+
+Le relevé est lu au fil de l'eau (générateurs `parse_csv` / `parse_ofx`),
+par lots de `IMPORT_BATCH_SIZE` lignes. Pour chaque lot :
+
+- les numéros de facture (`AAAA-FAC-NNN`) trouvés dans les libellés sont
+  cherchés en une requête parmi les factures ouvertes ;
+- un crédit est rapproché si son montant ne dépasse pas le reste à payer
+  (paiement total ou partiel) ; les doublons d'un import précédent sont
+  ignorés : même identifiant bancaire (FITID, colonne id) quand le relevé en
+  donne un, sinon même facture, date, montant et référence ;
+- les `Payment` sont créés par `bulk_create`.
+
+Tout l'import tient dans une transaction. `bulk_create` ne déclenche pas
+les signaux : les soldes dénormalisés, les statuts `payee`, le journal des
+actions, la synthèse financière, le cache du tableau de bord et les PDF
+sont mis à jour ici, en quelques requêtes ensemblistes.
+"""
+import csv
+import dataclasses
+import datetime
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import finance, pdf
+from .facturation import money, refresh_payment_totals
+from .metrics import invalidate_dashboard_metrics
+from .models import Facture, FactureActionLog, Payment
+
+
+IMPORT_BATCH_SIZE = 1000
+
+# Nombre de lignes non rapprochées conservées pour le compte rendu
+MAX_REPORTED = 200
+
+NUMERO_RE = re.compile(r'\b(\d{4})\s*-?\s*FAC\s*-?\s*(\d+)\b', re.IGNORECASE)
+
+# En-têtes CSV reconnus (minuscules, sans accents)
+CSV_COLUMNS = {
+    'date': ('date', 'date operation', 'date valeur', 'date_operation'),
+    'montant': ('montant', 'credit', 'amount', 'montant credit'),
+    'reference': ('reference', 'libelle', 'description', 'memo', 'motif'),
+    'id': ('id', 'fitid', 'identifiant'),
+}
+
+
+class StatementError(ValueError):
+    """Relevé illisible (message affichable à l'utilisateur)."""
+
+
+@dataclasses.dataclass
+class StatementLine:
+    date: datetime.date
+    montant: Decimal
+    reference: str
+    bank_id: str = ''
+
+
+@dataclasses.dataclass
+class ImportReport:
+    lines: int = 0
+    debits: int = 0
+    created: int = 0
+    duplicates: int = 0
+    montant: Decimal = Decimal(0)
+    factures: int = 0
+    factures_payees: int = 0
+    unmatched: list = dataclasses.field(default_factory=list)
+    unmatched_count: int = 0
+    dry_run: bool = False
+
+    def skip(self, line, reason):
+        self.unmatched_count += 1
+        if len(self.unmatched) < MAX_REPORTED:
+            self.unmatched.append((line, reason))
+
+
+# -- lecture --------------------------------------------------------------------
+
+def _amount(raw):
+    text = (raw or '').strip().replace(' ', '').replace(' ', '')
+    if ',' in text and '.' in text:
+        text = text.replace('.', '').replace(',', '.') if text.rfind(',') > text.rfind('.') else text.replace(',', '')
+    else:
+        text = text.replace(',', '.')
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        raise StatementError(f'Montant illisible : {raw!r}')
+
+
+def _date(raw):
+    text = (raw or '').strip()
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%Y%m%d'):
+        try:
+            return datetime.datetime.strptime(text[:10] if fmt != '%Y%m%d' else text[:8], fmt).date()
+        except ValueError:
+            continue
+    raise StatementError(f'Date illisible : {raw!r}')
+
+
+def _normalize(header):
+    header = (header or '').strip().lower()
+    for accented, plain in (('é', 'e'), ('è', 'e'), ('ê', 'e'), ('à', 'a'), ('ô', 'o')):
+        header = header.replace(accented, plain)
+    return header
+
+
+def parse_csv(stream):
+    """Lignes d'un relevé CSV (séparateur `;` ou `,`, en-tête obligatoire)."""
+    first = stream.readline()
+    if not first:
+        return
+    delimiter = ';' if first.count(';') >= first.count(',') else ','
+    header = [_normalize(h) for h in next(csv.reader([first], delimiter=delimiter))]
+    columns = {}
+    for name, aliases in CSV_COLUMNS.items():
+        for index, title in enumerate(header):
+            if title in aliases:
+                columns[name] = index
+                break
+    missing = [name for name in ('date', 'montant', 'reference') if name not in columns]
+    if missing:
+        raise StatementError(f"Colonnes manquantes dans le relevé : {', '.join(missing)}")
+
+    for number, row in enumerate(csv.reader(stream, delimiter=delimiter), start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        try:
+            yield StatementLine(
+                date=_date(row[columns['date']]),
+                montant=_amount(row[columns['montant']]),
+                reference=row[columns['reference']].strip()[:200],
+                bank_id=row[columns['id']].strip() if 'id' in columns else '',
+            )
+        except IndexError:
+            raise StatementError(f'Ligne {number} : colonnes manquantes.')
+        except StatementError as e:
+            raise StatementError(f'Ligne {number} : {e}')
+
+
+OFX_TAG_RE = re.compile(r'<(/?)([A-Z0-9.]+)>([^<\r\n]*)')
+
+
+def parse_ofx(stream):
+    """Transactions `<STMTTRN>` d'un relevé OFX (SGML 1.x ou XML 2.x)."""
+    current = None
+    for raw_line in stream:
+        for closing, tag, value in OFX_TAG_RE.findall(raw_line):
+            if tag == 'STMTTRN':
+                if closing and current is not None:
+                    yield _ofx_line(current)
+                    current = None
+                elif not closing:
+                    current = {}
+            elif current is not None and not closing:
+                current[tag] = value.strip()
+    if current:
+        yield _ofx_line(current)
+
+
+def _ofx_line(fields):
+    if 'DTPOSTED' not in fields or 'TRNAMT' not in fields:
+        raise StatementError('Transaction OFX incomplète (DTPOSTED / TRNAMT).')
+    reference = ' '.join(part for part in (fields.get('NAME', ''), fields.get('MEMO', '')) if part)
+    return StatementLine(
+        date=_date(fields['DTPOSTED']),
+        montant=_amount(fields['TRNAMT']),
+        reference=reference[:200],
+        bank_id=fields.get('FITID', ''),
+    )
+
+
+def parse_statement(stream, fmt='auto', name=''):
+    if fmt == 'auto':
+        fmt = 'ofx' if name.lower().endswith(('.ofx', '.qfx')) else 'csv'
+    return parse_ofx(stream) if fmt == 'ofx' else parse_csv(stream)
+
+
+def extract_numero(reference):
+    match = NUMERO_RE.search(reference or '')
+    if not match:
+        return None
+    year, number = match.groups()
+    return f'{year}-FAC-{number.zfill(3)}'
+
+
+def _batches(lines, size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# -- rapprochement --------------------------------------------------------------
+
+def import_statement(lines, user=None, dry_run=False, mode='virement'):
+    """Rapprocher les lignes du relevé et créer les paiements (une transaction)."""
+    report = ImportReport(dry_run=dry_run)
+    touched = set()
+    try:
+        with transaction.atomic():
+            # reste à payer courant des factures déjà vues dans cet import
+            remaining = {}
+            for batch in _batches(lines, IMPORT_BATCH_SIZE):
+                _import_batch(batch, user, mode, report, remaining, touched)
+            if touched:
+                _finalize(touched, user, report)
+            if dry_run:
+                raise _DryRun()
+    except _DryRun:
+        pass
+    return report
+
+
+class _DryRun(Exception):
+    pass
+
+
+def _import_batch(batch, user, mode, report, remaining, touched):
+    numeros = {}
+    credits = []
+    for line in batch:
+        report.lines += 1
+        if line.montant <= 0:
+            report.debits += 1
+            continue
+        numero = extract_numero(line.reference)
+        if numero is None:
+            report.skip(line, 'aucun numéro de facture dans le libellé')
+            continue
+        numeros[numero] = None
+        credits.append((line, numero))
+    if not credits:
+        return
+
+    factures = {
+        numero: (pk, reste)
+        for pk, numero, reste in Facture.objects.filter(numero__in=list(numeros)).exclude(statut='annulee').values_list('pk', 'numero', 'reste_a_payer')
+    }
+    # paiements déjà importés (relevé rechargé) : même identifiant bancaire,
+    # ou même facture, date, montant, référence
+    existing = set()
+    bank_ids = set()
+    legacy = set()
+    ids = [pk for pk, _ in factures.values()]
+    if ids:
+        for pk, date, montant, reference, bank_id in Payment.objects.filter(
+            Q(date__in={line.date for line, _ in credits}, reference__in={line.reference for line, _ in credits})
+            | Q(bank_id__in={line.bank_id for line, _ in credits if line.bank_id}),
+            facture_id__in=ids,
+        ).values_list('facture_id', 'date', 'montant', 'reference', 'bank_id'):
+            existing.add((pk, date, montant, reference))
+            if bank_id:
+                bank_ids.add((pk, bank_id))
+            else:
+                # importé avant l'enregistrement des identifiants bancaires
+                legacy.add((pk, date, montant, reference))
+
+    payments = []
+    for line, numero in credits:
+        if numero not in factures:
+            report.skip(line, f'facture {numero} introuvable ou annulée')
+            continue
+        pk, reste = factures[numero]
+        montant = money(line.montant)
+        key = (pk, line.date, montant, line.reference)
+        if line.bank_id:
+            # deux opérations identiques du même jour restent distinctes
+            duplicate = (pk, line.bank_id) in bank_ids or key in legacy
+        else:
+            duplicate = key in existing
+        if duplicate:
+            report.duplicates += 1
+            continue
+        reste = remaining.get(pk, reste)
+        if montant > reste:
+            report.skip(line, f'montant supérieur au reste à payer de {numero} ({reste})')
+            continue
+        remaining[pk] = reste - montant
+        if line.bank_id:
+            bank_ids.add((pk, line.bank_id))
+        payments.append(Payment(
+            facture_id=pk, montant=montant, date=line.date, mode=mode,
+            reference=line.reference, bank_id=line.bank_id, created_by=user,
+        ))
+        report.created += 1
+        report.montant += montant
+        touched.add(pk)
+    Payment.objects.bulk_create(payments, batch_size=IMPORT_BATCH_SIZE)
+    finance.mark_months(*{payment.date for payment in payments})
+
+
+def _finalize(touched, user, report):
+    ids = list(touched)
+    report.factures = len(ids)
+    for start in range(0, len(ids), IMPORT_BATCH_SIZE):
+        refresh_payment_totals(ids[start:start + IMPORT_BATCH_SIZE])
+
+    paid_ids = []
+    for start in range(0, len(ids), IMPORT_BATCH_SIZE):
+        chunk = ids[start:start + IMPORT_BATCH_SIZE]
+        # reste dû des factures : mois de la facture dans la synthèse
+        finance.mark_months(*Facture.objects.filter(pk__in=chunk).values_list('date', flat=True).distinct())
+        paid_ids += list(Facture.objects.filter(pk__in=chunk, reste_a_payer__lte=0).exclude(Q(statut='payee') | Q(statut='annulee')).values_list('pk', flat=True))
+    for start in range(0, len(paid_ids), IMPORT_BATCH_SIZE):
+        Facture.objects.filter(pk__in=paid_ids[start:start + IMPORT_BATCH_SIZE]).update(statut='payee', updated_at=timezone.now())
+    report.factures_payees = len(paid_ids)
+
+    paid = set(paid_ids)
+    FactureActionLog.objects.bulk_create([
+        FactureActionLog(facture_id=pk, action='mark_paid' if pk in paid else 'partial_payment', user=user, note='Import relevé bancaire')
+        for pk in ids
+    ], batch_size=IMPORT_BATCH_SIZE)
+
+    transaction.on_commit(invalidate_dashboard_metrics)
+    transaction.on_commit(lambda: [pdf.purge(pk) for pk in ids])
@@ -0,0 +1,82 @@
+"""Exports CSV et ZIP en flux (`StreamingHttpResponse`).
+
+Les lignes (ou fichiers) sont produites par un générateur et écrites au fil
+de l'eau : ni la liste complète ni le fichier ne sont gardés en mémoire.
+"""
+import csv
+import zipfile
+
+from django.http import StreamingHttpResponse
+
+
+class Echo:
+    """Pseudo-fichier dont `write` renvoie la valeur au lieu de la stocker."""
+
+    def write(self, value):
+        return value
+
+
+def streaming_csv_response(filename, header, rows):
+    writer = csv.writer(Echo())
+
+    def stream():
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(stream(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+class ZipBuffer:
+    """Pseudo-fichier non positionnable : `zipfile` y écrit, `drain` vide."""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def streaming_zip_response(filename, entries, chunk_size=64 * 1024):
+    """Archive ZIP envoyée au fil de l'eau.
+
+    `entries` produit des couples `(nom, chemin du fichier à inclure)` ou
+    `(nom, bytes)`. Les fichiers sont stockés sans recompression.
+    """
+    def stream():
+        buffer = ZipBuffer()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for name, content in entries:
+                with archive.open(name, 'w') as target:
+                    if isinstance(content, bytes):
+                        target.write(content)
+                    else:
+                        with open(content, 'rb') as source:
+                            while True:
+                                chunk = source.read(chunk_size)
+                                if not chunk:
+                                    break
+                                target.write(chunk)
+                                yield buffer.drain()
+                yield buffer.drain()
+        yield buffer.drain()
+
+    response = StreamingHttpResponse(stream(), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
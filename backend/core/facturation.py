@@ -0,0 +1,188 @@
+"""Assemblage des factures : lignes, totaux et enregistrement.
+
+Les lignes envoyées par le formulaire (`lines_json`) sont validées en
+`Decimal`, les totaux (sous-total, TVA, total) calculés en mémoire, puis la
+facture et ses lignes sont enregistrées dans une seule transaction : une
+écriture de la facture et un `bulk_create` pour les lignes.
+
+En modification, les lignes soumises sont rapprochées des lignes existantes
+par `id` : seules les lignes modifiées sont réécrites (`bulk_update`), les
+nouvelles insérées et les lignes retirées supprimées. Les clés primaires des
+lignes inchangées restent donc stables.
+"""
+import json
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import Facture, FactureLine, FactureSequence, Payment
+
+
+CENTIMES = Decimal('0.01')
+
+# Champs d'une ligne modifiables depuis le formulaire de facture
+LINE_FIELDS = ('description', 'quantite', 'prix_unitaire', 'montant')
+
+
+def money(value):
+    """Arrondir un montant au centime (arrondi commercial)."""
+    return Decimal(value).quantize(CENTIMES, rounding=ROUND_HALF_UP)
+
+
+class FactureLinesError(ValueError):
+    """Lignes de facture invalides (message affichable à l'utilisateur)."""
+
+
+def _decimal(value, label, position, max_digits):
+    try:
+        number = money(str(value if value not in (None, '') else 0))
+        if not number.is_finite():
+            raise InvalidOperation
+    except (InvalidOperation, ValueError):
+        raise FactureLinesError(f"Ligne {position} : {label} invalide ({value!r}).")
+    if number < 0:
+        raise FactureLinesError(f"Ligne {position} : {label} ne peut pas être négatif.")
+    # borne imposée par le DecimalField (max_digits, 2 décimales)
+    if number >= Decimal(10) ** (max_digits - 2):
+        raise FactureLinesError(f"Ligne {position} : {label} trop élevé.")
+    return number
+
+
+def parse_lines(lines_json):
+    """Convertir `lines_json` en `FactureLine` non enregistrées (montant calculé).
+
+    Une ligne peut porter l'`id` d'une ligne existante : il est conservé pour
+    le rapprochement dans `sync_lines`.
+    """
+    try:
+        raw_lines = json.loads(lines_json)
+    except (TypeError, ValueError):
+        raise FactureLinesError("Lignes de facture illisibles.")
+    if not isinstance(raw_lines, list):
+        raise FactureLinesError("Lignes de facture illisibles.")
+
+    lines = []
+    for position, ln in enumerate(raw_lines, start=1):
+        if not isinstance(ln, dict):
+            raise FactureLinesError(f"Ligne {position} : format invalide.")
+        quantite = _decimal(ln.get('quantite'), 'quantité', position, 8)
+        prix_unitaire = _decimal(ln.get('pu') or ln.get('prix_unitaire'), 'prix unitaire', position, 10)
+        # le montant est toujours recalculé côté serveur (comme FactureLine.save)
+        montant = money(quantite * prix_unitaire)
+        if montant >= Decimal(10) ** 10:
+            raise FactureLinesError(f"Ligne {position} : montant trop élevé.")
+        try:
+            line_id = int(ln['id']) if ln.get('id') not in (None, '') else None
+        except (TypeError, ValueError):
+            raise FactureLinesError(f"Ligne {position} : identifiant invalide.")
+        description = ln.get('description')
+        if description is None:
+            description = ''
+        elif isinstance(description, (int, float)) and not isinstance(description, bool):
+            description = str(description)
+        elif not isinstance(description, str):
+            raise FactureLinesError(f"Ligne {position} : description invalide.")
+        lines.append(FactureLine(
+            id=line_id,
+            description=description[:300],
+            quantite=quantite,
+            prix_unitaire=prix_unitaire,
+            montant=montant,
+        ))
+    return lines
+
+
+def apply_totals(facture, subtotal):
+    """Renseigner sous-total, montant de TVA et total à partir du sous-total."""
+    subtotal = money(subtotal or 0)
+    tva_pct = Decimal(facture.tva_pct or 0)
+    facture.subtotal = subtotal
+    facture.tva_amount = money(subtotal * tva_pct / 100)
+    facture.total = subtotal + facture.tva_amount
+
+
+@transaction.atomic
+def save_facture(form, lines=None):
+    """Enregistrer la facture validée par `form` avec ses lignes.
+
+    `lines` (résultat de `parse_lines`) remplace les lignes existantes ;
+    `None` conserve les lignes actuelles et recalcule seulement les totaux.
+    """
+    facture = form.save(commit=False)
+    is_new = facture.pk is None
+
+    if lines is None:
+        subtotal = 0 if is_new else facture.lignes.aggregate(s=Sum('montant'))['s']
+    else:
+        subtotal = sum((line.montant for line in lines), Decimal(0))
+    apply_totals(facture, subtotal)
+    facture.save()
+
+    if lines is not None:
+        if is_new:
+            for line in lines:
+                line.id = None
+                line.facture = facture
+            FactureLine.objects.bulk_create(lines)
+        else:
+            sync_lines(facture, lines)
+    return facture
+
+
+def sync_lines(facture, lines):
+    """Appliquer `lines` à une facture existante en ne réécrivant que le diff."""
+    existing = {line.pk: line for line in FactureLine.objects.filter(facture=facture)}
+    to_create = []
+    to_update = []
+    for line in lines:
+        line.facture = facture
+        current = existing.pop(line.pk, None) if line.pk else None
+        if current is None:
+            # id absent, inconnu ou appartenant à une autre facture : nouvelle ligne
+            line.id = None
+            to_create.append(line)
+        elif any(getattr(current, field) != getattr(line, field) for field in LINE_FIELDS):
+            line.materiau_id = current.materiau_id
+            to_update.append(line)
+
+    if existing:
+        FactureLine.objects.filter(pk__in=list(existing)).delete()
+    if to_update:
+        FactureLine.objects.bulk_update(to_update, LINE_FIELDS)
+    if to_create:
+        FactureLine.objects.bulk_create(to_create)
+
+
+def assign_numeros(factures):
+    """Numéroter en bloc des factures non enregistrées (imports par lot).
+
+    Une seule réservation par année sur `FactureSequence`, à utiliser avant un
+    `bulk_create` qui ne passe pas par `Facture.save`.
+    """
+    by_year = {}
+    for facture in factures:
+        if not facture.numero:
+            by_year.setdefault(facture.date.year if facture.date else 2024, []).append(facture)
+    for year, pending in by_year.items():
+        for facture, numero in zip(pending, FactureSequence.reserve(year, len(pending))):
+            facture.numero = numero
+    return factures
+
+
+def paid_subquery():
+    """Somme des paiements de la facture courante (`OuterRef('pk')`)."""
+    paid = Payment.objects.filter(facture=OuterRef('pk')).values('facture').annotate(s=Sum('montant')).values('s')
+    return Coalesce(Subquery(paid), Value(Decimal(0)), output_field=Facture._meta.get_field('montant_paye'))
+
+
+def refresh_payment_totals(facture_ids):
+    """Recalculer `montant_paye` / `reste_a_payer` en un seul UPDATE."""
+    paid = paid_subquery()
+    return Facture.objects.filter(pk__in=facture_ids).update(
+        montant_paye=paid,
+        reste_a_payer=Greatest(F('total') - paid, Value(Decimal(0))),
+        updated_at=timezone.now(),
+    )
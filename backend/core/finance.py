@@ -0,0 +1,102 @@
+"""Synthèse financière mensuelle, matérialisée par client et par chantier.
+
+Pour chaque mois, `MonthlyFinanceSummary` contient une ligne par couple
+(client, chantier) rencontré :
+
+- `facture` / `reste_du` : total et reste à payer actuel des factures datées
+  du mois, hors factures annulées ;
+- `encaisse` : paiements clients datés du mois ;
+- `paie` : paiements du personnel datés du mois (client du chantier imputé).
+
+Une écriture sur `Facture`, `Payment` ou `PersonnelPayment` note les mois
+touchés (`mark_months`, appelé par core.signals et par les écritures en
+masse) ; chaque mois noté est recalculé en entier après le commit, en trois
+requêtes groupées. `rebuild` recalcule toute la table (commande
+`rebuild_finance_summary`).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .materialized import DeferredRefresh
+from .metrics import invalidate_dashboard_metrics
+from .models import Facture, MonthlyFinanceSummary, Payment, PersonnelPayment
+from .payroll import month_bounds, month_of
+
+
+SUMMARY_BATCH_SIZE = 500
+
+AMOUNTS = ('facture', 'reste_du', 'encaisse', 'paie')
+
+
+def _sources():
+    # (requête de base, champ client, champ chantier, champ date, {colonne: agrégat})
+    return (
+        (Facture.objects.exclude(statut='annulee'), 'client_id', 'chantier_id', 'date',
+         {'facture': Sum('total'), 'reste_du': Sum('reste_a_payer')}),
+        (Payment.objects.all(), 'facture__client_id', 'facture__chantier_id', 'date',
+         {'encaisse': Sum('montant')}),
+        (PersonnelPayment.objects.all(), 'chantier__client_id', 'chantier_id', 'date',
+         {'paie': Sum('montant')}),
+    )
+
+
+def _collect(filters, by_month):
+    """{(mois, client, chantier): {colonne: montant}} sur les lignes filtrées."""
+    totals = {}
+    for qs, client_field, chantier_field, date_field, aggregates in _sources():
+        qs = qs.filter(**filters(date_field))
+        group = [client_field, chantier_field]
+        if by_month:
+            qs = qs.annotate(mois=TruncMonth(date_field))
+            group.append('mois')
+        for row in qs.values(*group).annotate(**aggregates):
+            mois = month_of(row['mois']) if by_month else None
+            values = totals.setdefault((mois, row[client_field], row[chantier_field]), {})
+            for name in aggregates:
+                values[name] = row[name] or Decimal(0)
+    return totals
+
+
+def _rows(totals, periode=None):
+    now = timezone.now()
+    return [
+        MonthlyFinanceSummary(
+            periode=periode or mois, client_id=client_id, chantier_id=chantier_id, updated_at=now,
+            **{name: values.get(name, Decimal(0)) for name in AMOUNTS},
+        )
+        for (mois, client_id, chantier_id), values in totals.items()
+    ]
+
+
+def refresh_months(periodes):
+    """Recalculer les mois `{'AAAA-MM', ...}` de la synthèse."""
+    with transaction.atomic():
+        for periode in sorted(periodes):
+            first_day, last_day = month_bounds(periode)
+            totals = _collect(lambda date_field: {f'{date_field}__range': (first_day, last_day)}, by_month=False)
+            MonthlyFinanceSummary.objects.filter(periode=periode).delete()
+            MonthlyFinanceSummary.objects.bulk_create(_rows(totals, periode), batch_size=SUMMARY_BATCH_SIZE)
+    # le tableau de bord lit cette table : l'instantané en cache est périmé
+    invalidate_dashboard_metrics()
+
+
+def rebuild():
+    """Recalculer toute la synthèse (trois requêtes groupées par mois)."""
+    totals = _collect(lambda date_field: {}, by_month=True)
+    with transaction.atomic():
+        MonthlyFinanceSummary.objects.all().delete()
+        MonthlyFinanceSummary.objects.bulk_create(_rows(totals), batch_size=SUMMARY_BATCH_SIZE)
+    invalidate_dashboard_metrics()
+    return len(totals)
+
+
+_pending = DeferredRefresh(refresh_months)
+
+
+def mark_months(*dates):
+    """Noter les mois de ces dates pour un recalcul après le commit."""
+    _pending.mark(*(month_of(date) for date in dates))
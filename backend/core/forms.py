@@ -80,3 +80,10 @@ class FournisseurForm(forms.ModelForm):
         widgets = {
             'adresse': forms.Textarea(attrs={'rows': 2}),
         }
+
+
+class ReleveImportForm(forms.Form):
+    fichier = forms.FileField(label='Relevé bancaire (CSV ou OFX)')
+    format = forms.ChoiceField(choices=[('auto', 'Détection automatique'), ('csv', 'CSV'), ('ofx', 'OFX')], initial='auto')
+    encodage = forms.ChoiceField(choices=[('utf-8-sig', 'UTF-8'), ('latin-1', 'Latin-1 (Windows)')], initial='utf-8-sig')
+    simulation = forms.BooleanField(required=False, label='Simulation (ne rien enregistrer)')
@@ -0,0 +1,161 @@
+"""Grand livre des coûts par chantier, matérialisé par mois.
+
+Pour chaque chantier et chaque mois, `ChantierCostMonth` conserve :
+
+- `main_oeuvre` : paiements du personnel imputés au chantier
+  (`PersonnelPayment.chantier`, fixé au paiement d'après le chantier actuel) ;
+- `jours_homme` : jours pointés PRESENT ou RETARD sur le chantier ;
+- `materiaux` : lignes de facture portant sur un matériau ;
+- `facture` : total des factures du chantier (hors factures annulées).
+
+`Commande` n'est rattachée à aucun chantier : elle n'entre pas dans le calcul.
+
+Les cases (chantier, mois) touchées par une écriture sont notées par
+`mark_dirty` (signaux, écritures en masse) et recalculées ensemble après le
+commit (voir core.materialized), en quatre requêtes groupées par mois
+concerné. `rebuild` recalcule
+tout le livre (commande `rebuild_chantier_costs`).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .materialized import DeferredRefresh
+from .models import Chantier, ChantierCostMonth, Facture, FactureLine, PersonnelPayment, Presence
+from .payroll import JOURS_PAYES, month_bounds, month_of
+
+
+LEDGER_BATCH_SIZE = 500
+
+AMOUNTS = ('main_oeuvre', 'materiaux', 'facture')
+
+
+def cell(chantier_id, date):
+    """Case du livre d'une écriture datée, None hors chantier."""
+    if not chantier_id or date is None:
+        return None
+    return (chantier_id, month_of(date))
+
+
+# -- sources --------------------------------------------------------------------
+# Chaque source : (champ, requête de base, champ chantier, champ date, agrégat)
+
+def _sources():
+    return (
+        ('main_oeuvre', PersonnelPayment.objects.all(), 'chantier_id', 'date', Sum('montant')),
+        ('jours_homme', Presence.objects.filter(statut__in=JOURS_PAYES), 'chantier_id', 'date', Count('pk')),
+        ('materiaux', FactureLine.objects.filter(materiau__isnull=False).exclude(facture__statut='annulee'), 'facture__chantier_id', 'facture__date', Sum('montant')),
+        ('facture', Facture.objects.exclude(statut='annulee'), 'chantier_id', 'date', Sum('total')),
+    )
+
+
+def _empty(chantier_id, periode, now):
+    return ChantierCostMonth(chantier_id=chantier_id, periode=periode, jours_homme=0, updated_at=now, **{name: Decimal(0) for name in AMOUNTS})
+
+
+def _upsert(lines):
+    ChantierCostMonth.objects.bulk_create(
+        lines,
+        batch_size=LEDGER_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['chantier', 'periode'],
+        update_fields=['main_oeuvre', 'jours_homme', 'materiaux', 'facture', 'updated_at'],
+    )
+
+
+def refresh_cells(cells):
+    """Recalculer les cases `{(chantier_id, 'AAAA-MM'), ...}` du livre."""
+    by_month = {}
+    for chantier_id, periode in cells:
+        by_month.setdefault(periode, set()).add(chantier_id)
+    now = timezone.now()
+    with transaction.atomic():
+        for periode, chantier_ids in by_month.items():
+            # chantier supprimé entre-temps : sa case est partie avec lui
+            chantier_ids = set(Chantier.objects.filter(pk__in=chantier_ids).values_list('pk', flat=True))
+            if not chantier_ids:
+                continue
+            first_day, last_day = month_bounds(periode)
+            lines = {}
+            for name, qs, chantier_field, date_field, aggregate in _sources():
+                rows = qs.filter(**{f'{chantier_field}__in': chantier_ids, f'{date_field}__range': (first_day, last_day)})
+                for chantier_id, value in rows.values(chantier_field).annotate(value=aggregate).values_list(chantier_field, 'value'):
+                    if chantier_id not in lines:
+                        lines[chantier_id] = _empty(chantier_id, periode, now)
+                    setattr(lines[chantier_id], name, value or 0)
+            # case vidée (dernière écriture déplacée ou supprimée) : retirée,
+            # comme dans un recalcul complet
+            ChantierCostMonth.objects.filter(periode=periode, chantier_id__in=chantier_ids - set(lines)).delete()
+            _upsert(list(lines.values()))
+
+
+def rebuild():
+    """Recalculer tout le livre (quatre requêtes groupées par chantier et mois)."""
+    now = timezone.now()
+    lines = {}
+    for name, qs, chantier_field, date_field, aggregate in _sources():
+        rows = (
+            qs.filter(**{f'{chantier_field}__isnull': False})
+            .annotate(mois=TruncMonth(date_field))
+            .values(chantier_field, 'mois')
+            .annotate(value=aggregate)
+            .values_list(chantier_field, 'mois', 'value')
+        )
+        for chantier_id, mois, value in rows:
+            key = cell(chantier_id, mois)
+            if key not in lines:
+                lines[key] = _empty(chantier_id, key[1], now)
+            setattr(lines[key], name, value or 0)
+    with transaction.atomic():
+        ChantierCostMonth.objects.all().delete()
+        _upsert(list(lines.values()))
+    return len(lines)
+
+
+# -- mise à jour incrémentale --------------------------------------------------
+
+_pending = DeferredRefresh(refresh_cells)
+
+
+def mark_dirty(*cells):
+    """Noter des cases à recalculer après le commit de la transaction courante."""
+    _pending.mark(*cells)
+
+
+# -- lecture --------------------------------------------------------------------
+
+def chantier_totals(chantier_id=None):
+    """Cumuls par chantier (budget, coûts, facturé, écart), une requête."""
+    qs = Chantier.objects.select_related('client').annotate(
+        main_oeuvre=Sum('couts_mensuels__main_oeuvre'),
+        jours_homme=Sum('couts_mensuels__jours_homme'),
+        materiaux=Sum('couts_mensuels__materiaux'),
+        facture=Sum('couts_mensuels__facture'),
+    ).order_by('nom', 'pk')
+    if chantier_id:
+        qs = qs.filter(pk=chantier_id)
+    rows = []
+    for chantier in qs:
+        main_oeuvre = chantier.main_oeuvre or Decimal(0)
+        materiaux = chantier.materiaux or Decimal(0)
+        cout = main_oeuvre + materiaux
+        rows.append({
+            'chantier': chantier,
+            'budget': chantier.budget,
+            'main_oeuvre': main_oeuvre,
+            'jours_homme': chantier.jours_homme or 0,
+            'materiaux': materiaux,
+            'cout': cout,
+            'facture': chantier.facture or Decimal(0),
+            'ecart': chantier.budget - cout,
+            'consomme_pct': round(cout * 100 / chantier.budget) if chantier.budget else None,
+        })
+    return rows
+
+
+def chantier_months(chantier_id):
+    """Détail mensuel d'un chantier, du plus récent au plus ancien."""
+    return ChantierCostMonth.objects.filter(chantier_id=chantier_id).order_by('-periode')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.payroll import compute_payroll, current_periode, month_bounds
+
+
+class Command(BaseCommand):
+    help = 'Recalcule la paie mensuelle (jours pointés, salaire de base, prime) dans la table MonthlyPayroll'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', action='append', help='Mois à recalculer (AAAA-MM), répétable ; par défaut le mois en cours')
+
+    def handle(self, *args, **options):
+        for periode in options['month'] or [current_periode()]:
+            try:
+                month_bounds(periode)
+            except ValueError:
+                raise CommandError(f'Mois invalide (AAAA-MM attendu) : {periode!r}')
+            count = compute_payroll(periode)
+            self.stdout.write(self.style.SUCCESS(f'✓ Paie {periode} : {count} ligne(s) calculée(s)'))
@@ -0,0 +1,93 @@
+import re
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import Chantier, Facture, Materiau, MonthlyFinanceSummary, Payment, Personnel, PersonnelPayment, Presence, Rapport
+from core.reorder import reorder_candidates
+
+
+# Parcours complet d'une table : `SCAN core_xxx` sans index (SQLite) ou
+# `Seq Scan on core_xxx` (PostgreSQL)
+FULL_SCAN = re.compile(r'\bSCAN (?:TABLE )?(?!CONSTANT ROW)(\w+)(?!\w| USING)|Seq Scan on (\w+)')
+
+# Parcours complet d'un index : `SCAN core_xxx USING [COVERING] INDEX idx`
+# (SQLite) lit toutes les entrées de l'index, comme un parcours de table ;
+# seul `SEARCH ... USING INDEX` est une recherche dans l'index. Exceptions :
+# une page (LIMIT) lue dans l'ordre de l'index, sans tri temporaire, s'arrête
+# après `limit` entrées, et un index partiel (`condition`) ne contient que les
+# lignes qui vérifient sa condition
+INDEX_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+) USING (?:COVERING )?INDEX (\w+)')
+
+
+def partial_indexes():
+    """Noms des index partiels déclarés par les modèles."""
+    return {
+        index.name
+        for model in apps.get_models()
+        for index in model._meta.indexes
+        if index.condition is not None
+    }
+
+
+def key_queries():
+    """Requêtes représentatives des vues, avec des paramètres plausibles."""
+    today = timezone.localdate()
+    month_ago = today - timedelta(days=30)
+    return [
+        ('Chantiers en cours (tableau de bord)', Chantier.objects.filter(statut='en_cours').order_by('-created_at')),
+        ('Liste des factures (page 1)', Facture.objects.select_related('client').order_by('-created_at', '-pk')[:51]),
+        ('Factures par statut et période', Facture.objects.filter(statut='envoyee', date__gte=month_ago).order_by('-date')),
+        ('Factures du mois', Facture.objects.filter(date__gte=today.replace(day=1)).values('pk', 'total')),
+        ('Synthèse financière du mois', MonthlyFinanceSummary.objects.filter(periode=f'{today:%Y-%m}').values('facture')),
+        ('Factures impayées récentes', Facture.objects.filter(reste_a_payer__gt=0).order_by('-date')[:5]),
+        ("Paiements d'une facture", Payment.objects.filter(facture_id=1).order_by('-date')),
+        ("Paiements d'un employé sur la période", PersonnelPayment.objects.filter(personnel_id=1, date__gte=month_ago).order_by('-date')),
+        ("Rapports d'un auteur", Rapport.objects.filter(auteur_id=1).order_by('-created_at')),
+        ("Rapports d'un chantier", Rapport.objects.filter(chantier_id=1).order_by('-created_at')),
+        ('Personnel actif par rôle', Personnel.objects.filter(est_actif=True, role='ouvrier')),
+        ("Présences d'un chantier (jour)", Presence.objects.filter(chantier_id=1, date=today)),
+        ('Matériaux en rupture', Materiau.objects.filter(quantite_stock__lte=F('seuil_minimum')).values('pk')),
+        ('Matériaux à réapprovisionner', reorder_candidates()),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Affiche le plan d\'exécution (EXPLAIN) des requêtes clés des vues et signale les parcours complets de table ou d\'index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strict', action='store_true', help='Échouer (code de sortie non nul) si un parcours complet est détecté')
+        parser.add_argument('--quiet', action='store_true', help="N'afficher que les requêtes signalées")
+
+    def handle(self, *args, **options):
+        flagged = []
+        partial = partial_indexes()
+        for label, queryset in key_queries():
+            plan = queryset.explain()
+            scans = sorted({table for match in FULL_SCAN.finditer(plan) for table in match.groups() if table})
+            paged = queryset.query.high_mark is not None and 'TEMP B-TREE' not in plan
+            if not paged:
+                scans += sorted({
+                    f"l'index {index} ({table})"
+                    for table, index in INDEX_SCAN.findall(plan)
+                    if index not in partial
+                })
+            if scans:
+                flagged.append(label)
+                self.stdout.write(self.style.WARNING(f"⚠️  {label} : parcours complet de {', '.join(scans)}"))
+            elif not options['quiet']:
+                self.stdout.write(self.style.SUCCESS(f'✓ {label}'))
+            if scans or not options['quiet']:
+                for line in plan.splitlines():
+                    self.stdout.write(f'    {line}')
+
+        if not flagged:
+            self.stdout.write(self.style.SUCCESS("\n✓ Aucun parcours complet de table ou d'index"))
+            return
+        message = f"{len(flagged)} requête(s) avec parcours complet de table ou d'index"
+        if options['strict']:
+            raise CommandError(message)
+        self.stdout.write(self.style.WARNING(f'\n{message}'))
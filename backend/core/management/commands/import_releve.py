@@ -0,0 +1,42 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bank_import import StatementError, import_statement, parse_statement
+
+
+class Command(BaseCommand):
+    help = 'Importe un relevé bancaire (CSV ou OFX) et crée les paiements des factures rapprochées'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help='Chemin du relevé')
+        parser.add_argument('--format', choices=['auto', 'csv', 'ofx'], default='auto')
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--user', help="Nom d'utilisateur enregistré comme auteur des paiements")
+        parser.add_argument('--dry-run', action='store_true', help='Simuler sans rien enregistrer')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"Utilisateur inconnu : {options['user']}")
+
+        try:
+            with open(options['fichier'], encoding=options['encoding'], errors='replace', newline='') as stream:
+                lines = parse_statement(stream, options['format'], options['fichier'])
+                report = import_statement(lines, user=user, dry_run=options['dry_run'])
+        except OSError as e:
+            raise CommandError(str(e))
+        except StatementError as e:
+            raise CommandError(f'Relevé rejeté, aucun paiement enregistré : {e}')
+
+        for line, reason in report.unmatched:
+            self.stdout.write(self.style.WARNING(f'⚠️  {line.date} {line.montant} « {line.reference} » : {reason}'))
+        if report.unmatched_count > len(report.unmatched):
+            self.stdout.write(self.style.WARNING(f'   … et {report.unmatched_count - len(report.unmatched)} autre(s) ligne(s) non rapprochée(s)'))
+
+        prefix = '[simulation] ' if report.dry_run else ''
+        self.stdout.write(self.style.SUCCESS(f'\n✓ {prefix}{report.created} paiement(s) créé(s) pour {report.montant} FCFA'))
+        self.stdout.write(f'  {report.lines} ligne(s) lue(s), {report.debits} débit(s) ignoré(s), {report.duplicates} doublon(s)')
+        self.stdout.write(f'  {report.factures} facture(s) mise(s) à jour, dont {report.factures_payees} soldée(s)')
+        self.stdout.write(f'  {report.unmatched_count} ligne(s) non rapprochée(s)')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import ledger
+
+
+class Command(BaseCommand):
+    help = 'Recalcule entièrement le livre des coûts mensuels par chantier (main d\'œuvre, matériaux, facturation)'
+
+    def handle(self, *args, **options):
+        count = ledger.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✓ Livre des coûts recalculé : {count} case(s) chantier/mois'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import finance
+
+
+class Command(BaseCommand):
+    help = 'Recalcule entièrement la synthèse financière mensuelle (facturé, encaissé, paie, reste dû)'
+
+    def handle(self, *args, **options):
+        count = finance.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✓ Synthèse financière recalculée : {count} ligne(s) mois/client/chantier'))
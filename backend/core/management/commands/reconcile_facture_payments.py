@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+
+from core.facturation import paid_subquery, refresh_payment_totals
+from core.models import Facture
+
+
+class Command(BaseCommand):
+    help = 'Vérifie montant_paye / reste_a_payer des factures contre les paiements (et corrige avec --fix)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Corriger les factures en écart')
+
+    def handle(self, *args, **options):
+        qs = Facture.objects.annotate(paid_reel=paid_subquery()).annotate(
+            reste_reel=Greatest(F('total') - F('paid_reel'), Value(0), output_field=Facture._meta.get_field('reste_a_payer')),
+        ).filter(~Q(montant_paye=F('paid_reel')) | ~Q(reste_a_payer=F('reste_reel')))
+        drift = list(qs.values_list('pk', 'numero', 'montant_paye', 'paid_reel', 'reste_a_payer').order_by('pk'))
+
+        for pk, numero, stocke, reel, reste in drift:
+            self.stdout.write(self.style.WARNING(f'⚠️  Facture {numero or pk} : payé {stocke} en base, {reel} selon les paiements (reste {reste})'))
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('✓ Aucun écart'))
+            return
+        if not options['fix']:
+            self.stdout.write(f'{len(drift)} facture(s) en écart. Relancer avec --fix pour corriger.')
+            return
+
+        with transaction.atomic():
+            updated = refresh_payment_totals([row[0] for row in drift])
+        self.stdout.write(self.style.SUCCESS(f'✓ {updated} facture(s) corrigée(s)'))
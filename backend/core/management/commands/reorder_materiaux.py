@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core.reorder import generate_reorders
+
+
+class Command(BaseCommand):
+    help = 'Crée les commandes de réapprovisionnement (préparées, groupées par fournisseur) des matériaux sous leur seuil minimum'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Afficher les commandes sans les créer")
+
+    def handle(self, *args, **options):
+        batches = generate_reorders(dry_run=options['dry_run'])
+        for fournisseur, commandes in batches:
+            self.stdout.write(f"{fournisseur.nom if fournisseur else 'Sans fournisseur'} : {len(commandes)} commande(s)")
+            for commande in commandes:
+                self.stdout.write(f"  - {commande.materiau.nom} x{commande.quantite} (stock {commande.materiau.quantite_stock}, seuil {commande.materiau.seuil_minimum})")
+        count = sum(len(commandes) for _, commandes in batches)
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'✓ {count} commande(s) à créer (simulation)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ {count} commande(s) de réapprovisionnement créée(s) pour {len(batches)} fournisseur(s)'))
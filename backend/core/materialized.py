@@ -0,0 +1,34 @@
+"""Rafraîchissement différé des tables matérialisées (livre des coûts, synthèse financière).
+
+Les écritures notent les clés touchées (`DeferredRefresh.mark`) ; toutes
+les clés notées dans une transaction sont recalculées ensemble par le
+premier rappel `on_commit`, les suivants ne trouvent plus rien à faire.
+Hors transaction, le recalcul est immédiat. Des clés restées en attente
+après un rollback sont simplement recalculées au commit suivant : le
+recalcul d'une clé est idempotent.
+"""
+import threading
+
+from django.db import transaction
+
+
+class DeferredRefresh:
+    def __init__(self, refresh):
+        self.refresh = refresh
+        self._local = threading.local()
+
+    def mark(self, *keys):
+        keys = {key for key in keys if key is not None}
+        if not keys:
+            return
+        if not hasattr(self._local, 'keys'):
+            self._local.keys = set()
+        self._local.keys |= keys
+        transaction.on_commit(self.flush)
+
+    def flush(self):
+        keys = getattr(self._local, 'keys', None)
+        if not keys:
+            return
+        self._local.keys = set()
+        self.refresh(keys)
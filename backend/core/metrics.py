@@ -0,0 +1,139 @@
+"""Indicateurs agrégés du tableau de bord.
+
+Toutes les statistiques affichées par `DashboardView` et exposées par
+`api_dashboard_stats` sont calculées ici, avec une agrégation
+conditionnelle par modèle (une seule requête par table) au lieu d'un
+`count()` / `aggregate()` séparé pour chaque compteur.
+
+Le résultat est mis en cache par rôle (`get_dashboard_metrics`) et le
+cache est invalidé par les signaux de `core.signals` à chaque écriture
+sur un modèle qui entre dans les indicateurs.
+"""
+import dataclasses
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import Chantier, Client, Facture, Fournisseur, Materiau, MonthlyFinanceSummary, Personnel, UserProfile
+
+
+# Statuts de chantier comptés dans le budget "actif"
+BUDGET_STATUTS = ('planifie', 'en_cours')
+
+# Durée de vie maximale d'un instantané (filet de sécurité : le cache est
+# normalement invalidé par signal dès qu'une donnée change)
+CACHE_TIMEOUT = getattr(settings, 'DASHBOARD_METRICS_CACHE_TIMEOUT', 300)
+CACHE_ROLES = [role for role, _ in UserProfile.ROLE_CHOICES]
+
+
+@dataclasses.dataclass(frozen=True)
+class DashboardMetrics:
+    total_chantiers: int = 0
+    chantiers_actifs: int = 0
+    chantiers_termines: int = 0
+    budget_total: Decimal = Decimal(0)
+    total_personnel: int = 0
+    total_materiaux: int = 0
+    materiaux_rupture: int = 0
+    total_clients: int = 0
+    total_fournisseurs: int = 0
+    factures_count: int = 0
+    montant_factures_mois: Decimal = Decimal(0)
+
+    def for_role(self, role):
+        """Masquer les indicateurs qu'un rôle ne doit pas voir."""
+        if role == 'comptable':
+            # le comptable ne voit pas la partie opérationnelle des chantiers
+            return dataclasses.replace(self, total_chantiers=0, chantiers_actifs=0, chantiers_termines=0)
+        if role == 'chef':
+            # les chefs ne voient pas les montants facturés
+            return dataclasses.replace(self, montant_factures_mois=Decimal(0))
+        return self
+
+    def as_context(self):
+        return dataclasses.asdict(self)
+
+    def as_api(self):
+        return {
+            'chantiers': {
+                'total': self.total_chantiers,
+                'actifs': self.chantiers_actifs,
+                'termines': self.chantiers_termines,
+            },
+            'personnel': {
+                'total': self.total_personnel,
+            },
+            'materiaux': {
+                'total': self.total_materiaux,
+                'en_rupture': self.materiaux_rupture,
+            },
+            'clients': {
+                'total': self.total_clients,
+            },
+            'fournisseurs': {
+                'total': self.total_fournisseurs,
+            },
+            'finances': {
+                'budget_total': float(self.budget_total),
+                'factures_mois': float(self.montant_factures_mois),
+            },
+        }
+
+
+def compute_dashboard_metrics(today=None):
+    """Calculer tous les indicateurs du tableau de bord (une requête par modèle)."""
+    today = today or timezone.localdate()
+
+    chantiers = Chantier.objects.aggregate(
+        total=Count('id'),
+        actifs=Count('id', filter=Q(statut='en_cours')),
+        termines=Count('id', filter=Q(statut='termine')),
+        budget_actif=Sum('budget', filter=Q(statut__in=BUDGET_STATUTS)),
+    )
+    personnel = Personnel.objects.aggregate(actifs=Count('id', filter=Q(est_actif=True)))
+    materiaux = Materiau.objects.aggregate(
+        total=Count('id'),
+        rupture=Count('id', filter=Q(quantite_stock__lte=F('seuil_minimum'))),
+    )
+    factures = Facture.objects.aggregate(nb=Count('id'))
+    # montant facturé du mois lu dans la synthèse mensuelle (voir core.finance)
+    montant_mois = MonthlyFinanceSummary.objects.filter(periode=f'{today:%Y-%m}').aggregate(s=Sum('facture'))['s']
+
+    return DashboardMetrics(
+        total_chantiers=chantiers['total'],
+        chantiers_actifs=chantiers['actifs'],
+        chantiers_termines=chantiers['termines'],
+        budget_total=chantiers['budget_actif'] or Decimal(0),
+        total_personnel=personnel['actifs'],
+        total_materiaux=materiaux['total'],
+        materiaux_rupture=materiaux['rupture'],
+        total_clients=Client.objects.count(),
+        total_fournisseurs=Fournisseur.objects.count(),
+        factures_count=factures['nb'],
+        montant_factures_mois=montant_mois or Decimal(0),
+    )
+
+
+def _cache_key(role, today=None):
+    # Le mois fait partie de la clé : `montant_factures_mois` change au 1er du mois
+    today = today or timezone.localdate()
+    role = role if role in CACHE_ROLES else 'all'
+    return f"dashboard_metrics:{today:%Y-%m}:{role}"
+
+
+def get_dashboard_metrics(role=None):
+    """Retourner l'instantané des indicateurs pour `role`, calculé au besoin."""
+    key = _cache_key(role)
+    metrics = cache.get(key)
+    if metrics is None:
+        metrics = compute_dashboard_metrics().for_role(role)
+        cache.set(key, metrics, CACHE_TIMEOUT)
+    return metrics
+
+
+def invalidate_dashboard_metrics():
+    """Supprimer les instantanés de tous les rôles."""
+    cache.delete_many([_cache_key(role) for role in CACHE_ROLES + ['all']])
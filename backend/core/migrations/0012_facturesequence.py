@@ -0,0 +1,24 @@
+# Generated by Django 4.2.26 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_updated_at_markers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FactureSequence',
+            fields=[
+                ('year', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('last_number', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Séquence de factures',
+                'verbose_name_plural': 'Séquences de factures',
+            },
+        ),
+    ]
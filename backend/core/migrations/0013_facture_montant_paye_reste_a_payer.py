@@ -0,0 +1,36 @@
+# Generated by Django 4.2.26 on 2026-10-18 10:40
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+def fill_payment_totals(apps, schema_editor):
+    Facture = apps.get_model('core', 'Facture')
+    Payment = apps.get_model('core', 'Payment')
+    paid = Payment.objects.filter(facture=OuterRef('pk')).values('facture').annotate(s=Sum('montant')).values('s')
+    paid = Coalesce(Subquery(paid), Value(Decimal(0)), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+    Facture.objects.update(montant_paye=paid, reste_a_payer=Greatest(F('total') - paid, Value(Decimal(0))))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_facturesequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facture',
+            name='montant_paye',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='facture',
+            name='reste_a_payer',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(fill_payment_totals, migrations.RunPython.noop),
+    ]
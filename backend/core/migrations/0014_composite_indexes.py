@@ -0,0 +1,57 @@
+# Generated by Django 4.2.26 on 2026-10-18 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_facture_montant_paye_reste_a_payer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chantier',
+            index=models.Index(fields=['statut', 'created_at'], name='chantier_statut_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['date'], name='facture_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['statut', 'date'], name='facture_statut_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['created_at'], name='facture_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='materiau',
+            index=models.Index(fields=['quantite_stock', 'seuil_minimum'], name='materiau_stock_seuil_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['facture', 'date'], name='payment_facture_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='personnel',
+            index=models.Index(fields=['role', 'est_actif'], name='personnel_role_actif_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='personnelpayment',
+            index=models.Index(fields=['personnel', 'date'], name='ppayment_personnel_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='presence',
+            index=models.Index(fields=['chantier', 'date'], name='presence_chantier_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rapport',
+            index=models.Index(fields=['auteur', 'created_at'], name='rapport_auteur_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rapport',
+            index=models.Index(fields=['chantier', 'created_at'], name='rapport_chantier_created_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.26 on 2026-10-18 11:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0014_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periode', models.CharField(help_text='Mois payé (AAAA-MM)', max_length=7)),
+                ('date', models.DateField()),
+                ('mode', models.CharField(default='virement', max_length=20)),
+                ('nb_paiements', models.PositiveIntegerField(default=0)),
+                ('montant_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('statut', models.CharField(choices=[('valide', 'Validée'), ('annulee', 'Annulée')], default='valide', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('annulee_le', models.DateTimeField(blank=True, null=True)),
+                ('annulee_par', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='paies_annulees', to=settings.AUTH_USER_MODEL)),
+                ('chantier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='paies', to='core.chantier')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='paies_lancees', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Paie mensuelle',
+                'verbose_name_plural': 'Paies mensuelles',
+            },
+        ),
+        migrations.AddField(
+            model_name='personnelpayment',
+            name='run',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='paiements', to='core.payrollrun'),
+        ),
+    ]
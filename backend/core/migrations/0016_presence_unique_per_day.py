@@ -0,0 +1,31 @@
+# Generated by Django 4.2.26 on 2026-10-18 11:34
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def drop_duplicate_presences(apps, schema_editor):
+    # Doublons saisis dans l'admin : on garde la dernière ligne saisie
+    Presence = apps.get_model('core', 'Presence')
+    duplicates = (
+        Presence.objects.values('employee', 'chantier', 'date')
+        .annotate(n=Count('pk'), keep=Max('pk'))
+        .filter(n__gt=1)
+    )
+    for row in duplicates:
+        Presence.objects.filter(employee=row['employee'], chantier=row['chantier'], date=row['date']).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_payrollrun'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_presences, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='presence',
+            constraint=models.UniqueConstraint(fields=('employee', 'chantier', 'date'), name='unique_presence_per_day'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.26 on 2026-10-18 11:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_presence_unique_per_day'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyPayroll',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periode', models.CharField(help_text='Mois (AAAA-MM)', max_length=7)),
+                ('jours_travailles', models.PositiveIntegerField(default=0)),
+                ('salaire_base', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('prime', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('montant_du', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('personnel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='paies_mensuelles', to='core.personnel')),
+            ],
+            options={
+                'verbose_name': 'Paie calculée',
+                'verbose_name_plural': 'Paies calculées',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='monthlypayroll',
+            constraint=models.UniqueConstraint(fields=('periode', 'personnel'), name='unique_payroll_per_month'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.26 on 2026-10-18 12:05
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def impute_personnel_payments(apps, schema_editor):
+    # paiements existants : imputés au chantier actuel de la personne
+    PersonnelPayment = apps.get_model('core', 'PersonnelPayment')
+    Personnel = apps.get_model('core', 'Personnel')
+    chantier = Personnel.objects.filter(pk=OuterRef('personnel_id')).values('chantier_actuel_id')[:1]
+    PersonnelPayment.objects.filter(chantier__isnull=True).update(chantier_id=Subquery(chantier))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_monthlypayroll'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChantierCostMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periode', models.CharField(help_text='Mois (AAAA-MM)', max_length=7)),
+                ('main_oeuvre', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('jours_homme', models.PositiveIntegerField(default=0)),
+                ('materiaux', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('facture', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Coût mensuel de chantier',
+                'verbose_name_plural': 'Coûts mensuels de chantier',
+            },
+        ),
+        migrations.AddField(
+            model_name='personnelpayment',
+            name='chantier',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='paiements_personnel', to='core.chantier'),
+        ),
+        migrations.AddIndex(
+            model_name='personnelpayment',
+            index=models.Index(fields=['chantier', 'date'], name='ppayment_chantier_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='chantiercostmonth',
+            name='chantier',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='couts_mensuels', to='core.chantier'),
+        ),
+        migrations.AddConstraint(
+            model_name='chantiercostmonth',
+            constraint=models.UniqueConstraint(fields=('chantier', 'periode'), name='unique_chantier_cost_month'),
+        ),
+        migrations.RunPython(impute_personnel_payments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.26 on 2026-10-18 12:31
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def fill_finance_summary(apps, schema_editor):
+    # même calcul que core.finance.rebuild, sur les modèles historiques
+    Facture = apps.get_model('core', 'Facture')
+    Payment = apps.get_model('core', 'Payment')
+    PersonnelPayment = apps.get_model('core', 'PersonnelPayment')
+    MonthlyFinanceSummary = apps.get_model('core', 'MonthlyFinanceSummary')
+    sources = (
+        (Facture.objects.exclude(statut='annulee'), 'client_id', 'chantier_id', {'facture': Sum('total'), 'reste_du': Sum('reste_a_payer')}),
+        (Payment.objects.all(), 'facture__client_id', 'facture__chantier_id', {'encaisse': Sum('montant')}),
+        (PersonnelPayment.objects.all(), 'chantier__client_id', 'chantier_id', {'paie': Sum('montant')}),
+    )
+    totals = {}
+    for qs, client_field, chantier_field, aggregates in sources:
+        rows = qs.annotate(mois=TruncMonth('date')).values(client_field, chantier_field, 'mois').annotate(**aggregates)
+        for row in rows:
+            values = totals.setdefault((f"{row['mois']:%Y-%m}", row[client_field], row[chantier_field]), {})
+            for name in aggregates:
+                values[name] = row[name] or Decimal(0)
+    MonthlyFinanceSummary.objects.bulk_create([
+        MonthlyFinanceSummary(periode=periode, client_id=client_id, chantier_id=chantier_id, **values)
+        for (periode, client_id, chantier_id), values in totals.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_chantier_cost_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyFinanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periode', models.CharField(help_text='Mois (AAAA-MM)', max_length=7)),
+                ('facture', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('reste_du', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('encaisse', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paie', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Synthèse financière mensuelle',
+                'verbose_name_plural': 'Synthèses financières mensuelles',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['date'], name='payment_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='monthlyfinancesummary',
+            name='chantier',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='syntheses_mensuelles', to='core.chantier'),
+        ),
+        migrations.AddField(
+            model_name='monthlyfinancesummary',
+            name='client',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='syntheses_mensuelles', to='core.client'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlyfinancesummary',
+            index=models.Index(fields=['periode'], name='finance_periode_idx'),
+        ),
+        migrations.RunPython(fill_finance_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.26 on 2026-10-18 13:02
+
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def record_initial_stock(apps, schema_editor):
+    # stock existant repris comme un ajustement : somme des mouvements = stock
+    Materiau = apps.get_model('core', 'Materiau')
+    StockMovement = apps.get_model('core', 'StockMovement')
+    today = datetime.date.today()
+    StockMovement.objects.bulk_create([
+        StockMovement(materiau_id=pk, type='ajustement', quantite=stock, date=today, note='Stock initial')
+        for pk, stock in Materiau.objects.exclude(quantite_stock=0).values_list('pk', 'quantite_stock')
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0019_monthly_finance_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('entree', 'Entrée'), ('sortie', 'Sortie'), ('ajustement', 'Ajustement')], max_length=20)),
+                ('quantite', models.IntegerField()),
+                ('date', models.DateField()),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chantier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mouvements_stock', to='core.chantier')),
+                ('commande', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mouvements_stock', to='core.commande')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mouvements_stock', to=settings.AUTH_USER_MODEL)),
+                ('materiau', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mouvements', to='core.materiau')),
+            ],
+            options={
+                'verbose_name': 'Mouvement de stock',
+                'verbose_name_plural': 'Mouvements de stock',
+                'indexes': [models.Index(fields=['materiau', 'date'], name='stock_materiau_date_idx'), models.Index(fields=['chantier', 'date'], name='stock_chantier_date_idx')],
+            },
+        ),
+        migrations.RunPython(record_initial_stock, migrations.RunPython.noop),
+    ]
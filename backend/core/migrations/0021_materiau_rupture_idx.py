@@ -0,0 +1,21 @@
+# Generated by Django 4.2.26 on 2026-10-18 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_stockmovement'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='materiau',
+            name='materiau_stock_seuil_idx',
+        ),
+        migrations.AddIndex(
+            model_name='materiau',
+            index=models.Index(condition=models.Q(('quantite_stock__lte', models.F('seuil_minimum'))), fields=['fournisseur'], name='materiau_rupture_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.26 on 2026-10-18 12:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_materiau_rupture_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='bank_id',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['facture', 'bank_id'], name='payment_facture_bank_id_idx'),
+        ),
+    ]
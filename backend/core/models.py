@@ -1,5 +1,5 @@
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.contrib.auth.models import User
 
 
@@ -56,6 +56,9 @@ class Chantier(models.Model):
     class Meta:
         verbose_name = "Chantier"
         verbose_name_plural = "Chantiers"
+        indexes = [
+            models.Index(fields=['statut', 'created_at'], name='chantier_statut_created_idx'),
+        ]
 
 
 # ==========================
@@ -161,6 +164,13 @@ class Presence(models.Model):
     class Meta:
         verbose_name = 'Présence'
         verbose_name_plural = 'Présences'
+        constraints = [
+            # une seule ligne par employé, chantier et jour (appel : upsert)
+            models.UniqueConstraint(fields=['employee', 'chantier', 'date'], name='unique_presence_per_day'),
+        ]
+        indexes = [
+            models.Index(fields=['chantier', 'date'], name='presence_chantier_date_idx'),
+        ]
 
 
 class RapportChantier(models.Model):
@@ -198,6 +208,7 @@ class Personnel(models.Model):
     chantier_actuel = models.ForeignKey(Chantier, on_delete=models.SET_NULL, null=True, blank=True, related_name='personnel_actuel')
     est_actif = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     salaire_mensuel = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     # Champs spécifiques selon le rôle
     # Ouvrier / Maître ouvrier
@@ -216,6 +227,11 @@ class Personnel(models.Model):
     class Meta:
         verbose_name = "Personnel"
         verbose_name_plural = "Personnel"
+        indexes = [
+            # `role` en tête : SQLite compile `est_actif=True` en `WHERE est_actif`,
+            # qui ne peut pas servir de préfixe d'index
+            models.Index(fields=['role', 'est_actif'], name='personnel_role_actif_idx'),
+        ]
 
 
 class Materiau(models.Model):
@@ -257,6 +273,15 @@ class Materiau(models.Model):
     class Meta:
         verbose_name = "Matériau"
         verbose_name_plural = "Matériaux"
+        indexes = [
+            # index partiel : il ne contient que les matériaux en rupture, si
+            # bien que la condition quantite_stock <= seuil_minimum (deux
+            # colonnes, qu'aucun index B-tree ne cherche) se lit en parcourant
+            # ces seules entrées
+            models.Index(
+                fields=['fournisseur'], condition=Q(quantite_stock__lte=F('seuil_minimum')), name='materiau_rupture_idx',
+            ),
+        ]
 
 
 class Fournisseur(models.Model):
@@ -267,6 +292,7 @@ class Fournisseur(models.Model):
     adresse = models.CharField(max_length=300, blank=True)
     specialite = models.CharField(max_length=200, blank=True, help_text="Domaine de spécialisation")
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.nom} ({self.specialite})"
@@ -283,6 +309,7 @@ class Client(models.Model):
     email = models.EmailField(blank=True)
     adresse = models.CharField(max_length=300, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.nom} ({self.contact})"
@@ -316,6 +343,83 @@ class Commande(models.Model):
         verbose_name_plural = 'Commandes'
 
 
+class StockMovement(models.Model):
+    """Mouvement de stock d'un matériau ; `quantite_stock` est mis à jour avec (voir core.stock)."""
+    TYPE_CHOICES = [
+        ('entree', 'Entrée'),
+        ('sortie', 'Sortie'),
+        ('ajustement', 'Ajustement'),
+    ]
+
+    materiau = models.ForeignKey(Materiau, on_delete=models.CASCADE, related_name='mouvements')
+    type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    # variation appliquée au stock : positive pour une entrée, négative pour une sortie
+    quantite = models.IntegerField()
+    chantier = models.ForeignKey(Chantier, on_delete=models.SET_NULL, null=True, blank=True, related_name='mouvements_stock')
+    commande = models.ForeignKey(Commande, on_delete=models.SET_NULL, null=True, blank=True, related_name='mouvements_stock')
+    date = models.DateField()
+    note = models.CharField(max_length=200, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='mouvements_stock')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.get_type_display()} {self.materiau.nom} {self.quantite:+d}"
+
+    class Meta:
+        verbose_name = 'Mouvement de stock'
+        verbose_name_plural = 'Mouvements de stock'
+        indexes = [
+            models.Index(fields=['materiau', 'date'], name='stock_materiau_date_idx'),
+            models.Index(fields=['chantier', 'date'], name='stock_chantier_date_idx'),
+        ]
+
+
+class FactureSequence(models.Model):
+    """Compteur de numérotation des factures, une ligne par année."""
+    year = models.PositiveIntegerField(primary_key=True)
+    last_number = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.year} : {self.last_number}"
+
+    class Meta:
+        verbose_name = 'Séquence de factures'
+        verbose_name_plural = 'Séquences de factures'
+
+    @staticmethod
+    def format_numero(year, number):
+        return f"{year}-FAC-{str(number).zfill(3)}"
+
+    @classmethod
+    def _legacy_last_number(cls, year):
+        # Numéros attribués avant l'existence du compteur (lu une fois par année)
+        prefix = f"{year}-FAC-"
+        last = 0
+        for numero in Facture.objects.filter(numero__startswith=prefix).values_list('numero', flat=True):
+            try:
+                last = max(last, int(numero[len(prefix):]))
+            except ValueError:
+                continue
+        return last
+
+    @classmethod
+    def reserve(cls, year, count=1):
+        """Réserver `count` numéros consécutifs pour `year` et les retourner.
+
+        L'incrément est un seul `UPDATE ... SET last_number = last_number + n`
+        qui verrouille la ligne de l'année : deux créations concurrentes ne
+        peuvent pas obtenir le même numéro.
+        """
+        if count < 1:
+            return []
+        with transaction.atomic():
+            if not cls.objects.filter(year=year).update(last_number=F('last_number') + count):
+                cls.objects.get_or_create(year=year, defaults={'last_number': cls._legacy_last_number(year)})
+                cls.objects.filter(year=year).update(last_number=F('last_number') + count)
+            last = cls.objects.values_list('last_number', flat=True).get(year=year)
+        return [cls.format_numero(year, number) for number in range(last - count + 1, last + 1)]
+
+
 class Facture(models.Model):
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='factures')
     chantier = models.ForeignKey(Chantier, on_delete=models.SET_NULL, null=True, blank=True, related_name='factures')
@@ -326,6 +430,10 @@ class Facture(models.Model):
     tva_pct = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     tva_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Dénormalisés : maintenus par `facturation.refresh_payment_totals` à
+    # chaque écriture d'un `Payment` (voir core.signals)
+    montant_paye = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    reste_a_payer = models.DecimalField(max_digits=12, decimal_places=2, default=0, db_index=True)
     statut = models.CharField(max_length=20, choices=[
         ('brouillon', 'Brouillon'),
         ('envoyee', 'Envoyée'),
@@ -334,6 +442,7 @@ class Facture(models.Model):
     ], default='brouillon')
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Facture {self.numero} - {self.client.nom} - {self.total} FCFA"
@@ -342,29 +451,33 @@ class Facture(models.Model):
         if not self.numero:
             # Générer automatiquement un numéro de facture
             year = self.date.year if self.date else 2024
-            last_facture = Facture.objects.filter(date__year=year).order_by('-numero').first()
-            if last_facture and last_facture.numero.startswith(str(year)):
-                try:
-                    num = int(last_facture.numero.split('-')[-1]) + 1
-                except (ValueError, IndexError):
-                    num = 1
-            else:
-                num = 1
-            self.numero = f"{year}-FAC-{str(num).zfill(3)}"
-        super().save(*args, **kwargs)
+            self.numero = FactureSequence.reserve(year)[0]
+        if self._state.adding:
+            # pas encore de paiement : le reste est le total
+            self.reste_a_payer = max((self.total or 0) - (self.montant_paye or 0), 0)
+            super().save(*args, **kwargs)
+            return
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if update_fields is None or {'total', 'montant_paye', 'reste_a_payer'} & set(update_fields):
+                # montant payé relu en base et non repris de l'instance : un
+                # paiement a pu être enregistré depuis son chargement
+                from .facturation import refresh_payment_totals
+                refresh_payment_totals([self.pk])
+                self.refresh_from_db(fields=['montant_paye', 'reste_a_payer'])
 
     @property
     def total_payments(self):
-        from django.db.models import Sum
-        total = self.payments.aggregate(s=Sum('montant'))['s'] if hasattr(self, 'payments') else 0
-        return total or 0
+        return self.montant_paye or 0
 
-    @property
-    def reste_a_payer(self):
-        try:
-            return max(self.total - self.total_payments, 0)
-        except Exception:
-            return self.total
+    class Meta:
+        indexes = [
+            models.Index(fields=['date'], name='facture_date_idx'),
+            models.Index(fields=['statut', 'date'], name='facture_statut_date_idx'),
+            # liste des factures : pagination par curseur sur (created_at, id)
+            models.Index(fields=['created_at'], name='facture_created_idx'),
+        ]
 
 
 class FactureLine(models.Model):
@@ -397,6 +510,9 @@ class Payment(models.Model):
     date = models.DateField()
     mode = models.CharField(max_length=20, choices=MODE_CHOICES, default='virement')
     reference = models.CharField(max_length=200, blank=True)
+    # identifiant bancaire de l'opération (FITID OFX, colonne id du CSV) :
+    # un relevé rechargé ne crée pas deux fois le même paiement
+    bank_id = models.CharField(max_length=255, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='payments_created')
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -406,6 +522,11 @@ class Payment(models.Model):
     class Meta:
         verbose_name = 'Paiement'
         verbose_name_plural = 'Paiements'
+        indexes = [
+            models.Index(fields=['facture', 'date'], name='payment_facture_date_idx'),
+            models.Index(fields=['date'], name='payment_date_idx'),
+            models.Index(fields=['facture', 'bank_id'], name='payment_facture_bank_id_idx'),
+        ]
 
 
 class FactureActionLog(models.Model):
@@ -430,6 +551,55 @@ class FactureActionLog(models.Model):
         verbose_name = 'Journal action facture'
         verbose_name_plural = 'Journaux actions facture'
 
+class PayrollRun(models.Model):
+    """Paie d'un mois réglée en une fois : en-tête des paiements créés (audit, annulation)."""
+    STATUT_CHOICES = [
+        ('valide', 'Validée'),
+        ('annulee', 'Annulée'),
+    ]
+
+    periode = models.CharField(max_length=7, help_text='Mois payé (AAAA-MM)')
+    chantier = models.ForeignKey(Chantier, on_delete=models.SET_NULL, null=True, blank=True, related_name='paies')
+    date = models.DateField()
+    mode = models.CharField(max_length=20, default='virement')
+    nb_paiements = models.PositiveIntegerField(default=0)
+    montant_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    statut = models.CharField(max_length=10, choices=STATUT_CHOICES, default='valide')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='paies_lancees')
+    created_at = models.DateTimeField(auto_now_add=True)
+    annulee_par = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='paies_annulees')
+    annulee_le = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Paie {self.periode} - {self.nb_paiements} paiement(s) - {self.montant_total} FCFA"
+
+    class Meta:
+        verbose_name = 'Paie mensuelle'
+        verbose_name_plural = 'Paies mensuelles'
+
+
+class MonthlyPayroll(models.Model):
+    """Paie calculée d'un mois pour un membre du personnel (voir core.payroll)."""
+    personnel = models.ForeignKey(Personnel, on_delete=models.CASCADE, related_name='paies_mensuelles')
+    periode = models.CharField(max_length=7, help_text='Mois (AAAA-MM)')
+    # jours pointés PRESENT ou RETARD dans le mois
+    jours_travailles = models.PositiveIntegerField(default=0)
+    salaire_base = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    prime = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    montant_du = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.personnel} - {self.periode} : {self.montant_du} FCFA"
+
+    class Meta:
+        verbose_name = 'Paie calculée'
+        verbose_name_plural = 'Paies calculées'
+        constraints = [
+            models.UniqueConstraint(fields=['periode', 'personnel'], name='unique_payroll_per_month'),
+        ]
+
+
 class PersonnelPayment(models.Model):
     MODE_CHOICES = [
         ('espece', 'Espèces'),
@@ -448,13 +618,71 @@ class PersonnelPayment(models.Model):
     note = models.TextField(blank=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='personnel_payments_created')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Paie mensuelle qui a créé ce paiement (None : saisi individuellement)
+    run = models.ForeignKey(PayrollRun, on_delete=models.SET_NULL, null=True, blank=True, related_name='paiements')
+    # Chantier imputé (chantier actuel de la personne au moment du paiement)
+    chantier = models.ForeignKey(Chantier, on_delete=models.SET_NULL, null=True, blank=True, related_name='paiements_personnel')
 
     def __str__(self):
         return f"Paiement {self.montant} - {self.personnel.user.get_full_name()} ({self.date})"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.chantier_id is None:
+            self.chantier_id = Personnel.objects.filter(pk=self.personnel_id).values_list('chantier_actuel_id', flat=True).first()
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Paiement Personnel'
         verbose_name_plural = 'Paiements Personnel'
+        indexes = [
+            models.Index(fields=['personnel', 'date'], name='ppayment_personnel_date_idx'),
+            models.Index(fields=['chantier', 'date'], name='ppayment_chantier_date_idx'),
+        ]
+
+
+class ChantierCostMonth(models.Model):
+    """Coûts et facturation d'un chantier sur un mois (voir core.ledger)."""
+    chantier = models.ForeignKey(Chantier, on_delete=models.CASCADE, related_name='couts_mensuels')
+    periode = models.CharField(max_length=7, help_text='Mois (AAAA-MM)')
+    main_oeuvre = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    jours_homme = models.PositiveIntegerField(default=0)
+    materiaux = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    facture = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.chantier.nom} - {self.periode}"
+
+    class Meta:
+        verbose_name = 'Coût mensuel de chantier'
+        verbose_name_plural = 'Coûts mensuels de chantier'
+        constraints = [
+            models.UniqueConstraint(fields=['chantier', 'periode'], name='unique_chantier_cost_month'),
+        ]
+
+
+class MonthlyFinanceSummary(models.Model):
+    """Synthèse financière d'un mois par client et chantier (voir core.finance)."""
+    periode = models.CharField(max_length=7, help_text='Mois (AAAA-MM)')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, null=True, blank=True, related_name='syntheses_mensuelles')
+    chantier = models.ForeignKey(Chantier, on_delete=models.CASCADE, null=True, blank=True, related_name='syntheses_mensuelles')
+    # factures du mois (hors annulées) et leur reste à payer actuel
+    facture = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    reste_du = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # paiements clients et paiements du personnel datés du mois
+    encaisse = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paie = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Synthèse {self.periode} - {self.client or '-'} / {self.chantier or '-'}"
+
+    class Meta:
+        verbose_name = 'Synthèse financière mensuelle'
+        verbose_name_plural = 'Synthèses financières mensuelles'
+        indexes = [
+            models.Index(fields=['periode'], name='finance_periode_idx'),
+        ]
 
 
 class Rapport(models.Model):
@@ -472,6 +700,7 @@ class Rapport(models.Model):
     auteur = models.ForeignKey(User, on_delete=models.CASCADE, related_name='rapports')
     chantier = models.ForeignKey(Chantier, on_delete=models.SET_NULL, null=True, blank=True, related_name='rapports')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.date} - {self.titre}"
@@ -479,3 +708,7 @@ class Rapport(models.Model):
     class Meta:
         verbose_name = "Rapport"
         verbose_name_plural = "Rapports"
+        indexes = [
+            models.Index(fields=['auteur', 'created_at'], name='rapport_auteur_created_idx'),
+            models.Index(fields=['chantier', 'created_at'], name='rapport_chantier_created_idx'),
+        ]
@@ -0,0 +1,348 @@
+"""Calculs de paie du personnel.
+
+Paie d'un mois (`compute_payroll`) : les jours pointés PRESENT ou RETARD
+dans le mois (`Presence`, reliée au `Personnel` par l'utilisateur de
+l'`Employee`) sont comptés en une requête groupée. Le salaire de base est
+le `salaire_mensuel` d'un chef de chantier qui en a un, sinon
+`taux_journalier * jours` ; les chefs de chantier touchent en plus leur
+`prime_responsabilite`. Le résultat est enregistré dans `MonthlyPayroll`
+(une ligne par personne et par mois), que les pages de paie lisent
+directement. Il est recalculé à chaque saisie de présence ou modification
+du personnel (voir core.signals et core.presences) et par la commande
+`compute_payroll` ; les lectures n'écrivent jamais : sans ligne pour le mois,
+elles calculent le même montant à la volée (`payroll_expressions`).
+
+Sans mois de référence, le net attendu reste le forfait
+`taux_journalier * JOURS_OUVRES_MOIS` (`expected_net` en Python,
+`expected_net_expression` en SQL).
+
+`run_payroll` règle un mois entier en une transaction : les nets restant
+dus sont calculés en une requête, les paiements créés par `bulk_create` et
+rattachés à un en-tête `PayrollRun`, annulable par `cancel_payroll_run`.
+"""
+import calendar
+import datetime
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .facturation import money
+from .models import MonthlyPayroll, PayrollRun, Personnel, PersonnelPayment, Presence
+
+
+JOURS_OUVRES_MOIS = 22
+
+# Taille des lots lus en base lors des exports en flux
+EXPORT_CHUNK_SIZE = 2000
+
+# Taille des lots d'insertion d'une paie mensuelle
+PAYROLL_BATCH_SIZE = 500
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+# Statuts de présence qui comptent comme un jour travaillé
+JOURS_PAYES = ('PRESENT', 'RETARD')
+
+MODES = dict(PersonnelPayment.MODE_CHOICES)
+
+
+class PayrollError(ValueError):
+    """Paie refusée (message affichable à l'utilisateur)."""
+
+
+def expected_net(personnel):
+    """Net mensuel attendu pour un `Personnel` déjà chargé."""
+    try:
+        if personnel.role == 'chef_chantier' and getattr(personnel, 'salaire_mensuel', None):
+            return Decimal(personnel.salaire_mensuel or 0)
+        taux = Decimal(getattr(personnel, 'taux_journalier', 0) or 0)
+        return taux * Decimal(JOURS_OUVRES_MOIS)
+    except Exception:
+        return Decimal(0)
+
+
+def expected_net_expression():
+    """Équivalent SQL de `expected_net`, utilisable dans `annotate()`."""
+    return Case(
+        When(role='chef_chantier', salaire_mensuel__gt=0, then=F('salaire_mensuel')),
+        default=Coalesce(F('taux_journalier'), Value(Decimal(0)), output_field=MONEY) * Value(Decimal(JOURS_OUVRES_MOIS)),
+        output_field=MONEY,
+    )
+
+
+def month_bounds(month):
+    """Convertir 'YYYY-MM' en (premier jour, dernier jour). Lève ValueError si invalide."""
+    year, mon = (int(part) for part in month.split('-'))
+    return datetime.date(year, mon, 1), datetime.date(year, mon, calendar.monthrange(year, mon)[1])
+
+
+def month_of(date):
+    """'YYYY-MM' d'une date (ou d'une chaîne ISO assignée avant le save), None sans date."""
+    return str(date)[:7] if date else None
+
+
+def current_periode():
+    return timezone.localdate().strftime('%Y-%m')
+
+
+def payroll_expressions(periode):
+    """Expressions SQL de la paie de `periode` pour une requête sur `Personnel`.
+
+    {'jours_travailles', 'salaire_base', 'prime', 'montant_du'} : les jours
+    sont comptés par sous-requête corrélée, si bien que ces expressions se
+    combinent sans doublons avec d'autres agrégats (paiements).
+    """
+    first_day, last_day = month_bounds(periode)
+    days = (
+        Presence.objects.filter(employee__user=OuterRef('user'), date__range=(first_day, last_day), statut__in=JOURS_PAYES)
+        .order_by().values('employee__user')
+        # un jour pointé sur deux chantiers ne compte qu'une fois
+        .annotate(n=Count('date', distinct=True)).values('n')[:1]
+    )
+    jours = Coalesce(Subquery(days), Value(0), output_field=IntegerField())
+    base = Case(
+        When(role='chef_chantier', salaire_mensuel__gt=0, then=F('salaire_mensuel')),
+        default=Coalesce(F('taux_journalier'), Value(Decimal(0)), output_field=MONEY) * jours,
+        output_field=MONEY,
+    )
+    prime = Case(
+        When(role='chef_chantier', then=Coalesce(F('prime_responsabilite'), Value(Decimal(0)), output_field=MONEY)),
+        default=Value(Decimal(0)),
+        output_field=MONEY,
+    )
+    return {
+        'jours_travailles': jours,
+        'salaire_base': base,
+        'prime': prime,
+        'montant_du': ExpressionWrapper(base + prime, output_field=MONEY),
+    }
+
+
+def compute_payroll(periode, personnel_ids=None):
+    """Calculer et enregistrer `MonthlyPayroll` pour `periode` (AAAA-MM).
+
+    Une requête sur le personnel actif (`payroll_expressions`), puis un seul
+    upsert. `personnel_ids` limite le calcul à ces personnes (saisie de
+    présence, fiche modifiée). Retourne le nombre de lignes écrites.
+    """
+    expressions = payroll_expressions(periode)
+    qs = Personnel.objects.filter(est_actif=True)
+    if personnel_ids is not None:
+        qs = qs.filter(pk__in=personnel_ids)
+    rows = qs.annotate(
+        jours=expressions['jours_travailles'],
+        base=expressions['salaire_base'],
+        prime_chef=expressions['prime'],
+    ).values_list('pk', 'jours', 'base', 'prime_chef')
+
+    now = timezone.now()
+    lines = []
+    for pk, jours, base, prime in rows:
+        base, prime = money(base or 0), money(prime or 0)
+        lines.append(MonthlyPayroll(
+            personnel_id=pk, periode=periode, jours_travailles=jours,
+            salaire_base=base, prime=prime, montant_du=base + prime, updated_at=now,
+        ))
+    MonthlyPayroll.objects.bulk_create(
+        lines,
+        batch_size=PAYROLL_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['periode', 'personnel'],
+        update_fields=['jours_travailles', 'salaire_base', 'prime', 'montant_du', 'updated_at'],
+    )
+
+    # personnel désactivé depuis le dernier calcul : plus rien de dû
+    stale = MonthlyPayroll.objects.filter(periode=periode).exclude(personnel__est_actif=True)
+    if personnel_ids is not None:
+        stale = stale.filter(personnel_id__in=personnel_ids)
+    stale.delete()
+    return len(lines)
+
+
+def compute_payroll_for_employees(periode, employee_ids):
+    """Recalculer `periode` pour le personnel lié à ces `Employee` (saisie de présence)."""
+    return compute_payroll(periode, Personnel.objects.filter(user__employee__in=list(employee_ids)).values('pk'))
+
+
+def expected_for(personnel, periode=None):
+    """Net attendu de `personnel` pour `periode` (table mensuelle), sinon le forfait."""
+    if not periode:
+        return expected_net(personnel)
+    try:
+        month_bounds(periode)
+    except ValueError:
+        return expected_net(personnel)
+    montant = (
+        Personnel.objects.filter(pk=personnel.pk)
+        .annotate(montant=monthly_payroll_expression(periode))
+        .values_list('montant', flat=True).first()
+    )
+    return montant if montant is not None else Decimal(0)
+
+
+def monthly_payroll_expression(periode, field='montant_du', output_field=MONEY):
+    """Sous-requête : `MonthlyPayroll.<field>` pour `periode`.
+
+    Sans ligne (mois pas encore calculé), la valeur est calculée à la volée
+    pour le personnel actif, 0 pour le personnel inactif ; rien n'est écrit.
+    """
+    line = MonthlyPayroll.objects.filter(personnel=OuterRef('pk'), periode=periode).values(field)[:1]
+    computed = Case(When(est_actif=True, then=payroll_expressions(periode)[field]), default=Value(0), output_field=output_field)
+    return Coalesce(Subquery(line), computed, output_field=output_field)
+
+
+def payroll_summary(date_from=None, date_to=None, chantier_id=None, periode=None):
+    """Personnel annoté de `expected` (net attendu) et `paid` (payé sur la période).
+
+    Une seule requête : utilisateur et chantier joints, paiements agrégés
+    avec un `Sum` filtré sur la période. Avec `periode`, le net attendu et
+    les jours travaillés (`jours`) sont lus dans `MonthlyPayroll`.
+    """
+    paid_filter = Q()
+    if date_from:
+        paid_filter &= Q(paiements__date__gte=date_from)
+    if date_to:
+        paid_filter &= Q(paiements__date__lte=date_to)
+
+    qs = Personnel.objects.select_related('user', 'chantier_actuel')
+    if periode:
+        qs = qs.annotate(
+            expected=monthly_payroll_expression(periode),
+            jours=monthly_payroll_expression(periode, 'jours_travailles', IntegerField()),
+        )
+    else:
+        qs = qs.annotate(expected=expected_net_expression())
+    qs = qs.annotate(
+        paid=Coalesce(Sum('paiements__montant', filter=paid_filter), Value(Decimal(0)), output_field=MONEY),
+    ).order_by('user__last_name', 'pk')
+    if chantier_id:
+        qs = qs.filter(chantier_actuel_id=chantier_id)
+    return qs
+
+
+def payment_status(expected, paid):
+    return 'Payé' if paid >= expected and expected > 0 else 'En attente'
+
+
+def summary_csv_rows(date_from=None, date_to=None, chantier_id=None, periode=None):
+    """Lignes CSV du récapitulatif par personne, lues par lots."""
+    qs = payroll_summary(date_from, date_to, chantier_id, periode)
+    for person in qs.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [
+            person.user.get_full_name(),
+            person.get_role_display(),
+            getattr(person.chantier_actuel, 'nom', ''),
+            int(person.expected),
+            int(person.paid),
+            payment_status(person.expected, person.paid),
+        ]
+
+
+def payment_detail_csv_rows(date_from=None, date_to=None, chantier_id=None):
+    """Lignes CSV détaillées : un paiement par ligne, sur la période."""
+    qs = PersonnelPayment.objects.all()
+    if date_from:
+        qs = qs.filter(date__gte=date_from)
+    if date_to:
+        qs = qs.filter(date__lte=date_to)
+    if chantier_id:
+        qs = qs.filter(personnel__chantier_actuel_id=chantier_id)
+
+    roles = dict(Personnel.ROLE_CHOICES)
+    modes = dict(PersonnelPayment.MODE_CHOICES)
+    values = qs.order_by('date', 'pk').values_list(
+        'date', 'personnel__user__first_name', 'personnel__user__last_name', 'personnel__role',
+        'personnel__chantier_actuel__nom', 'montant', 'mode', 'periode', 'reference',
+    )
+    for date, first_name, last_name, role, chantier, montant, mode, periode, reference in values.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [
+            date.isoformat(),
+            f"{first_name} {last_name}".strip(),
+            roles.get(role, role),
+            chantier or '',
+            int(montant),
+            modes.get(mode, mode),
+            periode,
+            reference,
+        ]
+
+
+def payroll_due(periode, chantier_id=None):
+    """Personnel actif restant à payer pour `periode` (AAAA-MM), en une requête.
+
+    Annoté de `expected` (net attendu, lu dans `MonthlyPayroll`), `paid`
+    (déjà payé au titre de la période, quelle que soit la date du paiement)
+    et `due` (reste à payer).
+    """
+    qs = Personnel.objects.filter(est_actif=True).annotate(
+        expected=monthly_payroll_expression(periode),
+        paid=Coalesce(Sum('paiements__montant', filter=Q(paiements__periode=periode)), Value(Decimal(0)), output_field=MONEY),
+    ).annotate(
+        due=ExpressionWrapper(F('expected') - F('paid'), output_field=MONEY),
+    ).filter(due__gt=0).order_by('pk')
+    if chantier_id:
+        qs = qs.filter(chantier_actuel_id=chantier_id)
+    return qs
+
+
+def run_payroll(periode, chantier_id=None, user=None, mode='virement', date=None):
+    """Payer en une transaction tout le personnel restant dû pour `periode`.
+
+    Les personnes déjà entièrement payées pour la période sont ignorées ;
+    les paiements partiels sont complétés. Retourne le `PayrollRun` créé, ou
+    None s'il n'y avait rien à payer. Lève ValueError si `periode` est invalide,
+    PayrollError si `mode` est inconnu (bulk_create ne valide pas les choix).
+    """
+    month_bounds(periode)
+    if mode not in MODES:
+        raise PayrollError(f"Mode de paiement inconnu : {mode!r} ({', '.join(MODES)}).")
+    date = date or timezone.localdate()
+    username = user.username if user else 'système'
+    with transaction.atomic():
+        # L'en-tête est écrit avant la lecture des restes dus : deux paies
+        # lancées en même temps sont ainsi sérialisées par le verrou d'écriture.
+        run = PayrollRun.objects.create(periode=periode, chantier_id=chantier_id, date=date, mode=mode, created_by=user)
+        payments = [
+            PersonnelPayment(
+                personnel_id=pk,
+                chantier_id=chantier_actuel_id,
+                montant=due,
+                date=date,
+                mode=mode,
+                periode=periode,
+                note=f"Paie {periode} lancée par {username}",
+                created_by=user,
+                run=run,
+            )
+            for pk, chantier_actuel_id, due in payroll_due(periode, chantier_id).values_list('pk', 'chantier_actuel_id', 'due')
+        ]
+        if not payments:
+            transaction.set_rollback(True)
+            return None
+        PersonnelPayment.objects.bulk_create(payments, batch_size=PAYROLL_BATCH_SIZE)
+        # bulk_create ne déclenche pas les signaux (import local : ledger et
+        # finance importent ce module)
+        from . import finance, ledger
+        ledger.mark_dirty(*(ledger.cell(p.chantier_id, date) for p in payments))
+        finance.mark_months(date)
+        run.nb_paiements = len(payments)
+        run.montant_total = sum((p.montant for p in payments), Decimal(0))
+        run.save(update_fields=['nb_paiements', 'montant_total'])
+    return run
+
+
+def cancel_payroll_run(run, user=None):
+    """Annuler une paie mensuelle : ses paiements sont supprimés, l'en-tête conservé."""
+    with transaction.atomic():
+        run = PayrollRun.objects.select_for_update().get(pk=run.pk)
+        if run.statut == 'annulee':
+            return 0
+        deleted, _ = PersonnelPayment.objects.filter(run=run).delete()
+        run.statut = 'annulee'
+        run.annulee_par = user
+        run.annulee_le = timezone.now()
+        run.save(update_fields=['statut', 'annulee_par', 'annulee_le'])
+    return deleted
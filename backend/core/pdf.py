@@ -0,0 +1,290 @@
+"""Factures PDF : cache disque adressé par contenu et rendu hors du thread web.
+
+Le PDF est produit à partir d'un gabarit d'impression dédié
+(`core/facture_print.html`) : autonome, sans feuille de style externe ni
+dépendance à la requête. Il est compilé une fois par processus, les URI
+statiques sont résolues une fois (`resolve_uri`) et les polices de
+`PDF_FONTS` enregistrées au démarrage des processus de rendu.
+
+Le nom du fichier en cache est un hash du contenu affiché (champs de la
+facture et du client, chantier, lignes, paiements, version du gabarit,
+montants masqués ou non) : tant que rien ne change, le PDF déjà produit est
+servi tel quel. Toute écriture sur la facture, ses lignes ou ses paiements
+supprime les PDF de la facture (voir core.signals).
+
+`xhtml2pdf` est gourmand en CPU : le rendu tourne dans un pool de processus
+local (`PDF_WORKERS`). Deux demandes simultanées du même PDF partagent le
+même travail ; au-delà de `PDF_WAIT_SECONDS`, `PdfPending` est levée et la
+vue répond 202 en invitant à réessayer. `iter_pdfs` alimente le pool en
+continu pour les exports par lot.
+"""
+import collections
+import concurrent.futures
+import functools
+import glob
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template.loader import get_template
+
+try:
+    from xhtml2pdf import pisa
+except Exception:
+    pisa = None
+
+
+PRINT_TEMPLATE = 'core/facture_print.html'
+CACHE_DIR = getattr(settings, 'PDF_CACHE_DIR', os.path.join(settings.BASE_DIR, 'tmp', 'pdf'))
+WORKERS = getattr(settings, 'PDF_WORKERS', 2)
+WAIT_SECONDS = getattr(settings, 'PDF_WAIT_SECONDS', 15)
+# Polices TrueType à embarquer : {nom de famille CSS: chemin du .ttf}
+FONTS = getattr(settings, 'PDF_FONTS', {})
+
+
+class PdfError(Exception):
+    """Le moteur PDF n'a pas pu produire le document."""
+
+
+class PdfPending(Exception):
+    """Le PDF est toujours en cours de génération."""
+
+
+def available():
+    return pisa is not None
+
+
+# -- gabarit d'impression ----------------------------------------------------
+
+@functools.lru_cache(maxsize=None)
+def print_template():
+    """Gabarit d'impression compilé (une fois par processus)."""
+    return get_template(PRINT_TEMPLATE)
+
+
+@functools.lru_cache(maxsize=None)
+def template_version():
+    """Hash de la source du gabarit d'impression (lu une fois par processus)."""
+    with open(print_template().origin.name, 'rb') as fh:
+        return hashlib.sha256(fh.read()).hexdigest()[:16]
+
+
+def hides_amounts(user):
+    # même règle que la page détail : les chefs ne voient pas les montants
+    return getattr(getattr(user, 'userprofile', None), 'role', None) == 'chef'
+
+
+def render_html(facture, masquer_montants):
+    return print_template().render({
+        'facture': facture,
+        'lignes': facture.lignes.order_by('pk'),
+        'payments': facture.payments.order_by('date', 'pk'),
+        'masquer_montants': masquer_montants,
+        'font_family': next(iter(FONTS), 'Helvetica'),
+    })
+
+
+# -- clé de contenu -----------------------------------------------------------
+
+
+def _fields(obj, exclude=('created_at', 'updated_at')):
+    if obj is None:
+        return None
+    return {f.attname: getattr(obj, f.attname) for f in obj._meta.concrete_fields if f.attname not in exclude}
+
+
+def content_key(facture, masquer_montants):
+    """Hash de tout ce qui apparaît dans le PDF de `facture`."""
+    chantier = facture.chantier
+    payload = {
+        'template': template_version(),
+        'fonts': FONTS,
+        'masquer_montants': masquer_montants,
+        'facture': _fields(facture),
+        'client': _fields(facture.client),
+        'chantier': [chantier.nom, chantier.chef_chantier.get_full_name() if chantier.chef_chantier else None] if chantier else None,
+        'lignes': list(facture.lignes.order_by('pk').values_list('pk', 'description', 'quantite', 'prix_unitaire', 'montant')),
+        'payments': list(facture.payments.order_by('pk').values_list(
+            'pk', 'date', 'montant', 'mode', 'reference', 'created_by__first_name', 'created_by__last_name',
+        )),
+    }
+    encoded = json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def cache_path(facture_pk, key):
+    return os.path.join(CACHE_DIR, f'facture-{facture_pk}-{key}.pdf')
+
+
+def purge(facture_pk):
+    """Supprimer tous les PDF en cache d'une facture."""
+    for path in glob.glob(os.path.join(CACHE_DIR, f'facture-{facture_pk}-*.pdf')):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# -- rendu dans le pool de processus -----------------------------------------
+
+@functools.lru_cache(maxsize=256)
+def resolve_uri(uri):
+    """URI statique/média -> chemin disque, mémorisé (pas de `finders.find` à chaque rendu)."""
+    if uri.startswith(settings.STATIC_URL):
+        path = finders.find(uri.replace(settings.STATIC_URL, ''))
+        if path:
+            return path
+    if uri.startswith(settings.MEDIA_URL):
+        media_path = uri.replace(settings.MEDIA_URL, '')
+        return os.path.join(settings.MEDIA_ROOT, media_path)
+    return uri
+
+
+def link_callback(uri, rel):
+    return resolve_uri(uri)
+
+
+def register_fonts():
+    from reportlab.lib.fonts import addMapping
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    for family, path in FONTS.items():
+        pdfmetrics.registerFont(TTFont(family, path))
+        for bold in (0, 1):
+            for italic in (0, 1):
+                addMapping(family, bold, italic, family)
+
+
+def _init_worker():
+    # Processus lancés par "spawn" : Django doit être initialisé
+    import django
+    django.setup()
+    # polices chargées une fois par processus, pas à chaque document
+    register_fonts()
+
+
+def _render(html, path):
+    """Exécuté dans un processus du pool : HTML -> fichier PDF (écriture atomique)."""
+    result = BytesIO()
+    try:
+        pdf = pisa.CreatePDF(src=html, dest=result, link_callback=link_callback)
+    except Exception as e:
+        # xhtml2pdf échoue parfois sur du HTML qu'il ne sait pas mettre en page
+        raise PdfError(f'Erreur lors de la génération du PDF ({e!r})')
+    if pdf.err:
+        raise PdfError('Erreur lors de la génération du PDF')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as fh:
+        fh.write(result.getvalue())
+    os.replace(tmp_path, path)
+    return path
+
+
+_lock = threading.Lock()
+_executor = None
+_pending = {}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ProcessPoolExecutor(max_workers=WORKERS, initializer=_init_worker)
+    return _executor
+
+
+def _forward(future, job):
+    """Reporter le résultat du rendu `job` (pool) sur `future`."""
+    error = job.exception()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(job.result())
+
+
+def _submit(path, render_html):
+    global _executor
+    # le verrou ne couvre que la réservation de `path` : le rendu HTML (requêtes
+    # et gabarit) se fait hors verrou, les autres documents ne l'attendent pas
+    with _lock:
+        future = _pending.get(path)
+        if future is not None:
+            return future
+        future = _pending[path] = concurrent.futures.Future()
+
+    def forget(done):
+        with _lock:
+            if _pending.get(path) is done:
+                del _pending[path]
+
+    future.add_done_callback(forget)
+    try:
+        html = render_html()
+        with _lock:
+            try:
+                job = _get_executor().submit(_render, html, path)
+            except BrokenProcessPool:
+                # un processus du pool est mort : repartir d'un pool neuf
+                _executor = None
+                job = _get_executor().submit(_render, html, path)
+    except Exception as e:
+        # les appels qui attendent le même chemin voient l'erreur eux aussi
+        future.set_exception(e)
+        raise
+    job.add_done_callback(functools.partial(_forward, future))
+    return future
+
+
+def request_pdf(facture, masquer_montants=False):
+    """`Future` du chemin du PDF de `facture` (déjà résolu s'il est en cache).
+
+    Le HTML n'est rendu que si le PDF n'est ni en cache ni en cours.
+    """
+    path = cache_path(facture.pk, content_key(facture, masquer_montants))
+    if os.path.exists(path):
+        future = concurrent.futures.Future()
+        future.set_result(path)
+        return future
+    return _submit(path, functools.partial(render_html, facture, masquer_montants))
+
+
+def iter_pdfs(factures, masquer_montants=False, window=None):
+    """Produire `(facture, chemin ou PdfError)` dans l'ordre de `factures`.
+
+    Jusqu'à `window` rendus sont lancés d'avance dans le pool, si bien que les
+    PDF suivants sont calculés pendant que le précédent est consommé.
+    """
+    window = window or WORKERS * 2
+    queue = collections.deque()
+    factures = iter(factures)
+    while True:
+        while len(queue) < window:
+            facture = next(factures, None)
+            if facture is None:
+                break
+            queue.append((facture, request_pdf(facture, masquer_montants)))
+        if not queue:
+            return
+        facture, future = queue.popleft()
+        try:
+            yield facture, future.result()
+        except (PdfError, BrokenProcessPool) as e:
+            yield facture, PdfError(str(e))
+
+
+def facture_pdf_path(facture, masquer_montants=False, timeout=WAIT_SECONDS):
+    """Chemin du PDF de `facture`, généré si besoin (attente bornée par `timeout`)."""
+    future = request_pdf(facture, masquer_montants)
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        raise PdfPending()
+    except BrokenProcessPool:
+        raise PdfError('Erreur lors de la génération du PDF')
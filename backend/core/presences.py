@@ -0,0 +1,90 @@
+"""Appel quotidien : présences d'une équipe saisies en une fois.
+
+Le chef envoie le statut de tous les employés d'un chantier pour une date.
+Les employés sont vérifiés en une requête contre les affectations actives
+du chantier à cette date, puis les lignes `Presence` sont insérées ou mises
+à jour par un seul `bulk_create(update_conflicts=True)` sur la contrainte
+unique (employé, chantier, date) : renvoyer l'appel corrige les statuts
+sans créer de doublons. `bulk_create` ne déclenche pas les signaux : la
+paie du mois des employés pointés et le livre des coûts du chantier sont
+mis à jour ici.
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from . import ledger
+from .models import Affectation, Employee, Presence
+from .payroll import compute_payroll_for_employees
+
+
+ROLL_CALL_BATCH_SIZE = 500
+
+STATUTS = dict(Presence.STATUT_CHOICES)
+
+
+class RollCallError(ValueError):
+    """Appel invalide (message affichable à l'utilisateur)."""
+
+
+def active_affectations(chantier, date):
+    """Affectations actives de `chantier` couvrant `date`."""
+    return Affectation.objects.filter(chantier=chantier, actif=True, date_debut__lte=date).filter(
+        Q(date_fin__isnull=True) | Q(date_fin__gte=date)
+    )
+
+
+def roll_call(chantier, date):
+    """Équipe affectée au chantier à `date` avec le statut déjà saisi (ou None)."""
+    statuts = dict(Presence.objects.filter(chantier=chantier, date=date).values_list('employee_id', 'statut'))
+    team = Employee.objects.filter(
+        pk__in=active_affectations(chantier, date).values('employee_id'),
+    ).order_by('nom', 'prenom', 'pk')
+    return [(employee, statuts.get(employee.pk)) for employee in team]
+
+
+def parse_entries(entries):
+    """[{'employee': id, 'statut': 'PRESENT'}, ...] -> {id employé: statut}."""
+    if not isinstance(entries, list) or not entries:
+        raise RollCallError('Liste de présences vide.')
+    statuts = {}
+    for index, entry in enumerate(entries, start=1):
+        try:
+            employee_id = int(entry['employee'])
+            statut = str(entry['statut']).upper()
+        except (KeyError, TypeError, ValueError):
+            raise RollCallError(f'Ligne {index} : "employee" (entier) et "statut" attendus.')
+        if statut not in STATUTS:
+            raise RollCallError(f"Ligne {index} : statut inconnu {entry['statut']!r} ({', '.join(STATUTS)}).")
+        if employee_id in statuts:
+            raise RollCallError(f'Ligne {index} : employé {employee_id} présent deux fois.')
+        statuts[employee_id] = statut
+    return statuts
+
+
+def record_roll_call(chantier, date, statuts, valide_par=None):
+    """Enregistrer l'appel `{id employé: statut}` ; retourne le nombre de lignes écrites.
+
+    Lève RollCallError si un employé n'est pas affecté au chantier à cette date.
+    """
+    if valide_par is not None and valide_par.role != 'CHEF_CHANTIER':
+        # même règle que Presence.clean (non appelée par bulk_create)
+        valide_par = None
+    assigned = set(active_affectations(chantier, date).filter(employee_id__in=list(statuts)).values_list('employee_id', flat=True))
+    unknown = sorted(set(statuts) - assigned)
+    if unknown:
+        raise RollCallError(f"Employé(s) non affecté(s) à ce chantier le {date:%d/%m/%Y} : {', '.join(map(str, unknown))}")
+
+    with transaction.atomic():
+        Presence.objects.bulk_create(
+            [
+                Presence(employee_id=employee_id, chantier=chantier, date=date, statut=statut, valide_par=valide_par)
+                for employee_id, statut in statuts.items()
+            ],
+            batch_size=ROLL_CALL_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['employee', 'chantier', 'date'],
+            update_fields=['statut', 'valide_par'],
+        )
+        compute_payroll_for_employees(f'{date:%Y-%m}', statuts)
+        ledger.mark_dirty(ledger.cell(chantier.pk, date))
+    return len(statuts)
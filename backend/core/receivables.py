@@ -0,0 +1,90 @@
+"""Balance âgée des créances clients.
+
+Le reste à payer des factures ouvertes (`Facture.reste_a_payer`, maintenu à
+chaque paiement) est réparti par ancienneté de l'échéance, par client ou
+par chantier, en une seule requête groupée : un `Sum` filtré par tranche.
+
+L'échéance d'une facture est `date_echeance`, à défaut sa `date`. Les
+factures pas encore échues sont comptées dans la première tranche.
+"""
+import datetime
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Facture
+
+
+# (clé, libellé, âge minimum, âge maximum) — âge en jours après l'échéance
+BUCKETS = (
+    ('b0_30', '0-30 jours', None, 30),
+    ('b31_60', '31-60 jours', 31, 60),
+    ('b61_90', '61-90 jours', 61, 90),
+    ('b90_plus', '+90 jours', 91, None),
+)
+
+# Regroupements possibles : (colonne id, colonne libellé, libellé si vide)
+GROUPS = {
+    'client': ('client_id', 'client__nom', 'Sans client'),
+    'chantier': ('chantier_id', 'chantier__nom', 'Sans chantier'),
+}
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def open_factures():
+    """Factures avec un reste à payer (filtre sur la colonne indexée)."""
+    return Facture.objects.filter(reste_a_payer__gt=0).exclude(statut='annulee')
+
+
+def _bucket_filter(as_of, min_age, max_age):
+    q = Q()
+    if min_age is not None:
+        q &= Q(echeance__lte=as_of - datetime.timedelta(days=min_age))
+    if max_age is not None:
+        q &= Q(echeance__gte=as_of - datetime.timedelta(days=max_age))
+    return q
+
+
+def aging_rows(group='client', as_of=None):
+    """Une ligne par client (ou chantier) : nombre de factures, tranches, total dû."""
+    as_of = as_of or timezone.localdate()
+    id_field, label_field, empty_label = GROUPS[group]
+    tranches = {
+        key: Coalesce(Sum('reste_a_payer', filter=_bucket_filter(as_of, min_age, max_age)), Value(Decimal(0)), output_field=MONEY)
+        for key, _, min_age, max_age in BUCKETS
+    }
+    qs = (
+        open_factures()
+        .annotate(echeance=Coalesce('date_echeance', 'date'))
+        .values(id_field, label_field)
+        .annotate(nb=Count('id'), du=Sum('reste_a_payer'), **tranches)
+        .order_by('-du', label_field)
+    )
+    for row in qs:
+        yield {
+            'id': row[id_field],
+            'nom': row[label_field] or empty_label,
+            'nb': row['nb'],
+            'du': row['du'],
+            **{key: row[key] for key, *_ in BUCKETS},
+        }
+
+
+def aging_totals(rows):
+    totals = {'nb': 0, 'du': Decimal(0), **{key: Decimal(0) for key, *_ in BUCKETS}}
+    for row in rows:
+        for key in totals:
+            totals[key] += row[key]
+    return totals
+
+
+def aging_csv_header(group):
+    return [group.capitalize(), 'Factures'] + [f'{label} (FCFA)' for _, label, *_ in BUCKETS] + ['Total dû (FCFA)']
+
+
+def aging_csv_rows(group='client', as_of=None):
+    for row in aging_rows(group, as_of):
+        yield [row['nom'], row['nb']] + [int(row[key]) for key, *_ in BUCKETS] + [int(row['du'])]
@@ -0,0 +1,97 @@
+"""Réapprovisionnement automatique des matériaux sous leur seuil.
+
+`reorder_candidates` trouve en une requête les matériaux dont le stock est
+au plus `seuil_minimum` (lus dans l'index partiel `materiau_rupture_idx`,
+qui ne contient qu'eux) et qui n'ont aucune commande en cours ;
+`generate_reorders` crée pour eux des commandes « préparée » (brouillons),
+regroupées par fournisseur, par un seul `bulk_create`. Une commande ouverte bloque la suivante : relancer le calcul
+ne commande pas deux fois. Les calculs simultanés (commande planifiée,
+bouton, déclenchement automatique) sont sérialisés par un verrou pris sur
+les matériaux en rupture avant la lecture des commandes ouvertes.
+
+Déclencheurs : la commande `reorder_materiaux` (à planifier, cron ou tâche
+planifiée), le bouton de la liste des matériaux et, si
+`STOCK_AUTO_REORDER` est activé, chaque sortie de stock (core.stock).
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from .models import Commande, Materiau
+from .stock import COMMANDES_EN_COURS
+
+
+AUTO_REORDER = getattr(settings, 'STOCK_AUTO_REORDER', False)
+
+REORDER_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+def reorder_candidates(materiau_ids=None):
+    """Matériaux en rupture sans commande en cours, triés par fournisseur."""
+    open_commandes = Commande.objects.filter(materiau=OuterRef('pk'), statut__in=COMMANDES_EN_COURS)
+    qs = (
+        Materiau.objects.filter(quantite_stock__lte=F('seuil_minimum'))
+        .exclude(Exists(open_commandes))
+        .select_related('fournisseur')
+        .order_by('fournisseur__nom', 'fournisseur_id', 'nom')
+    )
+    if materiau_ids is not None:
+        qs = qs.filter(pk__in=list(materiau_ids))
+    return qs
+
+
+def generate_reorders(user=None, materiau_ids=None, dry_run=False):
+    """Créer les commandes de réapprovisionnement.
+
+    Retourne [(fournisseur ou None, [Commande, ...]), ...] ; avec `dry_run`,
+    les commandes sont calculées sans être enregistrées.
+    """
+    today = timezone.localdate()
+    with transaction.atomic():
+        # écriture neutre d'abord : verrou des lignes (PostgreSQL) ou verrou
+        # d'écriture de la base (SQLite) jusqu'au commit ; un second calcul
+        # attend ici puis voit les commandes créées par le premier
+        locked = Materiau.objects.filter(quantite_stock__lte=F('seuil_minimum'))
+        if materiau_ids is not None:
+            locked = locked.filter(pk__in=list(materiau_ids))
+        locked.update(quantite_stock=F('quantite_stock'))
+        batches = {}
+        for materiau in reorder_candidates(materiau_ids):
+            fournisseur = materiau.fournisseur
+            if fournisseur is None:
+                note = f'Réapprovisionnement automatique du {today:%d/%m/%Y} (sans fournisseur)'
+            else:
+                note = f'Réapprovisionnement automatique du {today:%d/%m/%Y} ({fournisseur.nom})'
+            batches.setdefault(materiau.fournisseur_id, (fournisseur, []))[1].append(Commande(
+                materiau=materiau,
+                quantite=materiau.quantite_recommandee,
+                fournisseur=fournisseur,
+                demandeur=user,
+                statut='preparée',
+                note=note,
+            ))
+        if not dry_run:
+            Commande.objects.bulk_create(
+                [commande for _, commandes in batches.values() for commande in commandes],
+                batch_size=REORDER_BATCH_SIZE,
+            )
+    return list(batches.values())
+
+
+def schedule_reorder(materiau_ids):
+    """Après le commit, commander les matériaux passés sous leur seuil."""
+    materiau_ids = list(materiau_ids)
+
+    def reorder():
+        # le mouvement de stock est déjà validé : un échec ici ne doit pas
+        # faire échouer la requête qui l'a enregistré
+        try:
+            generate_reorders(materiau_ids=materiau_ids)
+        except Exception:
+            logger.exception('Réapprovisionnement automatique impossible (matériaux %s)', materiau_ids)
+    transaction.on_commit(reorder)
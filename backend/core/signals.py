@@ -0,0 +1,176 @@
+"""Récepteurs de signaux de l'application `core`.
+
+Branchés dans `CoreConfig.ready()`.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from . import finance, ledger, pdf
+from .facturation import refresh_payment_totals
+from .metrics import invalidate_dashboard_metrics
+from .models import Chantier, Client, Facture, FactureLine, Fournisseur, Materiau, Payment, Personnel, PersonnelPayment, Presence
+from .payroll import compute_payroll, compute_payroll_for_employees, current_periode, month_of
+
+
+# Modèles dont une écriture rend obsolète l'instantané du tableau de bord
+DASHBOARD_MODELS = (Chantier, Personnel, Materiau, Client, Fournisseur, Facture, Payment)
+
+
+def invalidate_dashboard(sender, **kwargs):
+    # Invalider après le commit : un lecteur concurrent ne doit pas remettre
+    # en cache des valeurs calculées avant que l'écriture soit visible.
+    transaction.on_commit(invalidate_dashboard_metrics)
+
+
+for model in DASHBOARD_MODELS:
+    post_save.connect(invalidate_dashboard, sender=model, dispatch_uid=f'dashboard_metrics_save_{model.__name__}')
+    post_delete.connect(invalidate_dashboard, sender=model, dispatch_uid=f'dashboard_metrics_delete_{model.__name__}')
+
+
+def _payment_facture_ids(instance):
+    # facture du paiement et, s'il a été déplacé, son ancienne facture
+    # (`_previous_placement`, noté par remember_placement avant l'écriture)
+    previous = getattr(instance, '_previous_placement', None)
+    return list({instance.facture_id, previous[0] if previous else None} - {None})
+
+
+def update_facture_balance(sender, instance, **kwargs):
+    # même transaction que l'écriture du paiement
+    facture_ids = _payment_facture_ids(instance)
+    refresh_payment_totals(facture_ids)
+    # paiement retiré ou déplacé : une facture payée qui redevient due
+    # repasse en "envoyée"
+    Facture.objects.filter(pk__in=facture_ids, statut='payee', reste_a_payer__gt=0).update(statut='envoyee', updated_at=timezone.now())
+
+
+post_save.connect(update_facture_balance, sender=Payment, dispatch_uid='facture_balance_save')
+post_delete.connect(update_facture_balance, sender=Payment, dispatch_uid='facture_balance_delete')
+
+
+def purge_facture_pdfs(sender, instance, **kwargs):
+    # le contenu de la facture change : ses PDF en cache sont périmés
+    if sender is Facture:
+        facture_ids = [instance.pk]
+    elif sender is Payment:
+        facture_ids = _payment_facture_ids(instance)
+    else:
+        facture_ids = [instance.facture_id]
+
+    def purge():
+        for facture_id in facture_ids:
+            pdf.purge(facture_id)
+    transaction.on_commit(purge)
+
+
+for model in (Facture, FactureLine, Payment):
+    post_save.connect(purge_facture_pdfs, sender=model, dispatch_uid=f'facture_pdf_save_{model.__name__}')
+    post_delete.connect(purge_facture_pdfs, sender=model, dispatch_uid=f'facture_pdf_delete_{model.__name__}')
+
+
+def touch_personnel(sender, instance, update_fields=None, **kwargs):
+    # /api/personnel/ sérialise le nom et l'email du User : son ETag repose
+    # sur Personnel.updated_at, à avancer quand le User lié change (pas à
+    # chaque connexion, qui n'écrit que last_login)
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    Personnel.objects.filter(user=instance).update(updated_at=timezone.now())
+
+
+post_save.connect(touch_personnel, sender=User, dispatch_uid='personnel_touch_user')
+
+
+def update_payroll_presence(sender, instance, **kwargs):
+    # un jour pointé de plus ou de moins : paie du mois de ce jour et, si la
+    # présence a changé de jour ou d'employé, paie de l'ancien (mois, employé)
+    compute_payroll_for_employees(month_of(instance.date), [instance.employee_id])
+    previous = getattr(instance, '_previous_placement', None)
+    if previous:
+        _, date, employee_id = previous
+        if (month_of(date), employee_id) != (month_of(instance.date), instance.employee_id):
+            compute_payroll_for_employees(month_of(date), [employee_id])
+
+
+post_save.connect(update_payroll_presence, sender=Presence, dispatch_uid='payroll_presence_save')
+post_delete.connect(update_payroll_presence, sender=Presence, dispatch_uid='payroll_presence_delete')
+
+
+def update_payroll_personnel(sender, instance, **kwargs):
+    # taux, salaire ou prime modifiés : seul le mois en cours est recalculé,
+    # les mois passés gardent la paie calculée à l'époque
+    compute_payroll(current_periode(), [instance.pk])
+
+
+post_save.connect(update_payroll_personnel, sender=Personnel, dispatch_uid='payroll_personnel_save')
+
+
+# Champs qui placent une écriture dans les tables matérialisées (livre des
+# coûts, synthèse financière, paie mensuelle) : s'ils changent, l'ancienne
+# place doit aussi être recalculée. Toujours (chantier ou facture, date) en tête.
+PLACEMENT_FIELDS = {
+    Facture: ('chantier_id', 'date'),
+    PersonnelPayment: ('chantier_id', 'date'),
+    Presence: ('chantier_id', 'date', 'employee_id'),
+    Payment: ('facture_id', 'date'),
+}
+
+
+def remember_placement(sender, instance, **kwargs):
+    previous = None
+    if instance.pk:
+        previous = sender.objects.filter(pk=instance.pk).values_list(*PLACEMENT_FIELDS[sender]).first()
+    instance._previous_placement = previous
+
+
+for model in PLACEMENT_FIELDS:
+    pre_save.connect(remember_placement, sender=model, dispatch_uid=f'placement_remember_{model.__name__}')
+
+
+# Modèles datés et rattachés à un chantier qui alimentent le livre des coûts
+LEDGER_MODELS = (Facture, PersonnelPayment, Presence)
+
+
+def update_ledger(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_placement', None)
+    ledger.mark_dirty(ledger.cell(instance.chantier_id, instance.date), ledger.cell(*previous[:2]) if previous else None)
+
+
+for model in LEDGER_MODELS:
+    post_save.connect(update_ledger, sender=model, dispatch_uid=f'ledger_save_{model.__name__}')
+    post_delete.connect(update_ledger, sender=model, dispatch_uid=f'ledger_delete_{model.__name__}')
+
+
+def update_ledger_line(sender, instance, **kwargs):
+    # seules les lignes portant sur un matériau comptent dans le livre
+    if not instance.materiau_id:
+        return
+    facture = Facture.objects.filter(pk=instance.facture_id).values_list('chantier_id', 'date').first()
+    if facture:
+        ledger.mark_dirty(ledger.cell(*facture))
+
+
+post_save.connect(update_ledger_line, sender=FactureLine, dispatch_uid='ledger_save_FactureLine')
+post_delete.connect(update_ledger_line, sender=FactureLine, dispatch_uid='ledger_delete_FactureLine')
+
+
+def update_finance_summary(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_placement', None)
+    finance.mark_months(instance.date, previous[1] if previous else None)
+
+
+for model in (Facture, PersonnelPayment):
+    post_save.connect(update_finance_summary, sender=model, dispatch_uid=f'finance_save_{model.__name__}')
+    post_delete.connect(update_finance_summary, sender=model, dispatch_uid=f'finance_delete_{model.__name__}')
+
+
+def update_finance_summary_payment(sender, instance, **kwargs):
+    # mois du paiement (encaissé) et mois de la facture (reste dû)
+    previous = getattr(instance, '_previous_placement', None)
+    facture_ids = {instance.facture_id, previous[0] if previous else None} - {None}
+    facture_dates = Facture.objects.filter(pk__in=facture_ids).values_list('date', flat=True)
+    finance.mark_months(instance.date, previous[1] if previous else None, *facture_dates)
+
+
+post_save.connect(update_finance_summary_payment, sender=Payment, dispatch_uid='finance_save_Payment')
+post_delete.connect(update_finance_summary_payment, sender=Payment, dispatch_uid='finance_delete_Payment')
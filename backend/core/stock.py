@@ -0,0 +1,139 @@
+"""Mouvements de stock des matériaux.
+
+Toute variation de `Materiau.quantite_stock` passe par `apply_movements` :
+les `StockMovement` sont insérés par `bulk_create` et les stocks mis à jour
+par un seul `UPDATE ... SET quantite_stock = quantite_stock + <variation>`
+(`F()` et `Case`), dans une transaction. Deux saisies simultanées
+s'additionnent au lieu de s'écraser, et un lot de mouvements coûte le même
+nombre de requêtes qu'un mouvement isolé.
+
+Une sortie ou un ajustement qui rendrait un stock négatif fait échouer tout
+le lot (`StockError`). Avec `STOCK_AUTO_REORDER`, les matériaux en baisse
+passent ensuite par le réapprovisionnement automatique (core.reorder).
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .metrics import invalidate_dashboard_metrics
+from .models import Commande, Materiau, StockMovement
+
+
+STOCK_BATCH_SIZE = 500
+
+# Commandes qui peuvent encore être réceptionnées
+COMMANDES_EN_COURS = ('preparée', 'envoyee')
+
+
+class StockError(ValueError):
+    """Mouvement refusé (message affichable à l'utilisateur)."""
+
+
+def apply_movements(movements):
+    """Enregistrer les `StockMovement` (non sauvegardés) et mettre les stocks à jour."""
+    if not movements:
+        return movements
+    deltas = {}
+    for movement in movements:
+        deltas[movement.materiau_id] = deltas.get(movement.materiau_id, 0) + movement.quantite
+
+    with transaction.atomic():
+        # l'insertion d'abord : sur SQLite elle prend le verrou d'écriture, si
+        # bien que la vérification ci-dessous voit les stocks à jour
+        StockMovement.objects.bulk_create(movements, batch_size=STOCK_BATCH_SIZE)
+        stocks = dict(Materiau.objects.select_for_update().filter(pk__in=list(deltas)).values_list('pk', 'quantite_stock'))
+        missing = sorted(set(deltas) - set(stocks))
+        if missing:
+            raise StockError(f"Matériau(x) introuvable(s) : {', '.join(map(str, missing))}")
+        short = [pk for pk, delta in deltas.items() if stocks[pk] + delta < 0]
+        if short:
+            names = dict(Materiau.objects.filter(pk__in=short).values_list('pk', 'nom'))
+            raise StockError('Stock insuffisant : ' + ', '.join(f'{names[pk]} ({stocks[pk]} disponible(s))' for pk in short))
+
+        changed = {pk: delta for pk, delta in deltas.items() if delta}
+        if changed:
+            Materiau.objects.filter(pk__in=list(changed)).update(
+                quantite_stock=F('quantite_stock') + Case(
+                    *[When(pk=pk, then=Value(delta)) for pk, delta in changed.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                ),
+                updated_at=timezone.now(),
+            )
+            # `update` ne déclenche pas les signaux : le nombre de ruptures change
+            transaction.on_commit(invalidate_dashboard_metrics)
+            from . import reorder
+            if reorder.AUTO_REORDER:
+                reorder.schedule_reorder(pk for pk, delta in changed.items() if delta < 0)
+    return movements
+
+
+def correct_stock(materiau, delta, user=None, note=''):
+    """Corriger le stock de `materiau` de `delta` (mouvement d'ajustement)."""
+    if delta:
+        apply_movements([StockMovement(
+            materiau_id=materiau.pk, type='ajustement', quantite=delta,
+            date=timezone.localdate(), note=note or 'Inventaire', created_by=user,
+        )])
+    return delta
+
+
+def adjust_stock(materiau, quantite, user=None, note=''):
+    """Fixer le stock compté de `materiau` à `quantite` (mouvement d'ajustement)."""
+    with transaction.atomic():
+        current = Materiau.objects.select_for_update().filter(pk=materiau.pk).values_list('quantite_stock', flat=True).get()
+        return correct_stock(materiau, quantite - current, user=user, note=note)
+
+
+def receive_commandes(commande_ids, user=None, date=None):
+    """Réceptionner des commandes en une fois : une entrée de stock par commande.
+
+    Les commandes déjà reçues ou annulées sont ignorées (un envoi répété ne
+    compte pas deux fois). Retourne la liste des mouvements créés.
+    """
+    date = date or timezone.localdate()
+    with transaction.atomic():
+        commandes = list(
+            Commande.objects.select_for_update()
+            .filter(pk__in=list(commande_ids), statut__in=COMMANDES_EN_COURS)
+            .values_list('pk', 'materiau_id', 'quantite')
+        )
+        movements = apply_movements([
+            StockMovement(
+                materiau_id=materiau_id, type='entree', quantite=quantite, commande_id=pk,
+                date=date, note=f'Réception commande #{pk}', created_by=user,
+            )
+            for pk, materiau_id, quantite in commandes
+            if quantite > 0
+        ])
+        Commande.objects.filter(pk__in=[pk for pk, _, _ in commandes]).update(statut='recue')
+    return movements
+
+
+def consume(chantier, quantites, user=None, date=None):
+    """Sorties de stock vers `chantier` : `quantites` = {id matériau: quantité}."""
+    date = date or timezone.localdate()
+    return apply_movements([
+        StockMovement(
+            materiau_id=materiau_id, type='sortie', quantite=-quantite, chantier=chantier,
+            date=date, note=f'Consommation {chantier.nom}', created_by=user,
+        )
+        for materiau_id, quantite in quantites.items()
+    ])
+
+
+def parse_quantites(lines):
+    """[{'materiau': id, 'quantite': n}, ...] -> {id matériau: quantité totale}."""
+    if not isinstance(lines, list) or not lines:
+        raise StockError('Liste de matériaux vide.')
+    quantites = {}
+    for index, line in enumerate(lines, start=1):
+        try:
+            materiau_id = int(line['materiau'])
+            quantite = int(line['quantite'])
+        except (KeyError, TypeError, ValueError):
+            raise StockError(f'Ligne {index} : "materiau" et "quantite" (entiers) attendus.')
+        if quantite <= 0:
+            raise StockError(f'Ligne {index} : la quantité doit être positive.')
+        quantites[materiau_id] = quantites.get(materiau_id, 0) + quantite
+    return quantites
@@ -0,0 +1,88 @@
+import datetime
+
+from django.test import TestCase
+from django.utils import timezone
+
+from core.models import Client
+
+from .utils import make_chantier, make_personnel, make_user
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        make_user('admin')
+        self.client.login(username='admin', password='pw')
+        # lignes créées dans la même seconde, voire la même milliseconde
+        base = timezone.now().replace(microsecond=0)
+        self.ids = []
+        for i in range(12):
+            client = Client.objects.create(nom=f'Client {i}')
+            Client.objects.filter(pk=client.pk).update(created_at=base + datetime.timedelta(microseconds=100 * i))
+            self.ids.append(client.pk)
+
+    def pages(self, ordering, limit=2):
+        ids, cursor = [], None
+        while True:
+            params = {'ordering': ordering, 'limit': limit, 'fields': 'id'}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get('/api/clients/', params).json()
+            ids.extend(row['id'] for row in data['clients'])
+            cursor = data['next']
+            if not cursor or len(ids) > 2 * len(self.ids):
+                return ids
+
+    def test_ascending_pages_do_not_repeat_boundary_rows(self):
+        self.assertEqual(self.pages('created_at'), self.ids)
+
+    def test_descending_pages_do_not_skip_rows(self):
+        self.assertEqual(self.pages('-created_at'), self.ids[::-1])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/clients/', {'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        make_user('admin')
+        self.client.login(username='admin', password='pw')
+        self.personnel = make_personnel('jean', make_chantier())
+
+    def test_personnel_etag_changes_when_linked_user_is_renamed(self):
+        first = self.client.get('/api/personnel/')
+        etag = first['ETag']
+        self.assertEqual(self.client.get('/api/personnel/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        user = self.personnel.user
+        user.first_name, user.email = 'Jeanne', 'jeanne@example.com'
+        user.save()
+        response = self.client.get('/api/personnel/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        row = next(p for p in response.json()['personnel'] if p['id'] == self.personnel.pk)
+        self.assertEqual(row['user']['email'], 'jeanne@example.com')
+
+    def test_deleting_a_row_changes_the_etag(self):
+        Client.objects.create(nom='A')
+        doomed = Client.objects.create(nom='B')
+        first = self.client.get('/api/clients/')
+        self.assertNotIn('Last-Modified', first)
+        doomed.delete()
+        response = self.client.get('/api/clients/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_forbidden_role_gets_no_validator(self):
+        make_user('ouvrier')
+        self.client.login(username='ouvrier', password='pw')
+        response = self.client.get('/api/factures/')
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('ETag', response)
+
+
+class ChantierCostsApiTests(TestCase):
+    def setUp(self):
+        make_user('comptable')
+        self.client.login(username='comptable', password='pw')
+
+    def test_malformed_chantier_is_rejected(self):
+        self.assertEqual(self.client.get('/api/chantiers/couts/', {'chantier': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/chantiers/couts/').status_code, 200)
@@ -0,0 +1,44 @@
+import datetime
+import io
+from decimal import Decimal
+
+from django.test import TestCase
+
+from core.bank_import import import_statement, parse_statement
+from core.models import Client, Facture, Payment
+
+
+OFX = """<OFX><BANKTRANLIST>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20260110<TRNAMT>100.00<FITID>A1<NAME>VIR ACME<MEMO>{numero}</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20260110<TRNAMT>100.00<FITID>A2<NAME>VIR ACME<MEMO>{numero}</STMTTRN>
+</BANKTRANLIST></OFX>
+"""
+
+
+class BankImportTests(TestCase):
+    def setUp(self):
+        client = Client.objects.create(nom='ACME')
+        self.facture = Facture.objects.create(client=client, date=datetime.date(2026, 1, 5), total=500, subtotal=500, statut='envoyee')
+
+    def load(self):
+        return import_statement(parse_statement(io.StringIO(OFX.format(numero=self.facture.numero)), 'ofx'))
+
+    def test_identical_operations_with_distinct_fitid_are_both_imported(self):
+        report = self.load()
+        self.assertEqual((report.created, report.duplicates), (2, 0))
+        self.assertEqual(sorted(Payment.objects.values_list('bank_id', flat=True)), ['A1', 'A2'])
+
+    def test_reloaded_statement_is_deduplicated_on_fitid(self):
+        self.load()
+        report = self.load()
+        self.assertEqual((report.created, report.duplicates), (0, 2))
+        self.facture.refresh_from_db()
+        self.assertEqual(self.facture.reste_a_payer, Decimal(300))
+
+    def test_payment_imported_without_fitid_is_still_recognised(self):
+        Payment.objects.create(
+            facture=self.facture, montant=100, date=datetime.date(2026, 1, 10),
+            reference=f'VIR ACME {self.facture.numero}',
+        )
+        report = self.load()
+        self.assertEqual((report.created, report.duplicates), (0, 2))
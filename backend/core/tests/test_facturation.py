@@ -0,0 +1,59 @@
+import datetime
+import json
+from decimal import Decimal
+
+from django.test import SimpleTestCase, TestCase
+
+from core.facturation import FactureLinesError, parse_lines
+from core.models import Client, Facture, Payment
+
+
+class PaymentBalanceTests(TestCase):
+    def setUp(self):
+        client = Client.objects.create(nom='ACME')
+        today = datetime.date.today()
+        self.first = Facture.objects.create(client=client, date=today, total=100, subtotal=100, statut='envoyee')
+        self.second = Facture.objects.create(client=client, date=today, total=300, subtotal=300, statut='envoyee')
+
+    def balance(self, facture):
+        facture.refresh_from_db()
+        return facture.montant_paye, facture.reste_a_payer, facture.statut
+
+    def test_moving_a_payment_refreshes_both_factures(self):
+        payment = Payment.objects.create(facture=self.first, montant=100, date=datetime.date.today())
+        Facture.objects.filter(pk=self.first.pk).update(statut='payee')
+        payment.facture = self.second
+        payment.save()
+        self.assertEqual(self.balance(self.first), (Decimal(0), Decimal(100), 'envoyee'))
+        self.assertEqual(self.balance(self.second), (Decimal(100), Decimal(200), 'envoyee'))
+
+    def test_deleting_a_payment_refreshes_its_facture(self):
+        payment = Payment.objects.create(facture=self.first, montant=40, date=datetime.date.today())
+        payment.delete()
+        self.assertEqual(self.balance(self.first), (Decimal(0), Decimal(100), 'envoyee'))
+
+    def test_saving_a_stale_facture_keeps_payments_made_meanwhile(self):
+        stale = Facture.objects.get(pk=self.first.pk)
+        Payment.objects.create(facture=self.first, montant=30, date=datetime.date.today())
+        stale.notes = 'relance'
+        stale.save()
+        self.assertEqual(self.balance(self.first), (Decimal(30), Decimal(70), 'envoyee'))
+        stale.statut = 'annulee'
+        stale.save(update_fields=['statut', 'updated_at'])
+        self.assertEqual(self.balance(self.first), (Decimal(30), Decimal(70), 'annulee'))
+
+
+class ParseLinesTests(SimpleTestCase):
+    def parse(self, description):
+        return parse_lines(json.dumps([{'description': description, 'quantite': '2', 'pu': '10'}]))
+
+    def test_numeric_description_is_kept_as_text(self):
+        self.assertEqual(self.parse(42)[0].description, '42')
+
+    def test_missing_description_is_empty(self):
+        self.assertEqual(self.parse(None)[0].description, '')
+
+    def test_structured_description_is_rejected(self):
+        for description in ({'texte': 'x'}, ['x'], True):
+            with self.assertRaises(FactureLinesError):
+                self.parse(description)
@@ -0,0 +1,109 @@
+"""Le livre des coûts et la synthèse financière, tenus à jour écriture par
+écriture (signaux et écritures en masse), doivent rester identiques à un
+recalcul complet."""
+import datetime
+from decimal import Decimal
+
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from core import finance, ledger
+from core.bank_import import StatementLine, import_statement
+from core.models import (
+    ChantierCostMonth, Facture, FactureLine, MonthlyFinanceSummary, Payment, PersonnelPayment,
+)
+from core.payroll import cancel_payroll_run, run_payroll
+from core.presences import record_roll_call
+
+from .utils import make_chantier, make_employee, make_materiau, make_personnel
+
+
+FEVRIER = datetime.date(2026, 2, 16)
+MARS = datetime.date(2026, 3, 10)
+AVRIL = datetime.date(2026, 4, 6)
+
+
+def ledger_rows():
+    return sorted(ChantierCostMonth.objects.values_list('chantier_id', 'periode', 'main_oeuvre', 'jours_homme', 'materiaux', 'facture'))
+
+
+def finance_rows():
+    return sorted(MonthlyFinanceSummary.objects.values_list('periode', 'client_id', 'chantier_id', 'facture', 'reste_du', 'encaisse', 'paie'), key=str)
+
+
+class IncrementalRefreshTests(TransactionTestCase):
+    def setUp(self):
+        self.chantier = make_chantier('Chantier A')
+        self.other = make_chantier('Chantier B')
+        self.personnels = [make_personnel(f'ouvrier{i}', self.chantier) for i in range(3)]
+        self.employees = [make_employee(personnel, self.chantier) for personnel in self.personnels]
+        self.materiau = make_materiau()
+
+    def facture(self, chantier, date, total):
+        with transaction.atomic():
+            facture = Facture.objects.create(client=chantier.client, chantier=chantier, date=date, total=total, subtotal=total, statut='envoyee')
+            FactureLine.objects.create(facture=facture, materiau=self.materiau, description='Ciment', quantite=2, prix_unitaire=50, montant=100)
+            FactureLine.objects.create(facture=facture, description="Main d'oeuvre", quantite=1, prix_unitaire=total - 100, montant=total - 100)
+        return facture
+
+    def assertMatchesRebuild(self, step):
+        # vérifié après chaque étape : une case oubliée par une étape peut
+        # être recalculée par hasard à l'étape suivante
+        incremental = (ledger_rows(), finance_rows())
+        ledger.rebuild()
+        finance.rebuild()
+        self.assertEqual((ledger_rows(), finance_rows()), incremental, step)
+
+    def test_mixed_writes_match_rebuild(self):
+        mars = self.facture(self.chantier, MARS, 1000)
+        avril = self.facture(self.other, AVRIL, 600)
+        self.assertMatchesRebuild('factures')
+
+        # appel du jour (bulk_create) sur deux jours, corrigé ensuite
+        record_roll_call(self.chantier, MARS, {e.pk: 'PRESENT' for e in self.employees})
+        record_roll_call(self.chantier, AVRIL, {e.pk: 'RETARD' for e in self.employees})
+        record_roll_call(self.chantier, AVRIL, {self.employees[0].pk: 'ABSENT'})
+        self.assertMatchesRebuild('appel')
+
+        # paie du mois (bulk_create), puis une paie annulée
+        run_payroll('2026-03', date=MARS)
+        cancel_payroll_run(run_payroll('2026-04', date=AVRIL))
+        self.assertMatchesRebuild('paie du mois')
+
+        # paiement isolé, puis déplacé d'un mois et d'un chantier
+        payment = PersonnelPayment.objects.create(personnel=self.personnels[0], montant=80, date=AVRIL)
+        payment.date, payment.chantier = MARS, self.other
+        payment.save()
+        self.assertMatchesRebuild('paiement du personnel')
+
+        # paiements clients : créé, déplacé vers une autre facture, supprimé
+        client_payment = Payment.objects.create(facture=mars, montant=300, date=MARS)
+        client_payment.facture = avril
+        client_payment.date = AVRIL
+        client_payment.save()
+        Payment.objects.create(facture=mars, montant=50, date=AVRIL).delete()
+        self.assertMatchesRebuild('paiements clients')
+
+        # relevé bancaire (bulk_create des paiements) : reste dû de février
+        fevrier = self.facture(self.chantier, FEVRIER, 500)
+        report = import_statement([StatementLine(date=AVRIL, montant=Decimal(400), reference=f'Règlement {fevrier.numero}')])
+        self.assertEqual(report.created, 1)
+        self.assertMatchesRebuild('relevé bancaire')
+
+        # facture déplacée, puis annulée ; une autre supprimée
+        mars.chantier, mars.date = self.other, AVRIL
+        mars.save()
+        extra = self.facture(self.chantier, MARS, 200)
+        extra.statut = 'annulee'
+        extra.save()
+        self.facture(self.chantier, AVRIL, 300).delete()
+
+        self.assertMatchesRebuild('factures modifiées')
+
+    def test_emptied_cell_is_removed(self):
+        facture = self.facture(self.chantier, MARS, 400)
+        facture.chantier = self.other
+        facture.save()
+        self.assertEqual([row[:2] for row in ledger_rows()], [(self.other.pk, '2026-03')])
+        facture.delete()
+        self.assertEqual(ledger_rows(), [])
@@ -0,0 +1,80 @@
+import datetime
+from decimal import Decimal
+
+from django.test import TestCase
+
+from core.models import MonthlyPayroll, PayrollRun, PersonnelPayment, Presence
+from core.payroll import PayrollError, compute_payroll, expected_for, payroll_summary, run_payroll
+
+from .utils import make_chantier, make_employee, make_personnel, make_user
+
+
+class MonthlyPayrollReadTests(TestCase):
+    periode = '2026-03'
+
+    def setUp(self):
+        chantier = make_chantier()
+        self.chef = make_personnel('chef1', chantier, role='chef_chantier', prime_responsabilite=700)
+        self.ouvrier = make_personnel('ouvrier1', chantier)
+        employee = make_employee(self.ouvrier, chantier)
+        for day, statut in ((2, 'PRESENT'), (3, 'RETARD'), (4, 'ABSENT')):
+            Presence.objects.create(employee=employee, chantier=chantier, date=datetime.date(2026, 3, day), statut=statut)
+        # saisie de mars faite via les signaux : repartir d'un mois non calculé
+        MonthlyPayroll.objects.all().delete()
+
+    def expected(self):
+        return {p.pk: (p.jours, p.expected) for p in payroll_summary(periode=self.periode)}
+
+    def test_reads_compute_missing_month_without_writing(self):
+        make_user('comptable')
+        self.client.login(username='comptable', password='pw')
+        response = self.client.get('/personnel/paiements/historique/', {'month': self.periode})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(expected_for(self.ouvrier, self.periode), Decimal(200))
+        self.assertFalse(MonthlyPayroll.objects.exists())
+        self.assertEqual(self.expected(), {self.chef.pk: (0, Decimal(5700)), self.ouvrier.pk: (2, Decimal(200))})
+
+    def test_computed_fallback_matches_stored_month(self):
+        on_the_fly = self.expected()
+        compute_payroll(self.periode)
+        self.assertEqual(MonthlyPayroll.objects.count(), 2)
+        self.assertEqual(self.expected(), on_the_fly)
+
+
+class PresenceSignalTests(TestCase):
+    def setUp(self):
+        chantier = make_chantier()
+        self.ouvrier = make_personnel('ouvrier1', chantier)
+        self.autre = make_personnel('ouvrier2', chantier)
+        self.employee = make_employee(self.ouvrier, chantier)
+        self.autre_employee = make_employee(self.autre, chantier)
+        self.presence = Presence.objects.create(employee=self.employee, chantier=chantier, date=datetime.date(2026, 3, 2), statut='PRESENT')
+
+    def days(self):
+        return sorted(MonthlyPayroll.objects.filter(jours_travailles__gt=0).values_list('personnel_id', 'periode', 'jours_travailles'))
+
+    def test_presence_moved_to_another_month(self):
+        self.presence.date = datetime.date(2026, 4, 2)
+        self.presence.save()
+        self.assertEqual(self.days(), [(self.ouvrier.pk, '2026-04', 1)])
+
+    def test_presence_moved_to_another_employee(self):
+        self.presence.employee = self.autre_employee
+        self.presence.save()
+        self.assertEqual(self.days(), [(self.autre.pk, '2026-03', 1)])
+
+
+class RunPayrollTests(TestCase):
+    def setUp(self):
+        make_personnel('chef1', make_chantier(), role='chef_chantier')
+
+    def test_unknown_mode_is_rejected_before_anything_is_written(self):
+        with self.assertRaises(PayrollError):
+            run_payroll('2026-03', mode='bitcoin')
+        self.assertFalse(PayrollRun.objects.exists())
+        self.assertFalse(PersonnelPayment.objects.exists())
+
+    def test_run_pays_the_month(self):
+        run = run_payroll('2026-03', mode='cheque')
+        self.assertEqual((run.nb_paiements, run.montant_total), (1, Decimal(5000)))
+        self.assertEqual(list(PersonnelPayment.objects.values_list('mode', flat=True)), ['cheque'])
@@ -0,0 +1,33 @@
+import datetime
+import json
+
+from django.test import TestCase
+
+from core.models import Presence
+
+from .utils import make_chantier, make_employee, make_personnel, make_user
+
+
+class RollCallApiTests(TestCase):
+    def setUp(self):
+        make_user('directeur')
+        self.client.login(username='directeur', password='pw')
+        self.chantier = make_chantier()
+        self.employee = make_employee(make_personnel('ouvrier1', self.chantier), self.chantier)
+
+    def post(self, **payload):
+        body = {'chantier': self.chantier.pk, 'presences': [{'employee': self.employee.pk, 'statut': 'PRESENT'}], **payload}
+        return self.client.post('/api/presences/', json.dumps(body), content_type='application/json')
+
+    def test_roll_call_is_recorded(self):
+        response = self.post(date='2026-03-02')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 1)
+        self.assertTrue(Presence.objects.filter(employee=self.employee, date=datetime.date(2026, 3, 2)).exists())
+
+    def test_badly_typed_values_are_rejected(self):
+        for payload in ({'date': 20260302}, {'date': ['2026-03-02']}, {'date': '2026-02-30'}, {'chantier': [1]}, {'chantier': True}):
+            response = self.post(**payload)
+            self.assertEqual(response.status_code, 400, payload)
+            self.assertIn('error', response.json())
+        self.assertFalse(Presence.objects.exists())
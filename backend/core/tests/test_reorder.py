@@ -0,0 +1,42 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from core import reorder
+from core.models import Commande, Fournisseur
+from core.stock import consume
+
+from .utils import make_chantier, make_materiau
+
+
+class ReorderTests(TestCase):
+    def setUp(self):
+        self.fournisseur = Fournisseur.objects.create(nom='F1')
+        self.ciment = make_materiau('Ciment', quantite_stock=1, seuil_minimum=5, fournisseur=self.fournisseur)
+        self.sable = make_materiau('Sable', quantite_stock=0, seuil_minimum=2, fournisseur=self.fournisseur)
+        make_materiau('Gravier', quantite_stock=10, seuil_minimum=2)
+
+    def test_commandes_grouped_by_fournisseur_and_not_repeated(self):
+        batches = reorder.generate_reorders()
+        self.assertEqual([(f.nom, sorted(c.materiau.nom for c in cs)) for f, cs in batches], [('F1', ['Ciment', 'Sable'])])
+        self.assertEqual(dict(Commande.objects.values_list('materiau__nom', 'quantite')), {'Ciment': 4, 'Sable': 2})
+        self.assertEqual(reorder.generate_reorders(), [])
+        self.assertEqual(Commande.objects.count(), 2)
+
+    def test_dry_run_creates_nothing(self):
+        reorder.generate_reorders(dry_run=True)
+        self.assertFalse(Commande.objects.exists())
+
+    def test_failing_automatic_reorder_does_not_break_the_stock_movement(self):
+        chantier = make_chantier()
+        brique = make_materiau('Brique', quantite_stock=10, seuil_minimum=5)
+        with mock.patch.object(reorder, 'AUTO_REORDER', True), \
+                mock.patch.object(reorder, 'generate_reorders', side_effect=RuntimeError('boom')), \
+                self.assertLogs('core.reorder', level='ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            consume(chantier, {brique.pk: 6})
+        brique.refresh_from_db()
+        self.assertEqual(brique.quantite_stock, 4)
+
+    def test_candidates_read_from_the_partial_index(self):
+        self.assertIn('materiau_rupture_idx', reorder.reorder_candidates().explain())
@@ -0,0 +1,102 @@
+import datetime
+import json
+
+from django.db.models import Sum
+from django.test import TestCase
+
+from core.models import Commande, Materiau, StockMovement
+from core.stock import StockError, consume, receive_commandes
+
+from .utils import make_chantier, make_materiau, make_user
+
+
+class MateriauEditTests(TestCase):
+    def setUp(self):
+        make_user('admin')
+        self.client.login(username='admin', password='pw')
+        self.chantier = make_chantier()
+        self.materiau = make_materiau(quantite_stock=0)
+        receive_commandes([Commande.objects.create(materiau=self.materiau, quantite=20).pk])
+
+    def post_form(self, quantite_stock, initiale, nom='Ciment'):
+        return self.client.post(f'/materiaux/{self.materiau.pk}/edit/', {
+            'nom': nom, 'categorie': 'autre', 'prix_unitaire': '10', 'seuil_minimum': '5',
+            'quantite_stock': quantite_stock, 'quantite_stock_initiale': initiale,
+        })
+
+    def stock(self):
+        return Materiau.objects.get(pk=self.materiau.pk).quantite_stock
+
+    def test_saving_form_keeps_concurrent_movement(self):
+        # formulaire ouvert avec 20 en stock, sortie de 5 pendant l'édition
+        consume(self.chantier, {self.materiau.pk: 5})
+        self.post_form(20, 20, nom='Ciment gris')
+        self.assertEqual(self.stock(), 15)
+        self.assertEqual(Materiau.objects.get(pk=self.materiau.pk).nom, 'Ciment gris')
+        self.assertFalse(StockMovement.objects.filter(type='ajustement').exists())
+
+    def test_edited_quantity_is_applied_as_a_correction(self):
+        consume(self.chantier, {self.materiau.pk: 5})
+        self.post_form(18, 20)
+        self.assertEqual(self.stock(), 13)
+        self.assertEqual(list(StockMovement.objects.filter(type='ajustement').values_list('quantite', flat=True)), [-2])
+
+
+class StockMovementTests(TestCase):
+    def setUp(self):
+        self.chantier = make_chantier()
+        self.materiau = make_materiau(quantite_stock=0)
+
+    def test_reception_is_counted_once(self):
+        commande = Commande.objects.create(materiau=self.materiau, quantite=10)
+        receive_commandes([commande.pk])
+        receive_commandes([commande.pk])
+        self.assertEqual(Materiau.objects.get(pk=self.materiau.pk).quantite_stock, 10)
+
+    def test_insufficient_stock_rejects_the_whole_batch(self):
+        other = make_materiau('Sable', quantite_stock=0)
+        receive_commandes([Commande.objects.create(materiau=m, quantite=3).pk for m in (self.materiau, other)])
+        with self.assertRaises(StockError):
+            consume(self.chantier, {self.materiau.pk: 1, other.pk: 4}, date=datetime.date.today())
+        self.assertEqual(sorted(Materiau.objects.values_list('quantite_stock', flat=True)), [3, 3])
+        self.assertFalse(StockMovement.objects.filter(type='sortie').exists())
+
+    def test_movements_sum_to_stock(self):
+        receive_commandes([Commande.objects.create(materiau=self.materiau, quantite=8).pk])
+        consume(self.chantier, {self.materiau.pk: 3})
+        consume(self.chantier, {self.materiau.pk: 2})
+        total = self.materiau.mouvements.aggregate(total=Sum('quantite'))['total']
+        self.assertEqual(total, Materiau.objects.get(pk=self.materiau.pk).quantite_stock)
+        self.assertEqual(total, 3)
+
+
+class StockApiTests(TestCase):
+    def setUp(self):
+        self.chef = make_user('chef')
+        self.client.login(username='chef', password='pw')
+        self.chantier = make_chantier(chef_chantier=self.chef)
+        self.materiau = make_materiau(quantite_stock=0)
+        receive_commandes([Commande.objects.create(materiau=self.materiau, quantite=10).pk])
+
+    def post(self, **payload):
+        body = {'chantier': self.chantier.pk, 'lignes': [{'materiau': self.materiau.pk, 'quantite': 4}], **payload}
+        return self.client.post('/api/stock/consommation/', json.dumps(body), content_type='application/json')
+
+    def stock(self):
+        return Materiau.objects.get(pk=self.materiau.pk).quantite_stock
+
+    def test_chef_consumes_on_own_chantier(self):
+        response = self.post(date='2026-03-02')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(), 6)
+
+    def test_other_chantier_is_forbidden(self):
+        response = self.post(chantier=make_chantier('Chantier B').pk)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.stock(), 10)
+
+    def test_badly_typed_values_are_rejected(self):
+        for payload in ({'date': 20260302}, {'date': {'jour': 2}}, {'lignes': [{'materiau': self.materiau.pk, 'quantite': 'x'}]}, {'lignes': {}}):
+            response = self.post(**payload)
+            self.assertEqual(response.status_code, 400, payload)
+        self.assertEqual(self.stock(), 10)
@@ -0,0 +1,44 @@
+"""Données communes des tests."""
+import datetime
+
+from django.contrib.auth.models import User
+
+from core.models import Affectation, Chantier, Client, Employee, Fournisseur, Materiau, Personnel, UserProfile
+
+
+def make_user(role, username=None):
+    user = User.objects.create_user(username or role, f'{username or role}@example.com', 'pw', first_name=role.title(), last_name='Test')
+    UserProfile.objects.create(user=user, role=role)
+    return user
+
+
+def make_chantier(nom='Chantier A', client=None, **kwargs):
+    today = datetime.date.today()
+    client = client or Client.objects.create(nom=f'Client {nom}')
+    kwargs.setdefault('budget', 10000)
+    kwargs.setdefault('statut', 'en_cours')
+    return Chantier.objects.create(nom=nom, client=client, date_debut=today, date_fin_prevue=today, **kwargs)
+
+
+def make_materiau(nom='Ciment', quantite_stock=0, seuil_minimum=5, fournisseur=None):
+    fournisseur = fournisseur or Fournisseur.objects.create(nom=f'Fournisseur {nom}')
+    return Materiau.objects.create(nom=nom, prix_unitaire=10, quantite_stock=quantite_stock, seuil_minimum=seuil_minimum, fournisseur=fournisseur)
+
+
+def make_personnel(username, chantier, role='ouvrier', **kwargs):
+    user = User.objects.create_user(username, first_name=username.title(), last_name='Test')
+    if role == 'chef_chantier':
+        kwargs.setdefault('salaire_mensuel', 5000)
+    else:
+        kwargs.setdefault('taux_journalier', 100)
+    return Personnel.objects.create(user=user, role=role, date_embauche=datetime.date.today(), chantier_actuel=chantier, **kwargs)
+
+
+def make_employee(personnel, chantier):
+    """Employee (pointage) du `personnel`, affecté à `chantier` depuis le 01/01/2026."""
+    employee = Employee.objects.create(
+        user=personnel.user, nom='Test', prenom=personnel.user.username, role='OUVRIER', date_embauche=datetime.date(2026, 1, 1),
+        type_remuneration='JOURNALIER', montant_remuneration=100,
+    )
+    Affectation.objects.create(employee=employee, chantier=chantier, date_debut=datetime.date(2026, 1, 1))
+    return employee
@@ -15,11 +15,14 @@ urlpatterns = [
     path('factures/new/', views.FactureCreateView.as_view(), name='facture_new'),
     path('factures/<int:pk>/', views.FactureDetailView.as_view(), name='facture_detail'),
     path('factures/<int:pk>/pdf/', views.facture_pdf, name='facture_pdf'),
+    path('factures/export-pdf/', views.factures_pdf_zip, name='factures_pdf_zip'),
+    path('factures/import-releve/', views.payments_import, name='payments_import'),
     path('factures/<int:pk>/edit/', views.FactureUpdateView.as_view(), name='facture_edit'),
     path('factures/<int:pk>/delete/', views.facture_delete, name='facture_delete'),
     path('factures/<int:pk>/marquer_payee/', views.facture_mark_paid, name='facture_mark_paid'),
     path('factures/<int:pk>/annuler/', views.facture_mark_annulee, name='facture_mark_annulee'),
     path('factures/<int:pk>/reouvrir/', views.facture_reopen, name='facture_reopen'),
+    path('factures/balance-agee/', views.receivables_aging, name='receivables_aging'),
     path('users/', views.UserListView.as_view(), name='users'),
     path('users/new/', views.UserCreateView.as_view(), name='user_new'),
     path('users/<int:pk>/edit/', views.UserUpdateView.as_view(), name='user_edit'),
@@ -32,6 +35,7 @@ urlpatterns = [
     path('chantiers/new/', views.ChantierCreateView.as_view(), name='chantier_create'),
     path('chantiers/<int:pk>/edit/', views.ChantierUpdateView.as_view(), name='chantier_update'),
     path('chantiers/<int:pk>/delete/', views.ChantierDeleteView.as_view(), name='chantier_delete'),
+    path('chantiers/couts/', views.chantier_costs, name='chantier_costs'),
 
     # URLs pour Personnel
     path('personnel/', views.PersonnelListView.as_view(), name='personnel'),
@@ -41,6 +45,8 @@ urlpatterns = [
     path('personnel/<int:personnel_id>/paiements/', views.personnel_payments, name='personnel_payments'),
     path('personnel/paiements/historique/', views.personnel_payments_history, name='personnel_payments_history'),
     path('personnel/<int:personnel_id>/paiements/marquer_payee/', views.personnel_mark_paid, name='personnel_mark_paid'),
+    path('personnel/paiements/paie/', views.payroll_run, name='payroll_run'),
+    path('personnel/paiements/paie/<int:pk>/annuler/', views.payroll_run_cancel, name='payroll_run_cancel'),
 
     # URLs pour Materiau
     path('materiaux/', views.MateriauListView.as_view(), name='materiaux'),
@@ -48,6 +54,7 @@ urlpatterns = [
     path('materiaux/<int:pk>/edit/', views.MateriauUpdateView.as_view(), name='materiau_update'),
     path('materiaux/<int:pk>/delete/', views.MateriauDeleteView.as_view(), name='materiau_delete'),
     path('materiaux/<int:pk>/commander/', views.commande_create, name='materiau_commander'),
+    path('materiaux/reapprovisionner/', views.materiaux_reorder, name='materiaux_reorder'),
 
     # URLs pour Fournisseur
     path('fournisseurs/', views.FournisseurListView.as_view(), name='fournisseurs'),
@@ -64,6 +71,11 @@ urlpatterns = [
     path('api/factures/', views.api_factures, name='api_factures'),
     path('api/rapports/', views.api_rapports, name='api_rapports'),
     path('api/dashboard/', views.api_dashboard_stats, name='api_dashboard'),
+    path('api/balance-agee/', views.api_receivables_aging, name='api_receivables_aging'),
+    path('api/presences/', views.api_presences, name='api_presences'),
+    path('api/stock/reception/', views.api_stock_reception, name='api_stock_reception'),
+    path('api/stock/consommation/', views.api_stock_consommation, name='api_stock_consommation'),
+    path('api/chantiers/couts/', views.api_chantier_costs, name='api_chantier_costs'),
     # Pages pour rapports
     path('rapports/', views.rapports_view, name='rapports'),
     path('rapports/new/', views.create_rapport, name='rapport_new'),
@@ -3,6 +3,7 @@ from django.urls import reverse
 from django.conf import settings
 from django.views import View
 from django.http import JsonResponse
+import io
 import json
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.middleware.csrf import get_token
@@ -13,17 +14,27 @@ from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 import logging
 
-from django.db import models
-from django.db.models import F
-from django.db.models.functions import Coalesce
+from django.db import models, transaction
 from django.utils import timezone
 from django.contrib.auth import views as auth_views
 
 from .models import Client, Facture, FactureLine, UserProfile, Chantier, Personnel, Materiau, Fournisseur, Rapport, FactureActionLog
 from .forms import ClientForm, FactureForm
-from .forms import PaymentForm
+from .metrics import get_dashboard_metrics
+from .payroll import expected_for, month_bounds, payment_status, payroll_summary
+from .payroll import payment_detail_csv_rows, summary_csv_rows
+from .payroll import PayrollError, cancel_payroll_run, run_payroll
+from .exports import streaming_csv_response, streaming_zip_response
+from . import api
+from .facturation import FactureLinesError, parse_lines, save_facture
+from .signals import DASHBOARD_MODELS
+from .receivables import BUCKETS, GROUPS, aging_csv_header, aging_csv_rows, aging_rows, aging_totals
+from .forms import PaymentForm, ReleveImportForm
+from .bank_import import StatementError, import_statement, parse_statement
 from .models import Payment
 from .models import PersonnelPayment
+from .models import PayrollRun
+from .models import ChantierCostMonth
 from .forms import PersonnelPaymentForm
 from django.contrib.auth.decorators import user_passes_test
 from django.http import HttpResponse
@@ -35,14 +46,11 @@ from django.db.models import Sum
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 
-from django.template.loader import render_to_string
-from io import BytesIO
-from django.contrib.staticfiles import finders
-import os
-try:
-    from xhtml2pdf import pisa
-except Exception:
-    pisa = None
+from django.http import FileResponse
+from . import ledger, pdf
+from .presences import RollCallError, parse_entries, record_roll_call, roll_call
+from .stock import StockError, consume, parse_quantites, receive_commandes, adjust_stock, correct_stock
+from .reorder import generate_reorders
 
 @ensure_csrf_cookie
 @login_required
@@ -104,35 +112,29 @@ def commande_create(request, pk):
     return redirect(reverse('core:materiaux'))
 
 
+@login_required
+@require_POST
+def materiaux_reorder(request):
+    """Commander d'un coup tous les matériaux en rupture sans commande en cours."""
+    profile = getattr(request.user, 'userprofile', None)
+    if not profile or profile.role not in ('admin', 'directeur', 'comptable', 'chef'):
+        messages.error(request, "Vous n'avez pas la permission de créer une commande.")
+        return redirect(reverse('core:materiaux'))
+    batches = generate_reorders(user=request.user)
+    count = sum(len(commandes) for _, commandes in batches)
+    if count:
+        messages.success(request, f'{count} commande(s) de réapprovisionnement créée(s) pour {len(batches)} fournisseur(s).')
+    else:
+        messages.info(request, 'Aucun matériau à commander : pas de rupture sans commande en cours.')
+    return redirect(reverse('core:materiaux'))
+
+
 
 
 @method_decorator(login_required, name='dispatch')
 class DashboardView(View):
     def get(self, request):
         try:
-            # Statistiques générales
-            total_chantiers = Chantier.objects.count()
-            chantiers_actifs = Chantier.objects.filter(statut='en_cours').count()  # Count active projects
-            chantiers_termines = Chantier.objects.filter(statut='termine').count()
-
-            total_personnel = Personnel.objects.filter(est_actif=True).count()
-            total_materiaux = Materiau.objects.count()
-            materiaux_rupture = Materiau.objects.filter(quantite_stock__lte=models.F('seuil_minimum')).count()
-
-            total_clients = Client.objects.count()
-            total_fournisseurs = Fournisseur.objects.count()
-
-            # Factures du mois en cours (utiliser les bons champs du modèle)
-            now = timezone.now()
-            debut_mois = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            factures_mois = Facture.objects.filter(date__gte=debut_mois)
-            montant_factures_mois = factures_mois.aggregate(total=models.Sum('total'))['total'] or 0
-
-            # Budget total des chantiers actifs
-            budget_total = Chantier.objects.filter(statut__in=['planifie', 'en_cours']).aggregate(
-                total=models.Sum('budget')
-            )['total'] or 0
-
             # Chantiers récents
             chantiers_recents = Chantier.objects.select_related('client').order_by('-created_at')[:5]
 
@@ -175,6 +177,9 @@ class DashboardView(View):
             if profile and profile.role == 'ouvrier':
                 return redirect(reverse('core:rapports'))
 
+            # Statistiques générales (instantané en cache, invalidé à chaque écriture)
+            metrics = get_dashboard_metrics(getattr(profile, 'role', None))
+
             # Contrôle d'accès aux données financières selon le rôle
             show_finances = False
             # Only admin, directeur and comptable see finances; chefs should not
@@ -185,12 +190,10 @@ class DashboardView(View):
             # que les informations financières / fournisseurs / matériaux
             if profile and profile.role == 'comptable':
                 # masquer les sections opérationnelles non pertinentes
+                # (les compteurs chantiers sont déjà masqués dans `metrics`)
                 chantiers_recents = []
-                total_chantiers = 0
-                chantiers_actifs = 0
-                chantiers_termines = 0
                 # Le comptable doit pouvoir voir et gérer le personnel (paiements,
-                # fiches de paie, etc.). Ne pas écraser `total_personnel` ici.
+                # fiches de paie, etc.).
 
                 # Afficher les rapports rédigés par le comptable (au lieu de forcer 0)
                 try:
@@ -201,34 +204,9 @@ class DashboardView(View):
                     rapports_count = 0
                     rapports_recents = []
 
-                # Compteurs et métriques utiles pour le comptable
+                # factures impayées récentes (reste à payer dénormalisé)
                 try:
-                    factures_count = Facture.objects.count()
-                except Exception:
-                    factures_count = 0
-
-                # garantir que les totals existants sont cohérents
-                try:
-                    total_fournisseurs = Fournisseur.objects.count()
-                except Exception:
-                    total_fournisseurs = 0
-
-                try:
-                    total_materiaux = Materiau.objects.count()
-                except Exception:
-                    total_materiaux = 0
-
-                # exposer ces valeurs dans le contexte (montant_factures_mois est calculé plus haut)
-                # note: montant_factures_mois reste disponible pour l'affichage monétaire
-
-                # factures impayées récentes (annotate paiements et filtrer)
-                try:
-                    unpaid_qs = Facture.objects.annotate(
-                        paid=Coalesce(models.Sum('payments__montant'), 0),
-                    ).annotate(
-                        diff=F('total') - F('paid')
-                    ).filter(diff__gt=0).order_by('-date')[:5]
-                    unpaid_factures = unpaid_qs
+                    unpaid_factures = Facture.objects.select_related('client').filter(reste_a_payer__gt=0).order_by('-date')[:5]
                 except Exception:
                     try:
                         unpaid_factures = Facture.objects.all().order_by('-date')[:5]
@@ -246,26 +224,15 @@ class DashboardView(View):
                 # ensure finances/factures remain hidden for chefs
                 show_finances = False
                 factures_recentes = []
-                montant_factures_mois = 0
 
             context = {
-                'total_chantiers': total_chantiers,
-                'chantiers_actifs': chantiers_actifs,
-                'chantiers_termines': chantiers_termines,
-                'total_personnel': total_personnel,
-                'total_materiaux': total_materiaux,
-                'materiaux_rupture': materiaux_rupture,
-                'total_clients': total_clients,
-                'total_fournisseurs': total_fournisseurs,
-                'montant_factures_mois': montant_factures_mois,
-                'budget_total': budget_total,
+                **metrics.as_context(),
                 'chantiers_recents': chantiers_recents,
                 'factures_recentes': factures_recentes,
                 'rapports_count': rapports_count,
                 'rapports_recents': rapports_recents,
                 'rapports_user_count': rapports_user_count,
                 'show_finances': show_finances,
-                'factures_count': locals().get('factures_count', None),
                 'unpaid_factures': locals().get('unpaid_factures', []),
                 'fournisseurs_recents': locals().get('fournisseurs_recents', []),
                 'role': getattr(profile, 'role', None),
@@ -325,18 +292,11 @@ def personnel_payments(request, personnel_id):
         form = PersonnelPaymentForm(initial={'date': timezone.now().date()})
 
     paiements = personnel.paiements.order_by('-date')[:50]
-    # calculer salaire de base (mensuel) pour affichage dynamique
-    try:
-        if personnel.role == 'chef_chantier' and getattr(personnel, 'salaire_mensuel', None):
-            base_salary = Decimal(getattr(personnel, 'salaire_mensuel') or 0)
-        else:
-            taux = Decimal(getattr(personnel, 'taux_journalier', 0) or 0)
-            base_salary = taux * Decimal(22)
-    except Exception:
-        base_salary = Decimal(0)
+    periode = request.GET.get('periode') or request.GET.get('month') or ''
+    # salaire du mois (jours pointés) pour affichage dynamique, forfait sans période
+    base_salary = expected_for(personnel, periode)
 
     chantier = getattr(personnel, 'chantier_actuel', None)
-    periode = request.GET.get('periode') or request.GET.get('month') or ''
     return render(request, 'core/personnel_payments.html', {'personnel': personnel, 'paiements': paiements, 'form': form, 'base_salary': base_salary, 'chantier': chantier, 'periode': periode})
 
 
@@ -351,65 +311,47 @@ def personnel_payments_history(request):
     # Determine date range for the filter
     date_from = request.GET.get('from')
     date_to = request.GET.get('to')
+    periode = None
     if month:
         try:
-            year, mon = month.split('-')
-            year = int(year); mon = int(mon)
-            first_day = datetime.date(year, mon, 1)
-            last_day = datetime.date(year, mon, calendar.monthrange(year, mon)[1])
+            first_day, last_day = month_bounds(month)
             date_from = first_day.isoformat()
             date_to = last_day.isoformat()
+            periode = month
         except Exception:
             date_from = date_from
-
-    # Base personnels queryset, optionally filter by chantier
-    personnels_qs = Personnel.objects.order_by('user__last_name')
     # sanitize chantier_id: ignore empty strings or the string 'None' (coming from UI)
+    chantier_filter = None
     if chantier_id and chantier_id.lower() != 'none':
         try:
-            chantier_id_int = int(chantier_id)
-            personnels_qs = personnels_qs.filter(chantier_actuel_id=chantier_id_int)
+            chantier_filter = int(chantier_id)
         except Exception:
             # ignore invalid chantier filter values
             pass
 
-    # Build rows: expected_net (salary) and paid for the date range
-    rows = []
-    for person in personnels_qs:
-        # expected net: use salaire_mensuel for chefs, else taux_journalier * 22
-        try:
-            if person.role == 'chef_chantier' and getattr(person, 'salaire_mensuel', None):
-                expected = Decimal(getattr(person, 'salaire_mensuel') or 0)
-            else:
-                taux = Decimal(getattr(person, 'taux_journalier', 0) or 0)
-                expected = taux * Decimal(22)
-        except Exception:
-            expected = Decimal(0)
-
-        paid_qs = PersonnelPayment.objects.filter(personnel=person)
-        if date_from:
-            paid_qs = paid_qs.filter(date__gte=date_from)
-        if date_to:
-            paid_qs = paid_qs.filter(date__lte=date_to)
-        paid_agg = paid_qs.aggregate(total=Sum('montant'))['total'] or Decimal(0)
-
-        status = 'Payé' if paid_agg >= expected and expected > 0 else 'En attente'
-
-        rows.append({'personnel': person, 'expected': expected, 'paid': paid_agg, 'status': status})
-
-    # Export CSV for aggregated rows
+    # Export CSV en flux : récapitulatif par personne ou détail des paiements
     if request.GET.get('export') == 'csv':
-        resp = HttpResponse(content_type='text/csv')
-        resp['Content-Disposition'] = 'attachment; filename="personnel_payments_summary.csv"'
-        writer = csv.writer(resp)
-        writer.writerow(['Personnel', 'Poste', 'Chantier', 'Net attendu (FCFA)', 'Payé (FCFA)', 'Statut'])
-        for r in rows:
-            writer.writerow([r['personnel'].user.get_full_name(), r['personnel'].get_role_display(), getattr(r['personnel'].chantier_actuel, 'nom', ''), int(r['expected']), int(r['paid']), r['status']])
-        return resp
+        if request.GET.get('detail') == 'paiements':
+            return streaming_csv_response(
+                'personnel_payments_detail.csv',
+                ['Date', 'Personnel', 'Poste', 'Chantier', 'Montant (FCFA)', 'Mode', 'Période', 'Référence'],
+                payment_detail_csv_rows(date_from, date_to, chantier_filter),
+            )
+        return streaming_csv_response(
+            'personnel_payments_summary.csv',
+            ['Personnel', 'Poste', 'Chantier', 'Net attendu (FCFA)', 'Payé (FCFA)', 'Statut'],
+            summary_csv_rows(date_from, date_to, chantier_filter, periode),
+        )
+
+    # Build rows: expected_net (salary) and paid for the date range, en une requête
+    rows = []
+    for person in payroll_summary(date_from, date_to, chantier_filter, periode):
+        rows.append({'personnel': person, 'expected': person.expected, 'jours': getattr(person, 'jours', None), 'paid': person.paid, 'status': payment_status(person.expected, person.paid)})
 
     # Pass list of chantiers for filter select
     chantiers = Chantier.objects.order_by('nom')
-    return render(request, 'core/personnel_payments_history.html', {'rows': rows, 'chantiers': chantiers, 'filters': {'month': month, 'chantier': chantier_id, 'from': date_from, 'to': date_to}})
+    runs = PayrollRun.objects.select_related('chantier', 'created_by').order_by('-created_at')[:10]
+    return render(request, 'core/personnel_payments_history.html', {'rows': rows, 'chantiers': chantiers, 'runs': runs, 'mode_choices': PersonnelPayment.MODE_CHOICES, 'filters': {'month': month, 'chantier': chantier_id, 'from': date_from, 'to': date_to}})
 
 
 @login_required
@@ -423,14 +365,7 @@ def personnel_mark_paid(request, personnel_id):
     period = request.POST.get('periode') or request.POST.get('month')
 
     # compute expected same way as the history view
-    try:
-        if personnel.role == 'chef_chantier' and getattr(personnel, 'salaire_mensuel', None):
-            expected = Decimal(getattr(personnel, 'salaire_mensuel') or 0)
-        else:
-            taux = Decimal(getattr(personnel, 'taux_journalier', 0) or 0)
-            expected = taux * Decimal(22)
-    except Exception:
-        expected = Decimal(0)
+    expected = expected_for(personnel, period)
 
     # create a PersonnelPayment record marking the amount as paid
     pp = PersonnelPayment.objects.create(
@@ -459,6 +394,56 @@ def personnel_mark_paid(request, personnel_id):
     return redirect(redirect_url)
 
 
+def _history_redirect(month=None, chantier=None):
+    from urllib.parse import urlencode
+    redirect_url = reverse('core:personnel_payments_history')
+    q = {key: value for key, value in (('month', month), ('chantier', chantier)) if value}
+    if q:
+        redirect_url += '?' + urlencode(q)
+    return redirect(redirect_url)
+
+
+@login_required
+@user_passes_test(lambda u: getattr(getattr(u, 'userprofile', None), 'role', None) in ('comptable', 'admin', 'directeur') or u.is_superuser)
+def payroll_run(request):
+    # Payer tout le mois (optionnellement un chantier) en une transaction
+    if request.method != 'POST':
+        return redirect(reverse('core:personnel_payments_history'))
+
+    month = request.POST.get('month', '')
+    chantier_id = request.POST.get('chantier') or None
+    try:
+        chantier_id = int(chantier_id) if chantier_id else None
+        run = run_payroll(month, chantier_id, user=request.user, mode=request.POST.get('mode', 'virement'))
+    except PayrollError as e:
+        messages.error(request, str(e))
+        return _history_redirect(month, request.POST.get('chantier'))
+    except ValueError:
+        messages.error(request, "Choisissez un mois valide avant de lancer la paie.")
+        return _history_redirect(month, request.POST.get('chantier'))
+
+    if run is None:
+        messages.info(request, f"Tout le personnel est déjà payé pour {month}.")
+    else:
+        messages.success(request, f"Paie {month} : {run.nb_paiements} paiement(s) enregistré(s) pour {int(run.montant_total)} FCFA")
+    return _history_redirect(month, request.POST.get('chantier'))
+
+
+@login_required
+@user_passes_test(lambda u: getattr(getattr(u, 'userprofile', None), 'role', None) in ('comptable', 'admin', 'directeur') or u.is_superuser)
+def payroll_run_cancel(request, pk):
+    if request.method != 'POST':
+        return redirect(reverse('core:personnel_payments_history'))
+
+    run = get_object_or_404(PayrollRun, pk=pk)
+    deleted = cancel_payroll_run(run, user=request.user)
+    if deleted:
+        messages.success(request, f"Paie {run.periode} annulée : {deleted} paiement(s) supprimé(s)")
+    else:
+        messages.info(request, f"La paie {run.periode} était déjà annulée.")
+    return _history_redirect(run.periode, run.chantier_id)
+
+
 class CustomLoginView(auth_views.LoginView):
     """Custom LoginView to support a 'remember me' checkbox.
 
@@ -585,16 +570,41 @@ class FactureListView(View):
         if not profile or profile.role not in ('admin', 'directeur', 'comptable', 'chef'):
             return redirect(reverse('core:dashboard'))
         
-        factures = Facture.objects.select_related('client').all().order_by('-created_at')
-        # Calculer le montant total des factures pour l'affichage (évite d'utiliser des filtres personnalisés en template)
+        # Filtres, recherche et pagination par curseur (created_at, id) côté serveur
+        resource = api.FACTURE_LIST
         try:
-            montant_total = factures.aggregate(total=models.Sum('total'))['total'] or 0
-        except Exception:
-            # fallback si l'aggregation échoue
-            montant_total = sum([getattr(f, 'total', 0) or 0 for f in factures])
+            filtered = resource.apply_filters(request, Facture.objects.all())
+            factures, next_cursor = resource.paginate(request, filtered.select_related('client'), [])
+        except api.ApiError as e:
+            messages.error(request, str(e))
+            return redirect(reverse('core:factures'))
+
+        # Nombre et montant cumulé calculés sur l'ensemble filtré (pas seulement la page)
+        stats = filtered.aggregate(nb=models.Count('id'), montant=models.Sum('total'))
+
+        params = request.GET.copy()
+        params.pop('cursor', None)
+        first_page_url = f"?{params.urlencode()}" if request.GET.get('cursor') else None
+        export_pdf_url = f"{reverse('core:factures_pdf_zip')}?{params.urlencode()}"
+        next_page_url = None
+        if next_cursor:
+            params['cursor'] = next_cursor
+            next_page_url = f"?{params.urlencode()}"
 
         today = timezone.now().date()
-        return render(request, 'core/facture_list.html', {'factures': factures, 'montant_total': montant_total, 'today': today})
+        return render(request, 'core/facture_list.html', {
+            'factures': factures,
+            'factures_count': stats['nb'],
+            'montant_total': stats['montant'] or 0,
+            'today': today,
+            'next_page_url': next_page_url,
+            'first_page_url': first_page_url,
+            'export_pdf_url': export_pdf_url,
+            'filters': request.GET,
+            'statuts': Facture._meta.get_field('statut').choices,
+            'clients': Client.objects.order_by('nom').only('id', 'nom'),
+            'chantiers': Chantier.objects.order_by('nom').only('id', 'nom'),
+        })
 
 
 @method_decorator(login_required, name='dispatch')
@@ -636,10 +646,11 @@ class FactureDetailView(View):
                 reference=form.cleaned_data.get('reference',''),
                 created_by=request.user
             )
+            facture.refresh_from_db(fields=['montant_paye', 'reste_a_payer'])
             # mettre à jour le statut si payé
             if facture.reste_a_payer <= 0:
                 facture.statut = 'payee'
-                facture.save()
+                facture.save(update_fields=['statut', 'updated_at'])
         return redirect(reverse('core:facture_detail', args=[pk]))
 
 
@@ -649,42 +660,86 @@ def facture_pdf(request, pk):
     if not profile or profile.role not in ('admin', 'directeur', 'comptable', 'gerant', 'chef'):
         return redirect(reverse('core:dashboard'))
 
-    facture = get_object_or_404(Facture, pk=pk)
-    payments = facture.payments.order_by('-date') if hasattr(facture, 'payments') else []
+    facture = get_object_or_404(Facture.objects.select_related('client', 'chantier__chef_chantier'), pk=pk)
 
-    context = {
-        'facture': facture,
-        'payments': payments,
-        'payment_form': PaymentForm(),
-        'printable': True,
-    }
+    if not pdf.available():
+        return HttpResponse('PDF generation library not installed. Please install xhtml2pdf.', status=500)
+
+    try:
+        path = pdf.facture_pdf_path(facture, pdf.hides_amounts(request.user))
+    except pdf.PdfPending:
+        response = HttpResponse('Génération du PDF en cours, réessayez dans quelques secondes.', status=202)
+        response['Retry-After'] = '5'
+        return response
+    except pdf.PdfError:
+        return HttpResponse('Erreur lors de la génération du PDF', status=500)
 
-    html = render_to_string('core/facture_detail.html', context, request=request)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=f"facture-{facture.numero}.pdf", content_type='application/pdf')
+
+
+@login_required
+def factures_pdf_zip(request):
+    """Export par lot : PDF des factures filtrées, dans une archive ZIP en flux.
 
-    if pisa is None:
+    Filtres : `month` (YYYY-MM), `client`, `chantier`, `statut` (et ceux de la
+    liste des factures). Les PDF sont rendus en parallèle dans le pool de
+    `core.pdf` et ajoutés à l'archive au fur et à mesure.
+    """
+    profile = getattr(request.user, 'userprofile', None)
+    if not profile or profile.role not in ('admin', 'directeur', 'comptable'):
+        return redirect(reverse('core:dashboard'))
+
+    if not pdf.available():
         return HttpResponse('PDF generation library not installed. Please install xhtml2pdf.', status=500)
 
-    result = BytesIO()
-
-    def link_callback(uri, rel):
-        # Resolve static and media URIs to filesystem paths for xhtml2pdf
-        if uri.startswith(settings.STATIC_URL):
-            path = finders.find(uri.replace(settings.STATIC_URL, ''))
-            if path:
-                return path
-        if uri.startswith(settings.MEDIA_URL):
-            media_path = uri.replace(settings.MEDIA_URL, '')
-            return os.path.join(settings.MEDIA_ROOT, media_path)
-        return uri
-
-    pdf = pisa.CreatePDF(src=html, dest=result, link_callback=link_callback)
-    if pdf.err:
-        return HttpResponse('Erreur lors de la génération du PDF', status=500)
+    month = request.GET.get('month')
+    try:
+        factures = api.FACTURE_LIST.apply_filters(request, Facture.objects.select_related('client', 'chantier__chef_chantier'))
+        if month:
+            first_day, last_day = month_bounds(month)
+            factures = factures.filter(date__gte=first_day, date__lte=last_day)
+    except (api.ApiError, ValueError) as e:
+        messages.error(request, str(e) if isinstance(e, api.ApiError) else 'Mois invalide (format attendu : AAAA-MM).')
+        return redirect(reverse('core:factures'))
+
+    def entries():
+        errors = []
+        for facture, result in pdf.iter_pdfs(factures.order_by('date', 'pk').iterator()):
+            name = f"facture-{facture.numero or facture.pk}.pdf"
+            if isinstance(result, pdf.PdfError):
+                errors.append(f"{name} : {result}")
+                continue
+            yield name, result
+        if errors:
+            yield 'erreurs.txt', '\n'.join(errors).encode()
 
-    response = HttpResponse(result.getvalue(), content_type='application/pdf')
-    filename = f"facture-{facture.numero}.pdf"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
+    return streaming_zip_response(f"factures-{month or timezone.localdate().isoformat()}.zip", entries())
+
+
+@login_required
+def payments_import(request):
+    """Import d'un relevé bancaire : paiements créés pour les factures rapprochées."""
+    profile = getattr(request.user, 'userprofile', None)
+    if not profile or profile.role not in ('admin', 'comptable'):
+        return redirect(reverse('core:dashboard'))
+
+    report = None
+    if request.method == 'POST':
+        form = ReleveImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['fichier']
+            stream = io.TextIOWrapper(upload.file, encoding=form.cleaned_data['encodage'], errors='replace', newline='')
+            try:
+                lines = parse_statement(stream, form.cleaned_data['format'], upload.name)
+                report = import_statement(lines, user=request.user, dry_run=form.cleaned_data['simulation'])
+            except StatementError as e:
+                form.add_error('fichier', f'Relevé rejeté, aucun paiement enregistré : {e}')
+            else:
+                if not report.dry_run:
+                    messages.success(request, f"{report.created} paiement(s) importé(s) ({report.factures_payees} facture(s) soldée(s)).")
+    else:
+        form = ReleveImportForm()
+    return render(request, 'core/payments_import.html', {'form': form, 'report': report})
 
 
 @method_decorator(login_required, name='dispatch')
@@ -709,50 +764,29 @@ class FactureUpdateView(View):
         data = request.POST.copy()
         form = FactureForm(data, instance=facture)
         if form.is_valid():
-            facture = form.save()
-            # Replace lines if provided
+            # Replace lines if provided (validées avant toute écriture)
+            lines = None
             lines_json = data.get('lines_json')
-            if lines_json:
-                try:
-                    FactureLine.objects.filter(facture=facture).delete()
-                    lines = json.loads(lines_json)
-                    for ln in lines:
-                        desc = ln.get('description') or ''
-                        quantite = float(ln.get('quantite') or 0)
-                        pu = float(ln.get('pu') or ln.get('prix_unitaire') or 0)
-                        montant = float(ln.get('total') or (quantite * pu))
-                        FactureLine.objects.create(
-                            facture=facture,
-                            description=desc,
-                            quantite=int(quantite),
-                            prix_unitaire=pu,
-                            montant=montant
-                        )
-                except Exception:
-                    pass
-
-            # Recalculate totals
             try:
-                agg = FactureLine.objects.filter(facture=facture).aggregate(subtotal=models.Sum('montant'))
-                subtotal = agg['subtotal'] or 0
-                facture.subtotal = subtotal
+                if lines_json:
+                    lines = parse_lines(lines_json)
+            except FactureLinesError as e:
+                form.add_error(None, str(e))
+            else:
+                # facture, totaux et lignes en une seule transaction
+                facture = save_facture(form, lines)
+
+                # log
                 try:
-                    tva_pct = float(getattr(facture, 'tva_pct') or 0)
+                    FactureActionLog.objects.create(facture=facture, action='partial_payment' if facture.reste_a_payer>0 else 'mark_paid', user=request.user, note='Modifiée depuis la liste')
                 except Exception:
-                    tva_pct = 0
-                facture.tva_amount = (subtotal * tva_pct) / 100
-                facture.total = subtotal + facture.tva_amount
-                facture.save()
-            except Exception:
-                pass
+                    pass
 
-            # log
-            try:
-                FactureActionLog.objects.create(facture=facture, action='partial_payment' if facture.reste_a_payer>0 else 'mark_paid', user=request.user, note='Modifiée depuis la liste')
-            except Exception:
-                pass
+                return redirect(reverse('core:factures'))
 
-            return redirect(reverse('core:factures'))
+        clients = Client.objects.all().order_by('nom')
+        chantiers = Chantier.objects.all().order_by('nom')
+        return render(request, 'core/facture_form.html', {'form': form, 'clients': clients, 'chantiers': chantiers, 'is_update': True, 'facture': facture})
 
 
 @login_required
@@ -793,14 +827,15 @@ def facture_mark_paid(request, pk):
             reference='Marqué comme payé (liste)',
             created_by=request.user
         )
+        facture.refresh_from_db(fields=['montant_paye', 'reste_a_payer'])
     # Mettre à jour le statut
     try:
         if facture.reste_a_payer <= 0:
             facture.statut = 'payee'
-            facture.save()
+            facture.save(update_fields=['statut', 'updated_at'])
     except Exception:
         facture.statut = 'payee'
-        facture.save()
+        facture.save(update_fields=['statut', 'updated_at'])
 
     return redirect(reverse('core:factures'))
 
@@ -816,7 +851,7 @@ def facture_mark_annulee(request, pk):
 
     facture = get_object_or_404(Facture, pk=pk)
     facture.statut = 'annulee'
-    facture.save()
+    facture.save(update_fields=['statut', 'updated_at'])
     # log action
     try:
         FactureActionLog.objects.create(
@@ -842,7 +877,7 @@ def facture_reopen(request, pk):
 
     facture = get_object_or_404(Facture, pk=pk)
     facture.statut = 'envoyee'
-    facture.save()
+    facture.save(update_fields=['statut', 'updated_at'])
     # log action
     try:
         FactureActionLog.objects.create(
@@ -883,52 +918,27 @@ class FactureCreateView(View):
             data['client'] = str(client_obj.id)
 
         form = FactureForm(data)
+        is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.META.get('HTTP_X_REQUESTED_WITH') == 'XMLHttpRequest'
         if form.is_valid():
-            facture = form.save()
-
-            # Process optional lines JSON (sent by frontend)
+            # Process optional lines JSON (sent by frontend), validées avant toute écriture
+            lines = []
             lines_json = data.get('lines_json')
-            if lines_json:
-                try:
-                    lines = json.loads(lines_json)
-                    for ln in lines:
-                        desc = ln.get('description') or ''
-                        quantite = float(ln.get('quantite') or 0)
-                        pu = float(ln.get('pu') or ln.get('prix_unitaire') or 0)
-                        montant = float(ln.get('total') or (quantite * pu))
-                        FactureLine.objects.create(
-                            facture=facture,
-                            description=desc,
-                            quantite=int(quantite),
-                            prix_unitaire=pu,
-                            montant=montant
-                        )
-                except Exception:
-                    # ignore malformed lines, continue saving facture
-                    pass
-
-            # Recalculer les totaux de la facture à partir des lignes (subtotal, tva_amount, total)
             try:
-                agg = FactureLine.objects.filter(facture=facture).aggregate(subtotal=models.Sum('montant'))
-                subtotal = agg['subtotal'] or 0
-                facture.subtotal = subtotal
-                # tva_pct peut être vide/0
-                try:
-                    tva_pct = float(getattr(facture, 'tva_pct') or 0)
-                except Exception:
-                    tva_pct = 0
-                facture.tva_amount = (subtotal * tva_pct) / 100
-                facture.total = subtotal + facture.tva_amount
-                facture.save()
-            except Exception:
-                # si le recalcul échoue, ne pas bloquer la création
-                pass
+                if lines_json:
+                    lines = parse_lines(lines_json)
+            except FactureLinesError as e:
+                if is_ajax:
+                    return JsonResponse({'success': False, 'error': str(e)}, status=400)
+                form.add_error(None, str(e))
+            else:
+                # Facture, totaux (subtotal, tva_amount, total) et lignes en une seule transaction
+                save_facture(form, lines)
 
-            # If AJAX (fetch) request, respond with JSON else redirect
-            if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.META.get('HTTP_X_REQUESTED_WITH') == 'XMLHttpRequest':
-                return JsonResponse({'success': True, 'redirect': reverse('core:factures')})
+                # If AJAX (fetch) request, respond with JSON else redirect
+                if is_ajax:
+                    return JsonResponse({'success': True, 'redirect': reverse('core:factures')})
 
-            return redirect(reverse('core:factures'))
+                return redirect(reverse('core:factures'))
 
         clients = Client.objects.all().order_by('nom')
         chantiers = Chantier.objects.all().order_by('nom')
@@ -1068,40 +1078,20 @@ def get_current_user(request):
 
 
 # API endpoints pour les nouveaux modèles
+# (pagination, filtres, tri et champs partagés : voir core/api.py)
 @login_required
+@api.conditional(Chantier, Client)
 def api_chantiers(request):
     """API endpoint pour récupérer la liste des chantiers"""
-    chantiers = Chantier.objects.select_related('client', 'chef_chantier').all()
-    data = []
-    for chantier in chantiers:
-        data.append({
-            'id': chantier.id,
-            'nom': chantier.nom,
-            'client': {
-                'id': chantier.client.id,
-                'nom': chantier.client.nom
-            },
-            'description': chantier.description,
-            'date_debut': chantier.date_debut.isoformat(),
-            'date_fin_prevue': chantier.date_fin_prevue.isoformat(),
-            'date_fin_reelle': chantier.date_fin_reelle.isoformat() if chantier.date_fin_reelle else None,
-            'budget': float(chantier.budget),
-            'statut': chantier.statut,
-            'statut_display': chantier.get_statut_display(),
-            'avancement': chantier.avancement,
-            'chef_chantier': {
-                'id': chantier.chef_chantier.id,
-                'nom': chantier.chef_chantier.get_full_name()
-            } if chantier.chef_chantier else None,
-            'created_at': chantier.created_at.isoformat(),
-        })
-    return JsonResponse({'chantiers': data})
+    chantiers = Chantier.objects.select_related('client', 'chef_chantier')
+    return api.api_list_response(request, api.CHANTIERS, chantiers)
 
 
 @login_required
+@api.conditional(Personnel, Chantier)
 def api_personnel(request):
     """API endpoint pour récupérer la liste du personnel"""
-    personnel = Personnel.objects.select_related('user', 'chantier_actuel').all()
+    personnel = Personnel.objects.select_related('user', 'chantier_actuel')
     # Si l'utilisateur connecté est un chef de chantier, ne renvoyer
     # que les ouvriers (il ne doit pas voir les autres rôles).
     user_role = None
@@ -1113,217 +1103,273 @@ def api_personnel(request):
         user_role = None
     if user_role == 'chef':
         personnel = personnel.filter(role='ouvrier')
-    data = []
-    for personne in personnel:
-        data.append({
-            'id': personne.id,
-            'user': {
-                'id': personne.user.id,
-                'username': personne.user.username,
-                'full_name': personne.user.get_full_name(),
-                'email': personne.user.email,
-            },
-            'role': personne.role,
-            'role_display': personne.get_role_display(),
-            'taux_horaire': float(personne.taux_journalier) if getattr(personne, 'taux_journalier', None) is not None else None,
-            'telephone': personne.telephone,
-            'adresse': personne.adresse,
-            'date_embauche': personne.date_embauche.isoformat(),
-            'chantier_actuel': {
-                'id': personne.chantier_actuel.id,
-                'nom': personne.chantier_actuel.nom
-            } if personne.chantier_actuel else None,
-            'est_actif': personne.est_actif,
-            'created_at': personne.created_at.isoformat(),
-        })
-    return JsonResponse({'personnel': data})
+    return api.api_list_response(request, api.PERSONNEL, personnel)
 
 
 @login_required
+@api.conditional(Materiau, Fournisseur)
 def api_materiaux(request):
     """API endpoint pour récupérer la liste des matériaux"""
-    materiaux = Materiau.objects.select_related('fournisseur').all()
-    data = []
-    for materiau in materiaux:
-        data.append({
-            'id': materiau.id,
-            'nom': materiau.nom,
-            'categorie': materiau.categorie,
-            'categorie_display': materiau.get_categorie_display(),
-            'description': materiau.description,
-            'unite': materiau.unite,
-            'quantite_stock': materiau.quantite_stock,
-            'seuil_minimum': materiau.seuil_minimum,
-            'prix_unitaire': float(materiau.prix_unitaire),
-            'fournisseur': {
-                'id': materiau.fournisseur.id,
-                'nom': materiau.fournisseur.nom
-            } if materiau.fournisseur else None,
-            'est_en_rupture': materiau.est_en_rupture,
-            'created_at': materiau.created_at.isoformat(),
-            'updated_at': materiau.updated_at.isoformat(),
-        })
-    return JsonResponse({'materiaux': data})
+    materiaux = Materiau.objects.select_related('fournisseur')
+    return api.api_list_response(request, api.MATERIAUX, materiaux)
 
 
 @login_required
+@api.conditional(Fournisseur)
 def api_fournisseurs(request):
     """API endpoint pour récupérer la liste des fournisseurs"""
-    fournisseurs = Fournisseur.objects.all()
-    data = []
-    for fournisseur in fournisseurs:
-        data.append({
-            'id': fournisseur.id,
-            'nom': fournisseur.nom,
-            'contact': fournisseur.contact,
-            'telephone': fournisseur.telephone,
-            'email': fournisseur.email,
-            'adresse': fournisseur.adresse,
-            'specialite': fournisseur.specialite,
-            'created_at': fournisseur.created_at.isoformat(),
-        })
-    return JsonResponse({'fournisseurs': data})
+    return api.api_list_response(request, api.FOURNISSEURS, Fournisseur.objects.all())
 
 
 @login_required
+@api.require_role('admin', 'directeur', 'comptable', 'chef')
+@api.conditional(Client)
 def api_clients(request):
     """API endpoint pour récupérer la liste des clients"""
-    profile = getattr(request.user, 'userprofile', None)
-    if not profile or profile.role not in ('admin', 'directeur', 'comptable', 'chef'):
-        return JsonResponse({'error': 'forbidden'}, status=403)
-
-    clients = Client.objects.all()
-    data = []
-    for client in clients:
-        data.append({
-            'id': client.id,
-            'nom': client.nom,
-            'contact': client.contact,
-            'telephone': client.telephone,
-            'email': client.email,
-            'adresse': client.adresse,
-            'created_at': client.created_at.isoformat(),
-        })
-    return JsonResponse({'clients': data})
+    return api.api_list_response(request, api.CLIENTS, Client.objects.all())
 
 
 @login_required
+@api.require_role('admin', 'directeur', 'comptable')
+@api.conditional(Facture, Client)
 def api_factures(request):
     """API endpoint pour récupérer la liste des factures"""
-    profile = getattr(request.user, 'userprofile', None)
-    if not profile or profile.role not in ('admin', 'directeur', 'comptable'):
-        return JsonResponse({'error': 'forbidden'}, status=403)
-
-    factures = Facture.objects.select_related('client').prefetch_related('lignes').all()
-    data = []
-    for facture in factures:
-        lignes_data = []
-        for ligne in facture.lignes.all():
-            lignes_data.append({
-                'id': ligne.id,
-                'description': ligne.description,
-                'quantite': ligne.quantite,
-                'prix_unitaire': float(ligne.prix_unitaire),
-                'montant': float(ligne.montant),
-            })
-
-        data.append({
-            'id': facture.id,
-            'numero': facture.numero,
-            'client': {
-                'id': facture.client.id,
-                'nom': facture.client.nom
-            },
-            'date': facture.date.isoformat(),
-            'date_echeance': facture.date_echeance.isoformat() if facture.date_echeance else None,
-            'total': float(facture.total),
-            'statut': facture.statut,
-            'statut_display': facture.get_statut_display(),
-            'notes': facture.notes,
-            'lignes': lignes_data,
-            'created_at': facture.created_at.isoformat(),
-        })
-    return JsonResponse({'factures': data})
+    return api.api_list_response(request, api.FACTURES, Facture.objects.all())
 
 
 @login_required
+@api.conditional(Rapport, Chantier)
 def api_rapports(request):
     """API endpoint pour récupérer la liste des rapports"""
-    rapports = Rapport.objects.select_related('chantier', 'auteur').all()
-    data = []
-    for rapport in rapports:
-        data.append({
-            'id': rapport.id,
-            'titre': rapport.titre,
-            'type_rapport': rapport.type_rapport,
-            'type_display': rapport.get_type_rapport_display(),
-            'chantier': {
-                'id': rapport.chantier.id,
-                'nom': rapport.chantier.nom
-            } if rapport.chantier else None,
-            'auteur': {
-                'id': rapport.auteur.id,
-                'full_name': rapport.auteur.get_full_name()
-            },
-            'date': rapport.date.isoformat() if rapport.date else None,
-            'contenu': rapport.contenu,
-            'created_at': rapport.created_at.isoformat(),
-        })
-    return JsonResponse({'rapports': data})
+    rapports = Rapport.objects.select_related('chantier', 'auteur')
+    return api.api_list_response(request, api.RAPPORTS, rapports)
 
 
 @login_required
+@api.conditional(*DASHBOARD_MODELS)
 def api_dashboard_stats(request):
     """API endpoint pour récupérer les statistiques du dashboard"""
-    # Statistiques générales
-    total_chantiers = Chantier.objects.count()
-    chantiers_actifs = Chantier.objects.filter(statut='en_cours').count()
-    chantiers_termines = Chantier.objects.filter(statut='termine').count()
+    return JsonResponse(get_dashboard_metrics().as_api())
 
-    total_personnel = Personnel.objects.filter(est_actif=True).count()
-    total_materiaux = Materiau.objects.count()
-    materiaux_rupture = Materiau.objects.filter(quantite_stock__lte=models.F('seuil_minimum')).count()
 
-    total_clients = Client.objects.count()
-    total_fournisseurs = Fournisseur.objects.count()
+def _aging_params(request):
+    group = request.GET.get('group')
+    if group not in GROUPS:
+        group = 'client'
+    try:
+        as_of = datetime.date.fromisoformat(request.GET.get('as_of') or '')
+    except ValueError:
+        as_of = timezone.localdate()
+    return group, as_of
 
-    # Factures du mois en cours
-    now = timezone.now()
-    debut_mois = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    factures_mois = Facture.objects.filter(date__gte=debut_mois)
-    montant_factures_mois = factures_mois.aggregate(total=models.Sum('total'))['total'] or 0
 
-    # Budget total des chantiers actifs
-    budget_total = Chantier.objects.filter(statut__in=['planifie', 'en_cours']).aggregate(
-        total=models.Sum('budget')
-    )['total'] or 0
+@login_required
+@user_passes_test(lambda u: getattr(getattr(u, 'userprofile', None), 'role', None) in ('comptable', 'admin', 'directeur') or u.is_superuser)
+def receivables_aging(request):
+    """Balance âgée des créances, par client ou par chantier (HTML ou CSV)."""
+    group, as_of = _aging_params(request)
 
-    return JsonResponse({
-        'chantiers': {
-            'total': total_chantiers,
-            'actifs': chantiers_actifs,
-            'termines': chantiers_termines,
-        },
-        'personnel': {
-            'total': total_personnel,
-        },
-        'materiaux': {
-            'total': total_materiaux,
-            'en_rupture': materiaux_rupture,
-        },
-        'clients': {
-            'total': total_clients,
-        },
-        'fournisseurs': {
-            'total': total_fournisseurs,
-        },
-        'finances': {
-            'budget_total': float(budget_total),
-            'factures_mois': float(montant_factures_mois),
-        }
+    if request.GET.get('export') == 'csv':
+        return streaming_csv_response(
+            f'balance_agee_{group}_{as_of.isoformat()}.csv',
+            aging_csv_header(group),
+            aging_csv_rows(group, as_of),
+        )
+
+    rows = list(aging_rows(group, as_of))
+    totals = aging_totals(rows)
+    # tranches en liste, dans l'ordre des colonnes du gabarit
+    for row in rows + [totals]:
+        row['tranches'] = [row[key] for key, *_ in BUCKETS]
+    return render(request, 'core/receivables_aging.html', {
+        'rows': rows,
+        'totals': totals,
+        'buckets': [{'key': key, 'label': label} for key, label, *_ in BUCKETS],
+        'filters': {'group': group, 'as_of': as_of.isoformat()},
+    })
+
+
+@login_required
+@api.require_role('admin', 'directeur', 'comptable')
+@api.conditional(Facture, Payment, Client, Chantier)
+def api_receivables_aging(request):
+    """API endpoint : balance âgée des créances (mêmes paramètres que la page)"""
+    group, as_of = _aging_params(request)
+    rows = list(aging_rows(group, as_of))
+    totals = aging_totals(rows)
+    amounts = ['du'] + [key for key, *_ in BUCKETS]
+    return api.json_response({
+        'group': group,
+        'as_of': as_of.isoformat(),
+        'buckets': [{'key': key, 'label': label} for key, label, *_ in BUCKETS],
+        'rows': [{'id': row['id'], 'nom': row['nom'], 'nb': row['nb'], **{k: api.number(row[k]) for k in amounts}} for row in rows],
+        'totals': {'nb': totals['nb'], **{k: api.number(totals[k]) for k in amounts}},
+    })
+
+
+def _json_payload(request):
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        raise api.ApiError('JSON invalide')
+    if not isinstance(payload, dict):
+        raise api.ApiError('Objet JSON attendu')
+    return payload
+
+
+def _roll_call_chantier(request, chantier_id):
+    """Chantier de l'appel, si l'utilisateur peut y saisir les présences."""
+    profile = getattr(request.user, 'userprofile', None)
+    if not profile or profile.role not in ('chef', 'admin', 'directeur'):
+        raise api.ApiError('forbidden', status=403)
+    chantier = Chantier.objects.select_related('chef_chantier_employee').filter(pk=api.parse_int(chantier_id)).first()
+    if chantier is None:
+        raise api.ApiError('Chantier introuvable', status=404)
+    if profile.role == 'chef':
+        chef_user_ids = (chantier.chef_chantier_id, getattr(chantier.chef_chantier_employee, 'user_id', None))
+        if request.user.pk not in chef_user_ids:
+            raise api.ApiError('forbidden', status=403)
+    return chantier
+
+
+@login_required
+def api_presences(request):
+    """Appel du jour d'un chantier.
+
+    GET ?chantier=<id>&date=AAAA-MM-JJ : équipe affectée et statuts saisis.
+    POST {"chantier": id, "date": "AAAA-MM-JJ", "presences": [{"employee": id, "statut": "PRESENT"}, ...]} :
+    enregistre tout l'appel en une fois (les statuts déjà saisis sont remplacés).
+    """
+    try:
+        if request.method == 'POST':
+            payload = _json_payload(request)
+            chantier = _roll_call_chantier(request, payload.get('chantier'))
+            date = api.parse_date(payload['date']) if payload.get('date') else timezone.localdate()
+            valide_par = getattr(request.user, 'employee', None)
+            count = record_roll_call(chantier, date, parse_entries(payload.get('presences')), valide_par=valide_par)
+            return api.json_response({'ok': True, 'chantier': chantier.pk, 'date': date.isoformat(), 'count': count})
+        if request.method != 'GET':
+            raise api.ApiError('Method not allowed', status=405)
+        chantier = _roll_call_chantier(request, request.GET.get('chantier'))
+        date = api.parse_date(request.GET['date']) if request.GET.get('date') else timezone.localdate()
+    except RollCallError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except api.ApiError as e:
+        return JsonResponse({'error': e.message}, status=e.status)
+
+    return api.json_response({
+        'chantier': chantier.pk,
+        'date': date.isoformat(),
+        'presences': [
+            {'employee': employee.pk, 'nom': f"{employee.prenom} {employee.nom}", 'role': employee.role, 'statut': statut}
+            for employee, statut in roll_call(chantier, date)
+        ],
     })
 
 
+@login_required
+@require_POST
+def api_stock_reception(request):
+    """POST {"commandes": [id, ...]} : réceptionne les commandes en cours en une fois.
+
+    Les commandes déjà reçues ou annulées sont ignorées.
+    """
+    try:
+        profile = getattr(request.user, 'userprofile', None)
+        if not profile or profile.role not in ('admin', 'directeur', 'chef', 'comptable'):
+            raise api.ApiError('forbidden', status=403)
+        ids = _json_payload(request).get('commandes')
+        if not isinstance(ids, list) or not ids:
+            raise api.ApiError('Liste de commandes vide')
+        try:
+            ids = [int(pk) for pk in ids]
+        except (TypeError, ValueError):
+            raise api.ApiError('Identifiants de commande entiers attendus')
+        movements = receive_commandes(ids, user=request.user)
+    except StockError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except api.ApiError as e:
+        return JsonResponse({'error': e.message}, status=e.status)
+    return api.json_response({'ok': True, 'count': len(movements), 'commandes': [m.commande_id for m in movements]})
+
+
+@login_required
+@require_POST
+def api_stock_consommation(request):
+    """POST {"chantier": id, "date": "AAAA-MM-JJ", "lignes": [{"materiau": id, "quantite": n}, ...]} :
+    sorties de stock vers un chantier, refusées en bloc si un stock est insuffisant.
+    """
+    try:
+        payload = _json_payload(request)
+        # mêmes droits que l'appel : le chef ne sort du stock que pour son chantier
+        chantier = _roll_call_chantier(request, payload.get('chantier'))
+        date = api.parse_date(payload['date']) if payload.get('date') else timezone.localdate()
+        movements = consume(chantier, parse_quantites(payload.get('lignes')), user=request.user, date=date)
+    except StockError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except api.ApiError as e:
+        return JsonResponse({'error': e.message}, status=e.status)
+    return api.json_response({'ok': True, 'chantier': chantier.pk, 'date': date.isoformat(), 'count': len(movements)})
+
+
+def _cost_chantier_param(request):
+    try:
+        return int(request.GET.get('chantier') or 0) or None
+    except ValueError:
+        return None
+
+
+@login_required
+@user_passes_test(lambda u: getattr(getattr(u, 'userprofile', None), 'role', None) in ('comptable', 'admin', 'directeur') or u.is_superuser)
+def chantier_costs(request):
+    """Coûts réels des chantiers face à leur budget, lus dans le livre mensuel."""
+    chantier_id = _cost_chantier_param(request)
+    rows = ledger.chantier_totals(chantier_id)
+    months = ledger.chantier_months(chantier_id) if chantier_id and rows else None
+    return render(request, 'core/chantier_costs.html', {
+        'rows': rows,
+        'months': months,
+        'selected': rows[0]['chantier'] if months is not None else None,
+    })
+
+
+@login_required
+@api.require_role('admin', 'directeur', 'comptable')
+@api.conditional(ChantierCostMonth, Chantier)
+def api_chantier_costs(request):
+    """API endpoint : coûts par chantier (?chantier=<id> ajoute le détail mensuel)"""
+    raw = request.GET.get('chantier')
+    try:
+        chantier_id = (api.parse_int(raw) if raw else 0) or None
+    except api.ApiError as e:
+        return JsonResponse({'error': e.message}, status=e.status)
+    amounts = ('budget', 'main_oeuvre', 'materiaux', 'cout', 'facture', 'ecart')
+    data = {
+        'chantiers': [
+            {
+                'id': row['chantier'].pk,
+                'nom': row['chantier'].nom,
+                'jours_homme': row['jours_homme'],
+                'consomme_pct': row['consomme_pct'],
+                **{key: api.number(row[key]) for key in amounts},
+            }
+            for row in ledger.chantier_totals(chantier_id)
+        ],
+    }
+    if chantier_id:
+        data['mois'] = [
+            {
+                'periode': month.periode,
+                'main_oeuvre': api.number(month.main_oeuvre),
+                'jours_homme': month.jours_homme,
+                'materiaux': api.number(month.materiaux),
+                'facture': api.number(month.facture),
+            }
+            for month in ledger.chantier_months(chantier_id)
+        ]
+    return api.json_response(data)
+
+
 # Page pour gérer / visualiser les rapports
 @login_required
 def rapports_view(request):
@@ -1808,16 +1854,19 @@ class MateriauCreateView(View):
         if not profile or profile.role not in ('admin', 'directeur', 'chef', 'comptable'):
             return redirect(reverse('core:dashboard'))
         try:
-            materiau = Materiau.objects.create(
-                nom=request.POST['nom'],
-                categorie=request.POST['categorie'],
-                description=request.POST.get('description', ''),
-                unite=request.POST.get('unite', 'unités'),
-                quantite_stock=request.POST.get('quantite_stock', 0),
-                seuil_minimum=request.POST.get('seuil_minimum', 0),
-                prix_unitaire=request.POST['prix_unitaire'],
-                fournisseur_id=request.POST.get('fournisseur') or None
-            )
+            with transaction.atomic():
+                materiau = Materiau.objects.create(
+                    nom=request.POST['nom'],
+                    categorie=request.POST['categorie'],
+                    description=request.POST.get('description', ''),
+                    unite=request.POST.get('unite', 'unités'),
+                    quantite_stock=0,
+                    seuil_minimum=request.POST.get('seuil_minimum', 0),
+                    prix_unitaire=request.POST['prix_unitaire'],
+                    fournisseur_id=request.POST.get('fournisseur') or None
+                )
+                # stock initial enregistré comme un mouvement
+                adjust_stock(materiau, int(request.POST.get('quantite_stock') or 0), user=request.user, note='Stock initial')
             messages.success(request, f'Matériau "{materiau.nom}" ajouté avec succès.')
             return redirect(reverse('core:materiaux'))
         except Exception as e:
@@ -1848,11 +1897,19 @@ class MateriauUpdateView(View):
             materiau.categorie = request.POST['categorie']
             materiau.description = request.POST.get('description', '')
             materiau.unite = request.POST.get('unite', materiau.unite)
-            materiau.quantite_stock = request.POST.get('quantite_stock', materiau.quantite_stock)
             materiau.seuil_minimum = request.POST.get('seuil_minimum', materiau.seuil_minimum)
             materiau.prix_unitaire = request.POST['prix_unitaire']
             materiau.fournisseur_id = request.POST.get('fournisseur') or None
-            materiau.save()
+            with transaction.atomic():
+                # quantite_stock n'est pas réécrit par save() : seule la correction
+                # saisie (quantité postée - quantité affichée) devient un ajustement,
+                # si bien qu'une réception ou une sortie faite pendant l'édition
+                # est conservée (voir core.stock)
+                materiau.save(update_fields=['nom', 'categorie', 'description', 'unite', 'seuil_minimum', 'prix_unitaire', 'fournisseur', 'updated_at'])
+                quantite = request.POST.get('quantite_stock')
+                initiale = request.POST.get('quantite_stock_initiale')
+                if quantite not in (None, '') and initiale not in (None, ''):
+                    correct_stock(materiau, int(quantite) - int(initiale), user=request.user)
             messages.success(request, f'Matériau "{materiau.nom}" mis à jour avec succès.')
             return redirect(reverse('core:materiaux'))
         except Exception as e:
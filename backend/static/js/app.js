@@ -345,6 +345,41 @@ class DataManager {
         return await this.fetchFromAPI('/api/dashboard/', null);
     }
 
+    static async fetchJSON(url) {
+        const response = await fetch(url, {
+            method: 'GET',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-Requested-With': 'XMLHttpRequest'
+            },
+            credentials: 'same-origin'
+        });
+
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        return await response.json();
+    }
+
+    // Les listes de l'API sont paginées : suivre le curseur `next` jusqu'au
+    // bout pour que listes et compteurs portent sur toutes les lignes
+    static async fetchAllPages(endpoint, key) {
+        const data = await this.fetchJSON(endpoint);
+        if (!key || !Array.isArray(data[key])) {
+            return data;
+        }
+        const sep = endpoint.includes('?') ? '&' : '?';
+        let next = data.next;
+        while (next) {
+            const page = await this.fetchJSON(`${endpoint}${sep}limit=1000&cursor=${encodeURIComponent(next)}`);
+            data[key] = data[key].concat(page[key] || []);
+            next = page.next;
+        }
+        data.next = null;
+        return data;
+    }
+
     // Méthode générique pour récupérer des données depuis l'API
     static async fetchFromAPI(endpoint, cacheKey) {
         const now = Date.now();
@@ -356,20 +391,7 @@ class DataManager {
         }
 
         try {
-            const response = await fetch(endpoint, {
-                method: 'GET',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-Requested-With': 'XMLHttpRequest'
-                },
-                credentials: 'same-origin'
-            });
-
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-
-            const data = await response.json();
+            const data = await this.fetchAllPages(endpoint, cacheKey);
 
             // Transformer les données selon le cacheKey
             let transformedData = [];